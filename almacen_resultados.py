@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+# Almacén en disco de resultados de barridos grandes (millones de escenarios).
+#
+# Un directorio con un índice JSON pequeño y un archivo binario de ancho fijo
+# por columna, leídos con np.memmap:
+#
+#   indice.json          versión, horizonte, filas, capacidad, columnas, dtypes
+#   nombres.bin          (capacidad,) S{ANCHO_NOMBRE}   nombre del escenario (UTF-8)
+#   parametros.bin       (capacidad, P) <f8             insumos resueltos (Parametros, bases, f_*)
+#   kpis.bin             (capacidad, 4) <f8             VAN, TIR, Payback, PI
+#   serie_<columna>.bin  (capacidad, H+1)               columnas anuales de Flujo_Base
+#
+# `agregar` escribe por bloques: si no cabe, los archivos crecen (al doble)
+# con truncate y se vuelven a mapear; el número de filas del índice se
+# actualiza (reemplazo atómico) sólo después de escribir los datos, así que
+# un lector nunca ve filas a medio escribir. Las lecturas son vistas sobre el
+# memmap (sin copia); `filtrar` recorre las columnas por bloques y
+# `exportar_libro` escribe los escenarios elegidos en la hoja KPIs_Escenarios
+# (o `variantes` los prepara para lote_libros como libros completos).
+#
+# Uso: python almacen_resultados.py DIR [--mc N | --barrido CSV] [--filtro "tir>WACC,van>0"]
+#                                       [--exportar libro.xlsx] [--libros DIR] [--limite N]
+
+import argparse
+import json
+import os
+import re
+import sys
+
+import numpy as np
+
+import motor_flujo as mf
+
+VERSION_FORMATO = 1
+ANCHO_NOMBRE = 48
+CAPACIDAD_INICIAL = 4096
+FILAS_POR_BLOQUE = 65_536   # filas por bloque en filtrar / agregar desde el CLI
+SERIES = [c for c in mf.COLUMNAS_FLUJO if c not in ("anio", "factor")]
+KPIS = ["van", "tir", "payback", "pi"]
+LIMITE_EXPORTAR = 5_000     # filas máximas de KPIs_Escenarios en `exportar_libro`
+
+_CONDICION = re.compile(r"^\s*([A-Za-z_]\w*)\s*(<=|>=|==|!=|<|>)\s*([A-Za-z_]\w*|[-+]?[\d.]+(?:[eE][-+]?\d+)?)\s*$")
+_OPERADORES = {"<": np.less, "<=": np.less_equal, ">": np.greater, ">=": np.greater_equal,
+               "==": np.equal, "!=": np.not_equal}
+
+
+def kpis_lote(p, res):
+    """VAN / TIR / Payback / PI (n, 4) de un resultado de motor_flujo.flujo_base"""
+    return np.column_stack([res["van_acum"][:, -1], mf.tir(res["flujo"]), mf.payback(res["van_acum"]),
+                            mf.indice_rentabilidad(res["flujo"], p["WACC"])])
+
+
+class AlmacenResultados:
+    """Almacén de escenarios (parámetros, series anuales de Flujo_Base y KPIs) sobre memmap"""
+
+    def __init__(self, ruta, escritura=False):
+        self.ruta = ruta
+        self.escritura = escritura
+        with open(os.path.join(ruta, "indice.json"), encoding="utf-8") as fh:
+            self.indice = json.load(fh)
+        if self.indice["version"] > VERSION_FORMATO:
+            raise ValueError(f"Versión de almacén {self.indice['version']} no soportada")
+        self._mapear()
+
+    @classmethod
+    def crear(cls, ruta, horizonte, series=None, dtype_series="<f8", capacidad=CAPACIDAD_INICIAL):
+        """Crea un almacén vacío en el directorio `ruta` (que no debe contener otro)"""
+        if os.path.exists(os.path.join(ruta, "indice.json")):
+            raise FileExistsError(f"Ya existe un almacén en {ruta}")
+        series = list(series or SERIES)
+        desconocidas = set(series) - set(mf.COLUMNAS_FLUJO)
+        if desconocidas:
+            raise ValueError(f"Columnas de Flujo_Base desconocidas: {sorted(desconocidas)}")
+        os.makedirs(ruta, exist_ok=True)
+        indice = {"version": VERSION_FORMATO, "horizonte": int(horizonte), "filas": 0, "capacidad": 0,
+                  "parametros": list(mf.parametros_base()), "kpis": KPIS, "series": series,
+                  "dtype_series": np.dtype(dtype_series).str, "ancho_nombre": ANCHO_NOMBRE}
+        _guardar_indice(ruta, indice)
+        almacen = cls(ruta, escritura=True)
+        almacen._crecer(capacidad)
+        return almacen
+
+    # ---------- archivos ----------
+    def _archivos(self):
+        """{archivo: (dtype, forma de una fila)}"""
+        ind = self.indice
+        archivos = {"nombres.bin": (f"S{ind['ancho_nombre']}", ()),
+                    "parametros.bin": ("<f8", (len(ind["parametros"]),)),
+                    "kpis.bin": ("<f8", (len(ind["kpis"]),))}
+        archivos.update({f"serie_{s}.bin": (ind["dtype_series"], (ind["horizonte"] + 1,))
+                         for s in ind["series"]})
+        return archivos
+
+    def _mapear(self):
+        self._mapas = {}
+        capacidad = self.indice["capacidad"]
+        for archivo, (dtype, forma) in self._archivos().items():
+            ruta = os.path.join(self.ruta, archivo)
+            if capacidad == 0 or not os.path.exists(ruta):
+                self._mapas[archivo] = np.zeros((0,) + forma, dtype=dtype)
+                continue
+            self._mapas[archivo] = np.memmap(ruta, dtype=dtype, mode="r+" if self.escritura else "r",
+                                             shape=(capacidad,) + forma)
+
+    def _crecer(self, minimo):
+        capacidad = max(minimo, 2 * self.indice["capacidad"])
+        for archivo, (dtype, forma) in self._archivos().items():
+            mapa = self._mapas.get(archivo)
+            if isinstance(mapa, np.memmap):
+                mapa.flush()
+            with open(os.path.join(self.ruta, archivo), "ab") as fh:
+                fh.truncate(capacidad * np.dtype(dtype).itemsize * int(np.prod(forma, dtype=int)))
+        self._mapas = {}
+        self.indice["capacidad"] = capacidad
+        _guardar_indice(self.ruta, self.indice)
+        self._mapear()
+
+    # ---------- escritura ----------
+    def agregar(self, p, res, nombres=None):
+        """Agrega un bloque: `p` parámetros resueltos (escalares o (m,)) y `res` de flujo_base.
+
+        Devuelve el rango de filas asignado.
+        """
+        if not self.escritura:
+            raise PermissionError("Almacén abierto sólo para lectura")
+        H = self.indice["horizonte"]
+        m = res["flujo"].shape[0]
+        if res["flujo"].shape[1] != H + 1:
+            raise ValueError(f"Las series deben tener {H + 1} años (horizonte {H})")
+        n = self.indice["filas"]
+        if n + m > self.indice["capacidad"]:
+            self._crecer(n + m)
+        filas = slice(n, n + m)
+        if nombres is None:
+            nombres = [f"E{i + 1}" for i in range(n, n + m)]
+        self._mapas["nombres.bin"][filas] = [str(x).encode("utf-8")[:self.indice["ancho_nombre"]]
+                                             for x in nombres]
+        self._mapas["parametros.bin"][filas] = np.column_stack(
+            [np.broadcast_to(np.asarray(p[k], dtype=float), (m,)) for k in self.indice["parametros"]])
+        self._mapas["kpis.bin"][filas] = kpis_lote(p, res)
+        for s in self.indice["series"]:
+            self._mapas[f"serie_{s}.bin"][filas] = res[s]
+        for mapa in self._mapas.values():
+            mapa.flush()
+        self.indice["filas"] = n + m
+        _guardar_indice(self.ruta, self.indice)
+        return range(n, n + m)
+
+    def agregar_lote(self, cambios, nombres=None):
+        """Evalúa `cambios` (como en motor_flujo.calcular) al horizonte del almacén y los agrega"""
+        H = self.indice["horizonte"]
+        p = mf.resolver_parametros({**cambios, "HORIZONTE": H})
+        return self.agregar(p, mf.flujo_base(p, n_anios=H + 1), nombres)
+
+    # ---------- lectura (vistas sin copia) ----------
+    def __len__(self):
+        return self.indice["filas"]
+
+    @property
+    def horizonte(self):
+        return self.indice["horizonte"]
+
+    def nombres(self, filas=slice(None)):
+        return [x.decode("utf-8", "replace") for x in np.atleast_1d(self._mapas["nombres.bin"][:len(self)][filas])]
+
+    def serie(self, nombre):
+        """Matriz (filas, años) de una columna de Flujo_Base"""
+        if nombre not in self.indice["series"]:
+            raise KeyError(f"Serie no almacenada: {nombre}")
+        return self._mapas[f"serie_{nombre}.bin"][:len(self)]
+
+    def columna(self, nombre):
+        """Vector (filas,) de un KPI o de un parámetro"""
+        if nombre in self.indice["kpis"]:
+            return self._mapas["kpis.bin"][:len(self), self.indice["kpis"].index(nombre)]
+        if nombre in self.indice["parametros"]:
+            return self._mapas["parametros.bin"][:len(self), self.indice["parametros"].index(nombre)]
+        raise KeyError(f"Columna desconocida: {nombre}")
+
+    def parametros_de(self, fila):
+        """{nombre: valor} de los insumos resueltos de una fila"""
+        return dict(zip(self.indice["parametros"], self._mapas["parametros.bin"][fila].tolist()))
+
+    # ---------- consultas ----------
+    def filtrar(self, condiciones, bloque=FILAS_POR_BLOQUE):
+        """Índices de las filas que cumplen todas las condiciones.
+
+        `condiciones`: "tir>WACC,van>0" o lista de (columna, operador, columna | número).
+        Se evalúa por bloques de filas: sólo se leen las columnas involucradas.
+        """
+        if isinstance(condiciones, str):
+            condiciones = [_condicion(c) for c in condiciones.split(",") if c.strip()]
+        operandos = lambda x: self.columna(x) if isinstance(x, str) else x
+        seleccion = []
+        for ini in range(0, len(self), bloque):
+            ok = np.ones(min(bloque, len(self) - ini), dtype=bool)
+            for izq, op, der in condiciones:
+                a, b = operandos(izq), operandos(der)
+                a = a[ini:ini + bloque]
+                b = b[ini:ini + bloque] if isinstance(b, np.ndarray) else b
+                ok &= _OPERADORES[op](a, b)      # NaN no cumple ninguna comparación
+            seleccion.append(ini + np.flatnonzero(ok))
+        return np.concatenate(seleccion) if seleccion else np.zeros(0, dtype=int)
+
+    # ---------- exportación ----------
+    def exportar_libro(self, filas, salida, streaming=True, limite=LIMITE_EXPORTAR):
+        """Escribe las filas elegidas en la hoja KPIs_Escenarios (valores) de un libro nuevo"""
+        from libro_diferido import LibroDiferido
+        from barrido_escenarios import hoja_kpis_escenarios
+
+        filas = np.asarray(filas, dtype=int)[:limite]
+        if filas.size == 0:
+            raise ValueError("No hay escenarios que exportar")
+        parametros = self._mapas["parametros.bin"][filas]
+        # columnas de insumos: las que varían entre los escenarios exportados
+        cambios = {k: parametros[:, j] for j, k in enumerate(self.indice["parametros"])
+                   if k != "HORIZONTE" and np.ptp(parametros[:, j]) > 0}
+        kpis = self._mapas["kpis.bin"][filas]
+        res = {k: kpis[:, j] for j, k in enumerate(self.indice["kpis"])}
+        res["flujo"] = self.serie("flujo")[filas]
+        res["van_acum"] = self.serie("van_acum")[filas]
+        wb = LibroDiferido()
+        wb._hojas.remove(wb.active)
+        hoja_kpis_escenarios(wb, self.nombres(filas), cambios, self.horizonte, res=res)
+        wb.guardar(salida, streaming=streaming)
+        return salida
+
+    def variantes(self, filas):
+        """Variantes de lote_libros (libro completo por escenario) para las filas elegidas"""
+        validos = {n for n, _, _, _ in mf.PARAMETROS} | {n for n, _, _ in mf.BASES}
+        salida = []
+        for fila, nombre in zip(np.atleast_1d(filas), self.nombres(np.atleast_1d(filas))):
+            p = self.parametros_de(int(fila))
+            # ING_*_1 / OPEX_*_1 sólo se fijan si no coinciden con base × multiplicador
+            vinculados = {n for n, base, f in mf.VINCULOS if np.isclose(p[n], p[base] * p[f])}
+            salida.append({"nombre": nombre,
+                           "params": {k: v for k, v in p.items() if k in validos and k not in vinculados},
+                           "escenarios": [[nombre] + [p[f] for f in mf.FACTORES]],
+                           "escenario_activo": nombre, "horizonte": self.horizonte})
+        return salida
+
+
+def _guardar_indice(ruta, indice):
+    tmp = os.path.join(ruta, "indice.json.tmp")
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(indice, fh, ensure_ascii=False, indent=1)
+    os.replace(tmp, os.path.join(ruta, "indice.json"))
+
+
+def _condicion(texto):
+    m = _CONDICION.match(texto)
+    if not m:
+        raise ValueError(f"Condición no válida: {texto!r} (p. ej. 'tir>WACC' o 'van>=0')")
+    izq, op, der = m.groups()
+    return izq, op, der if re.match(r"[A-Za-z_]", der) else float(der)
+
+
+def main(argv=None):
+    from simulacion_montecarlo import DISTRIBUCIONES, muestrear
+    from barrido_escenarios import leer_escenarios
+
+    ap = argparse.ArgumentParser(description="Almacén en disco de resultados de barridos")
+    ap.add_argument("ruta", help="directorio del almacén (se crea si no existe)")
+    ap.add_argument("--horizonte", type=int, default=None, help="horizonte al crear el almacén")
+    ap.add_argument("--float32", action="store_true", help="series en precisión simple al crear")
+    ap.add_argument("--mc", type=int, default=0, help="agrega N escenarios Monte Carlo")
+    ap.add_argument("--semilla", type=int, default=0)
+    ap.add_argument("--barrido", help="agrega los escenarios de un CSV de barrido")
+    ap.add_argument("--filtro", help='condiciones separadas por comas, p. ej. "tir>WACC,van>0"')
+    ap.add_argument("--exportar", help="libro con KPIs_Escenarios de las filas filtradas")
+    ap.add_argument("--libros", help="directorio: un libro completo por fila filtrada (lote_libros)")
+    ap.add_argument("--limite", type=int, default=LIMITE_EXPORTAR, help="filas máximas a exportar")
+    args = ap.parse_args(argv)
+
+    if os.path.exists(os.path.join(args.ruta, "indice.json")):
+        almacen = AlmacenResultados(args.ruta, escritura=bool(args.mc or args.barrido))
+    else:
+        H = args.horizonte or int(mf.parametros_base()["HORIZONTE"])
+        almacen = AlmacenResultados.crear(args.ruta, H, dtype_series="<f4" if args.float32 else "<f8")
+    if args.mc:
+        hijos = np.random.SeedSequence(args.semilla).spawn(-(-args.mc // FILAS_POR_BLOQUE))
+        for i, ss in enumerate(hijos):
+            m = min(FILAS_POR_BLOQUE, args.mc - i * FILAS_POR_BLOQUE)
+            almacen.agregar_lote(muestrear(DISTRIBUCIONES, m, np.random.default_rng(ss)),
+                                 [f"MC{args.semilla}-{i * FILAS_POR_BLOQUE + j + 1}" for j in range(m)])
+    if args.barrido:
+        nombres, cambios = leer_escenarios(args.barrido)
+        for ini in range(0, len(nombres), FILAS_POR_BLOQUE):
+            almacen.agregar_lote({k: v[ini:ini + FILAS_POR_BLOQUE] for k, v in cambios.items()},
+                                 nombres[ini:ini + FILAS_POR_BLOQUE])
+    print(f"{args.ruta}: {len(almacen):,} escenarios, horizonte {almacen.horizonte}")
+
+    if args.filtro or args.exportar or args.libros:
+        filas = almacen.filtrar(args.filtro) if args.filtro else np.arange(len(almacen))
+        print(f"{filas.size:,} escenarios cumplen el filtro")
+        filas = filas[:args.limite]
+        if args.exportar:
+            print(f"OK -> {almacen.exportar_libro(filas, args.exportar)} ({filas.size:,} filas)")
+        if args.libros:
+            from lote_libros import construir_lote
+            resultados = construir_lote(almacen.variantes(filas), args.libros)
+            fallidas = [r for r in resultados if r[3] is not None]
+            print(f"{len(resultados) - len(fallidas)}/{len(resultados)} libros en {args.libros}")
+            return 1 if fallidas else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+# Hoja KPIs_Escenarios genérica: N escenarios × cualquier horizonte.
+#
+# Disposición compacta (escenarios en filas, años en columnas):
+#   1) tabla de KPIs (VAN / TIR / Payback / PI) + columnas de insumos,
+#   2) matriz de flujo neto anual,
+#   3) matriz de VAN acumulado descontado (helper del payback).
+#
+# Con formulas=True cada celda lleva su fórmula (modo de los 3 escenarios de
+# Escenarios_v4) y se devuelven los valores del motor para la caché; con
+# formulas=False (barrido) se escriben directamente los valores precalculados
+# por motor_flujo en un solo lote, sin miles de fórmulas largas.
+
+import csv
+
+import numpy as np
+from openpyxl.chart import BarChart, Reference
+from openpyxl.styles import Font, Border, Side
+from openpyxl.utils import get_column_letter
+
+import motor_flujo as mf
+
+bold = Font(bold=True)
+border_bottom = Border(bottom=Side(style="thin", color="999999"))
+currency_fmt = '"$"#,##0;[RED]"$"#,##0'
+pct_fmt = '0.00%'
+
+MAX_BARRAS = 60  # el gráfico de VAN sólo se agrega hasta este número de escenarios
+
+
+def escenarios_base(tabla=None):
+    """Escenarios de Escenarios_v4 (o de `tabla`, mismas filas) como (nombres, {f_*: arreglo})"""
+    tabla = mf.ESCENARIOS if tabla is None else tabla
+    nombres = [fila[0] for fila in tabla]
+    cambios = {f: np.array([fila[1 + i] for fila in tabla]) for i, f in enumerate(mf.FACTORES)}
+    return nombres, cambios
+
+
+def leer_escenarios(ruta):
+    """Lee un CSV con columna Escenario y una columna por nombre definido (f_*, G_*, WACC, ...)"""
+    with open(ruta, newline="", encoding="utf-8-sig") as fh:
+        lector = csv.DictReader(fh)
+        columnas = [c for c in lector.fieldnames if c != "Escenario"]
+        desconocidas = set(columnas) - set(mf.parametros_base())
+        if desconocidas:
+            raise ValueError(f"Columnas desconocidas en {ruta}: {sorted(desconocidas)}")
+        nombres, valores = [], {c: [] for c in columnas}
+        for fila in lector:
+            nombres.append(fila.get("Escenario") or f"E{len(nombres) + 1}")
+            for c in columnas:
+                valores[c].append(float(fila[c]))
+    return nombres, {c: np.array(v) for c, v in valores.items()}
+
+
+def evaluar(cambios, horizonte, params=None, perfiles=None):
+    """Flujos, VAN acumulado descontado y KPIs del lote de escenarios.
+
+    `params` fija los demás nombres definidos (valores de Parametros distintos a los de fábrica);
+    `perfiles` son los montos anuales de perfiles_subanuales (ver motor_flujo.flujo_base).
+    """
+    p = mf.resolver_parametros({**(params or {}), **cambios, "HORIZONTE": horizonte})
+    res = mf.flujo_base(p, n_anios=horizonte + 1, perfiles=perfiles)
+    return {
+        "flujo": res["flujo"],
+        "van_acum": res["van_acum"],
+        "van": res["van_acum"][:, -1],
+        "tir": mf.tir(res["flujo"]),
+        "payback": mf.payback(res["van_acum"]),
+        "pi": mf.indice_rentabilidad(res["flujo"], p["WACC"]),
+    }
+
+
+def _formula_flujo(y, fila_kpi, col_factor, fijos=(), columnas_perfil=None):
+    """Flujo neto de un año (celda y) con multiplicadores de la fila de KPIs.
+
+    Los niveles en `fijos` (ING_*_1 / OPEX_*_1 fijados en Parametros) se usan tal
+    cual, sin multiplicador, como en Parametros y en motor_flujo. Las series en
+    `columnas_perfil` ({clave: columna de Perfiles}) leen el perfil en sus años,
+    escalado por el multiplicador de la fila (como perfiles_subanuales.formula_serie).
+    """
+    vinculo = {nivel: (base, f) for nivel, base, f in mf.VINCULOS}
+    columnas_perfil = columnas_perfil or {}
+    def termino(clave, nivel, g):
+        if nivel in fijos:
+            anual = f"{nivel}*(1+{g})^({y}-ANIO_OP)"
+        else:
+            base, f = vinculo[nivel]
+            anual = f"{base}*${col_factor[f]}${fila_kpi}*(1+{g})^({y}-ANIO_OP)"
+        if clave not in columnas_perfil:
+            return anual
+        col, f = columnas_perfil[clave], mf.FACTOR_SERIE[clave]
+        return (f"IF({y}-ANIO_OP<PERFIL_ANIOS,INDEX(Perfiles!{col}:{col},{y}-ANIO_OP+2)"
+                f"*${col_factor[f]}${fila_kpi},{anual})")
+    ingresos = "+".join(termino(clave, nivel, g) for clave, nivel, g in mf.INGRESOS)
+    opex = "-".join(termino(clave, nivel, g) for clave, nivel, g in mf.OPEX)
+    return (f"=IF(OR({y}=0,{y}<ANIO_OP),0,{ingresos}-{opex})"
+            f"-IF({y}=0,CAPEX*CAPEX0,IF({y}=1,CAPEX*CAPEX1,IF({y}=ANIO_REP,COSTO_REP,0)))"
+            f"+IF(AND({y}>0,{y}=HORIZONTE),VALOR_TERRENO,0)")
+
+
+def hoja_kpis_escenarios(wb, nombres, cambios, horizonte, formulas=False, titulo="KPIs_Escenarios",
+                         res=None, tabla=None, fijos=(), columnas_perfil=None):
+    """Escribe la hoja; devuelve {celda: valor} para la caché (vacío si formulas=False).
+
+    `res` permite pasar el resultado de `evaluar` ya calculado (p. ej. desde caché);
+    `tabla` son las filas de multiplicadores de Escenarios_v4 (mf.ESCENARIOS por defecto);
+    `fijos` son los ING_*_1 / OPEX_*_1 fijados en Parametros (no llevan multiplicador);
+    `columnas_perfil` ({clave: columna de Perfiles}) hace que las fórmulas lean el perfil
+    subanual (`res` debe venir de `evaluar` con los mismos perfiles).
+    """
+    if formulas and set(cambios) - set(mf.FACTORES):
+        raise ValueError("El modo con fórmulas sólo admite columnas f_* de Escenarios_v4")
+    ws = wb.create_sheet(titulo)
+    n, m = len(nombres), horizonte + 1
+    res = evaluar(cambios, horizonte) if res is None else res
+    insumos = [f for f in mf.FACTORES if f in cambios] + sorted(set(cambios) - set(mf.FACTORES))
+    col_insumo = {c: get_column_letter(6 + i) for i, c in enumerate(insumos)}
+    ultima = get_column_letter(1 + m)
+    hdr_flujo, hdr_desc = n + 4, 2 * n + 7
+    fila_flujo = lambda i: hdr_flujo + 1 + i
+    fila_desc = lambda i: hdr_desc + 1 + i
+    cache = {}
+
+    # 1) KPIs
+    ws.append(["Escenario", "VAN (MXN)", "TIR", "Payback (años)", "PI"] + insumos)
+    for c in ws[1]:
+        c.font = bold
+        c.border = border_bottom
+    tabla = mf.ESCENARIOS if tabla is None else tabla
+    nombres_esc = {fila[0]: i for i, fila in enumerate(tabla)}
+    fin_tabla = 12 + len(tabla)     # filas 13.. de Escenarios_v4
+
+    def fila_kpi(r):
+        i = r - 2
+        if not formulas:
+            return ([nombres[i]] + [_num(res[k][i]) for k in ("van", "tir", "payback", "pi")]
+                    + [float(cambios[c][i]) for c in insumos])
+        rf, rd = fila_flujo(i), fila_desc(i)
+        fila = [nombres[i], f"={ultima}{rd}", f"=IRR(B{rf}:{ultima}{rf})",
+                f"=MATCH(TRUE,INDEX(B{rd}:{ultima}{rd}>=0,0),0)-1",
+                f"=NPV(WACC,C{rf}:{ultima}{rf})/ABS(B{rf})"]
+        for k, c in enumerate(insumos):
+            if nombres[i] in nombres_esc:
+                fila.append(f"=INDEX(Escenarios_v4!$B$13:$H${fin_tabla}, "
+                            f"MATCH($A{r},Escenarios_v4!$A$13:$A${fin_tabla},0), "
+                            f"{mf.FACTORES.index(c) + 1})")
+            else:
+                fila.append(float(cambios[c][i]))
+        return fila
+
+    estilos_kpi = {2: {"number_format": currency_fmt}, 3: {"number_format": pct_fmt},
+                   4: {"number_format": '0.0'}, 5: {"number_format": '0.00'}}
+    estilos_kpi.update({6 + k: {"number_format": '0.00'} for k in range(len(insumos))})
+    ws.bloque(2, n, fila_kpi, estilos_kpi)
+
+    # 2) flujo neto y 3) VAN acumulado descontado
+    for hdr, etiqueta in ((hdr_flujo, "Flujo neto anual (MXN)"),
+                          (hdr_desc, "VAN acumulado descontado (MXN, helper payback)")):
+        ws.cell(hdr - 1, 1, etiqueta).font = bold
+        ws.cell(hdr, 1, "Escenario").font = bold
+        for t in range(m):
+            ws.cell(hdr, 2 + t, t).font = bold
+
+    def fila_matriz(clave, fila0):
+        def generar(r):
+            i = r - fila0
+            if not formulas:
+                return [nombres[i]] + res[clave][i].tolist()
+            rk, rf = 2 + i, fila_flujo(i)
+            celdas = [nombres[i]]
+            for t in range(m):
+                col = get_column_letter(2 + t)
+                y = f"{col}${hdr_flujo}"
+                if clave == "flujo":
+                    celdas.append(_formula_flujo(y, rk, col_insumo, fijos, columnas_perfil))
+                elif t == 0:
+                    celdas.append(f"={col}{rf}")
+                else:
+                    celdas.append(f"={get_column_letter(1 + t)}{r}+{col}{rf}/(1+WACC)^{y}")
+            return celdas
+        return generar
+
+    moneda = {2 + t: {"number_format": currency_fmt} for t in range(m)}
+    ws.bloque(fila_flujo(0), n, fila_matriz("flujo", fila_flujo(0)), moneda)
+    ws.bloque(fila_desc(0), n, fila_matriz("van_acum", fila_desc(0)), moneda)
+
+    if formulas:
+        for i in range(n):
+            r = 2 + i
+            cache[f"B{r}"] = res["van"][i]
+            cache[f"C{r}"] = _num(res["tir"][i], "#NUM!")
+            cache[f"D{r}"] = _num(res["payback"][i], "#N/A")
+            cache[f"E{r}"] = res["pi"][i]
+            for c in insumos:
+                cache[f"{col_insumo[c]}{r}"] = float(cambios[c][i])
+            for t in range(m):
+                col = get_column_letter(2 + t)
+                cache[f"{col}{fila_flujo(i)}"] = res["flujo"][i, t]
+                cache[f"{col}{fila_desc(i)}"] = res["van_acum"][i, t]
+
+    ws.column_dimensions["A"].width = 18
+    for c in range(2, max(6 + len(insumos), 2 + m)):
+        ws.column_dimensions[get_column_letter(c)].width = 16
+    ws.freeze_panes = "B2"
+
+    if n <= MAX_BARRAS:
+        chart = BarChart()
+        chart.title = "VAN por escenario"
+        chart.add_data(Reference(ws, min_col=2, min_row=1, max_row=1 + n), titles_from_data=True)
+        chart.set_categories(Reference(ws, min_col=1, min_row=2, max_row=1 + n))
+        ws.add_chart(chart, f"{get_column_letter(max(8 + len(insumos), 13))}3")
+    return cache
+
+
+def _num(x, error=None):
+    """float o, si es NaN, None (celda vacía) / código de error para la caché"""
+    return error if np.isnan(x) else float(x)
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+# Banco de pruebas de rendimiento del constructor del libro.
+#
+# Recorre una malla de horizontes × número de escenarios × juego de hojas y,
+# para cada punto, mide en un proceso aparte (memoria pico limpia) el tiempo
+# por sección de construir_libro, el tiempo total, la memoria pico (RSS y,
+# opcionalmente, tracemalloc) y el tamaño del .xlsx. El resultado es un JSON
+# que se puede comparar contra una corrida anterior para detectar regresiones.
+#
+# Las secciones vienen de construir_libro(secciones=...):
+#   armar/<hoja>    construcción diferida (fórmulas por bloque, gráficos)
+#   etapa/<nombre>  cálculos del motor (escenario activo, indicadores, ...)
+#   emitir/<hoja>   generación de filas y celdas de openpyxl al guardar
+#                   (desglosado en generar/<hoja> y estilos/<hoja>)
+#   escribir        serialización XML + zip (wb.save)
+#   valores_cache   inyección de los valores calculados en las fórmulas
+# Como las filas se generan al guardar, el costo de cada hoja se reparte entre
+# armar/ y emitir/ (y escribir, que openpyxl no separa por hoja).
+#
+# Uso: python benchmark_libro.py [--horizontes 15,30,60,120] [--escenarios 3,10,50]
+#          [--hojas base,completo] [--repeticiones 3] [--streaming] [--tracemalloc]
+#          [--salida bench.json] [--comparar previo.json] [--umbral 0.10]
+
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+try:
+    import resource     # sólo Unix; en Windows la memoria pico RSS queda en None
+except ImportError:
+    resource = None
+
+import numpy as np
+import openpyxl
+
+import motor_flujo as mf
+
+HORIZONTES = [15, 30, 60, 120]
+N_ESCENARIOS = [3, 10, 50]
+REPETICIONES = 3
+UMBRAL = 0.10   # regresión: total más lento que el previo en más de 10%
+
+# Juegos de hojas: "base" = configuración por defecto sin hojas opcionales;
+# "completo" agrega política de liquidez y una simulación Monte Carlo chica.
+HOJAS = {
+    "base":     {"sensibilidad": None},
+    "completo": {"sensibilidad": 0.10, "liquidez": "deuda_max",
+                 "simulacion_mc": {"n": 20_000, "semilla": 42}},
+}
+
+
+def escenarios_sinteticos(n, semilla=0):
+    """n filas de multiplicadores: las de ESCENARIOS y el resto aleatorias en ±20%"""
+    filas = [list(f) for f in mf.ESCENARIOS[:n]]
+    rng = np.random.default_rng(semilla)
+    for i in range(len(filas), n):
+        filas.append([f"Esc_{i + 1:03d}"] + [round(float(x), 4)
+                                            for x in rng.uniform(0.8, 1.2, len(mf.FACTORES))])
+    return filas
+
+
+def _medir(horizonte, n_escenarios, hojas, streaming, usar_tracemalloc):
+    """Una construcción en el proceso actual; devuelve el registro del punto"""
+    from construir_flujo_caja_v4_1a import construir_libro
+
+    secciones = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        salida = os.path.join(tmp, "libro.xlsx")
+        if usar_tracemalloc:
+            tracemalloc.start()
+        t0 = time.perf_counter()
+        construir_libro(escenarios=escenarios_sinteticos(n_escenarios), horizonte=horizonte,
+                        salida=salida, streaming=streaming, cache_dir=None,
+                        secciones=secciones, **HOJAS[hojas])
+        total = time.perf_counter() - t0
+        pico_py = tracemalloc.get_traced_memory()[1] if usar_tracemalloc else None
+        if usar_tracemalloc:
+            tracemalloc.stop()
+        tam = os.path.getsize(salida)
+    # ru_maxrss: KiB en Linux, bytes en macOS
+    rss = None
+    if resource is not None:
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        rss *= 1 if sys.platform == "darwin" else 1024
+    return {"total_s": total, "secciones_s": secciones, "bytes_xlsx": tam,
+            "rss_pico_bytes": rss, "tracemalloc_pico_bytes": pico_py}
+
+
+def medir_punto(horizonte, n_escenarios, hojas="base", streaming=False, repeticiones=REPETICIONES,
+                usar_tracemalloc=False):
+    """Mediana de `repeticiones` construcciones, cada una en un proceso nuevo"""
+    ctx = multiprocessing.get_context("spawn")
+    corridas = []
+    for _ in range(repeticiones):
+        with ctx.Pool(1) as pool:
+            corridas.append(pool.apply(_medir, (horizonte, n_escenarios, hojas, streaming,
+                                                usar_tracemalloc)))
+    nombres = sorted({k for c in corridas for k in c["secciones_s"]})
+    return {
+        "horizonte": horizonte, "escenarios": n_escenarios, "hojas": hojas, "streaming": streaming,
+        "repeticiones": repeticiones,
+        "total_s": statistics.median(c["total_s"] for c in corridas),
+        "total_min_s": min(c["total_s"] for c in corridas),
+        "secciones_s": {k: statistics.median(c["secciones_s"].get(k, 0.0) for c in corridas)
+                        for k in nombres},
+        "bytes_xlsx": corridas[-1]["bytes_xlsx"],
+        "rss_pico_bytes": (max(c["rss_pico_bytes"] for c in corridas)
+                           if resource is not None else None),
+        "tracemalloc_pico_bytes": (max(c["tracemalloc_pico_bytes"] for c in corridas)
+                                   if usar_tracemalloc else None),
+    }
+
+
+def clave_punto(p):
+    return f"H{p['horizonte']}-E{p['escenarios']}-{p['hojas']}" + ("-streaming" if p["streaming"] else "")
+
+
+def ejecutar(horizontes=HORIZONTES, escenarios=N_ESCENARIOS, hojas=("base",), streaming=False,
+             repeticiones=REPETICIONES, usar_tracemalloc=False, progreso=None):
+    """Corre la malla completa; devuelve {"meta", "puntos"}"""
+    puntos = []
+    for juego in hojas:
+        for h in horizontes:
+            for n in escenarios:
+                p = medir_punto(h, n, juego, streaming, repeticiones, usar_tracemalloc)
+                puntos.append(p)
+                if progreso:
+                    progreso(p)
+    meta = {
+        "fecha": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(), "numpy": np.__version__,
+        "openpyxl": openpyxl.__version__, "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+    return {"meta": meta, "puntos": puntos}
+
+
+def comparar(actual, previo, umbral=UMBRAL):
+    """Filas (clave, total previo, total actual, razón, regresión?) de los puntos comunes"""
+    anteriores = {clave_punto(p): p for p in previo["puntos"]}
+    filas = []
+    for p in actual["puntos"]:
+        q = anteriores.get(clave_punto(p))
+        if q is None:
+            continue
+        razon = p["total_s"] / q["total_s"] if q["total_s"] else float("inf")
+        filas.append((clave_punto(p), q["total_s"], p["total_s"], razon, razon > 1 + umbral))
+    return filas
+
+
+def _lista_int(texto):
+    return [int(x) for x in texto.split(",") if x]
+
+
+def _reportar(p):
+    top = sorted(p["secciones_s"].items(), key=lambda kv: -kv[1])[:3]
+    if p["rss_pico_bytes"] is not None:
+        memoria = f"{p['rss_pico_bytes'] / 2**20:.0f} MiB RSS"
+    elif p["tracemalloc_pico_bytes"] is not None:
+        memoria = f"{p['tracemalloc_pico_bytes'] / 2**20:.0f} MiB tracemalloc"
+    else:
+        memoria = "RSS n/d"
+    print(f"{clave_punto(p)}: {p['total_s']:.3f} s, {memoria}, "
+          f"{p['bytes_xlsx'] / 1024:.0f} KiB | " + ", ".join(f"{k} {v:.3f}" for k, v in top),
+          file=sys.stderr, flush=True)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Mide tiempos, memoria y tamaño del libro generado")
+    ap.add_argument("--horizontes", type=_lista_int, default=HORIZONTES)
+    ap.add_argument("--escenarios", type=_lista_int, default=N_ESCENARIOS)
+    ap.add_argument("--hojas", default="base", help="juegos de hojas separados por coma: " + ", ".join(HOJAS))
+    ap.add_argument("--repeticiones", type=int, default=REPETICIONES)
+    ap.add_argument("--streaming", action="store_true", help="emitir en modo write_only")
+    ap.add_argument("--tracemalloc", action="store_true", help="medir también el pico de tracemalloc (más lento)")
+    ap.add_argument("--salida", default="benchmark_libro.json")
+    ap.add_argument("--comparar", help="JSON de una corrida anterior")
+    ap.add_argument("--umbral", type=float, default=UMBRAL)
+    args = ap.parse_args(argv)
+
+    hojas = [h for h in args.hojas.split(",") if h]
+    desconocidas = set(hojas) - set(HOJAS)
+    if desconocidas:
+        ap.error(f"juegos de hojas desconocidos: {sorted(desconocidas)}")
+    resultado = ejecutar(args.horizontes, args.escenarios, hojas, args.streaming,
+                         args.repeticiones, args.tracemalloc, _reportar)
+    with open(args.salida, "w", encoding="utf-8") as fh:
+        json.dump(resultado, fh, indent=2, ensure_ascii=False)
+    print(f"OK -> {args.salida}", file=sys.stderr)
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as fh:
+            previo = json.load(fh)
+        filas = comparar(resultado, previo, args.umbral)
+        for clave, antes, ahora, razon, regresion in filas:
+            print(f"{clave:32s} {antes:8.3f} -> {ahora:8.3f} s  x{razon:.2f}"
+                  + ("  REGRESIÓN" if regresion else ""))
+        if any(f[4] for f in filas):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+# Búsqueda discreta de decisiones de inversión: año de inicio de operación
+# (ANIO_OP), año de reemplazo del SAE (ANIO_REP) y reparto del CAPEX en los
+# años 0..k.
+#
+# Los límites de la búsqueda salen de Parametros: ANIO_OP ± MARGEN_OP y vida
+# del SAE (ANIO_REP - ANIO_OP) ± MARGEN_VIDA. Se enumeran todas las
+# combinaciones factibles (CAPEX pagado antes de ANIO_OP, ANIO_REP dentro del
+# horizonte) y se evalúan en lotes con motor_flujo: VAN y deuda máxima de la
+# recurrencia de Optimizacion_Flujo. Las combinaciones dominadas (otra con
+# VAN >= y deuda máxima <=, alguna estricta) se descartan; queda el frente de
+# Pareto VAN vs. deuda máxima, que se escribe en la hoja Decisiones_Inversion
+# junto con la configuración actual de Parametros. Los candidatos que quedan
+# en un límite de la búsqueda se marcan: el óptimo podría estar más allá.
+#
+# Diferir no es gratis: el CAPEX de Parametros es el precio del calendario
+# CAPEX0 / CAPEX1, y lo que un candidato paga después de ese calendario lo
+# financia el proveedor a TASA_CRED (lo que adelanta se descuenta igual).
+#
+# Con k = 1 el reparto es CAPEX0 / CAPEX1 y cada candidato se reproduce en
+# Parametros (con el interés del diferimiento sumado a CAPEX1); con k > 1 el
+# CAPEX de los años 2..k se descuenta del flujo del motor (Parametros sólo
+# admite dos años de inversión).
+
+import itertools
+
+import numpy as np
+from openpyxl.chart import ScatterChart, Reference, Series
+from openpyxl.styles import Font, Alignment, Border, Side
+from openpyxl.utils import get_column_letter
+
+import motor_flujo as mf
+from solver_tir import tir_lote, payback_interpolado
+
+bold = Font(bold=True)
+border_bottom = Border(bottom=Side(style="thin", color="999999"))
+currency_fmt = '"$"#,##0;[RED]"$"#,##0'
+pct_fmt = '0.00%'
+
+MARGEN_OP = 2           # ANIO_OP de Parametros ± MARGEN_OP (sin bajar de 1)
+MARGEN_VIDA = 3         # vida del SAE de Parametros ± MARGEN_VIDA años (sin bajar de 1)
+ANIOS_CAPEX = 1         # k: el CAPEX se reparte en los años 0..k
+PASO_CAPEX = 0.10       # resolución del reparto
+CANDIDATOS_POR_LOTE = 8192
+MAX_FILAS = 40          # filas del frente que se escriben en la hoja
+
+
+def repartos(k=ANIOS_CAPEX, paso=PASO_CAPEX):
+    """Fracciones del CAPEX en los años 0..k: múltiplos de `paso` que suman 1, (n, k+1)"""
+    n = int(round(1 / paso))
+    if k < 0 or not np.isclose(n * paso, 1.0):
+        raise ValueError("k debe ser >= 0 y `paso` dividir exactamente a 1")
+    filas = []
+    for barras in itertools.combinations(range(n + k), k):   # barras y estrellas
+        limites = (-1,) + barras + (n + k,)
+        filas.append([limites[i + 1] - limites[i] - 1 for i in range(k + 1)])
+    return np.array(filas, dtype=float) / n
+
+
+def limites(params, margen_op=MARGEN_OP, margen_vida=MARGEN_VIDA):
+    """ANIO_OP y vida del SAE (mín., máx.) alrededor de los valores de `params`"""
+    p = mf.resolver_parametros(params)
+    op, vida = int(p["ANIO_OP"]), int(p["ANIO_REP"]) - int(p["ANIO_OP"])
+    return (list(range(max(op - margen_op, 1), op + margen_op + 1)),
+            (max(vida - margen_vida, 1), vida + margen_vida))
+
+
+def candidatos(horizonte, anios_op, vida, k=ANIOS_CAPEX, paso=PASO_CAPEX):
+    """Combinaciones factibles {"ANIO_OP", "ANIO_REP", "reparto" (n, k+1)}.
+
+    El CAPEX debe quedar pagado antes de operar: el reparto no tiene montos en
+    años >= ANIO_OP (si no, diferir la inversión no costaría nada).
+    """
+    reparto = repartos(k, paso)
+    ultimo = np.max(np.where(reparto > 0, np.arange(k + 1), -1), axis=1)
+    op, rep, idx = [], [], []
+    for a in anios_op:
+        validos = np.flatnonzero(ultimo < max(a, 1))
+        for r in range(max(a, k, 1) + 1, horizonte + 1):
+            if vida is None or vida[0] <= r - a <= vida[1]:
+                op.append(np.full(validos.size, a))
+                rep.append(np.full(validos.size, r))
+                idx.append(validos)
+    if not op:
+        raise ValueError("No hay combinaciones ANIO_OP / ANIO_REP factibles en el horizonte")
+    idx = np.concatenate(idx)
+    return {"ANIO_OP": np.concatenate(op).astype(float), "ANIO_REP": np.concatenate(rep).astype(float),
+            "reparto": reparto[idx]}
+
+
+def con_recargo(params, reparto):
+    """Reparto (n, max(k, 1)+1) con el costo de diferir respecto de CAPEX0 / CAPEX1.
+
+    El saldo diferido al cierre de cada año (lo que el calendario de Parametros
+    ya habría pagado y el candidato no) genera interés a TASA_CRED, que se paga
+    al año siguiente; un saldo adelantado genera el descuento equivalente.
+    """
+    p = mf.resolver_parametros(params)
+    reparto = np.pad(reparto, ((0, 0), (0, max(2 - reparto.shape[1], 0))))
+    calendario = np.zeros(reparto.shape[1])
+    calendario[:2] = [float(p["CAPEX0"]), float(p["CAPEX1"])]
+    saldo = np.cumsum(calendario - reparto, axis=1)
+    reparto[:, 1:] += float(p["TASA_CRED"]) * saldo[:, :-1]
+    return reparto
+
+
+def evaluar(params, cand, series=False, perfiles=None):
+    """VAN y deuda máxima (y, con `series`, flujo / van_acum / deuda) de los candidatos"""
+    reparto = con_recargo(params, cand["reparto"])
+    k = reparto.shape[1] - 1
+    p = mf.resolver_parametros({**params, "ANIO_OP": cand["ANIO_OP"], "ANIO_REP": cand["ANIO_REP"],
+                                "CAPEX0": reparto[:, 0], "CAPEX1": reparto[:, 1]})
+    res = mf.flujo_base(p, perfiles=perfiles)
+    if k > 1:
+        capex = np.asarray(p["CAPEX"], dtype=float).reshape(-1, 1)
+        res["flujo"][:, 2:k + 1] -= capex * reparto[:, 2:]
+        res["flujo_desc"] = res["flujo"] / res["factor"]
+        res["van_acum"] = np.cumsum(res["flujo_desc"], axis=1)
+    deuda = mf.optimizacion_flujo(res["flujo"], res["opex_total"], p["RESERVA_PCT"], p["TASA_CRED"])["deuda"]
+    salida = {"van": res["van_acum"][:, -1], "deuda_max": deuda.max(axis=1)}
+    if series:
+        salida.update(flujo=res["flujo"], van_acum=res["van_acum"], deuda=deuda)
+    return salida
+
+
+def frente_pareto(van, deuda_max):
+    """Índices no dominados (máx. VAN, mín. deuda máxima), por deuda creciente"""
+    orden = np.lexsort((-van, deuda_max))
+    v = van[orden]
+    previo = np.concatenate([[-np.inf], np.maximum.accumulate(v)[:-1]])
+    return orden[v > previo]
+
+
+def buscar(params=None, anios_op=None, vida=None, k=ANIOS_CAPEX, paso=PASO_CAPEX, perfiles=None):
+    """Frente de Pareto VAN vs. deuda máxima; devuelve {"frente", "actual", "evaluadas", ...}.
+
+    `anios_op` y `vida` (mín., máx.) por defecto salen de `limites(params)`;
+    `perfiles` son los montos anuales de perfiles_subanuales.
+    Cada fila del frente y "actual" es {"ANIO_OP", "ANIO_REP", "reparto", "van",
+    "deuda_max", "tir", "payback", "borde"}; "borde" lista los límites de la
+    búsqueda en los que está el candidato.
+    """
+    params = dict(params or {})
+    H = int(params.get("HORIZONTE", mf.parametros_base()["HORIZONTE"]))
+    op_def, vida_def = limites(params)
+    anios_op = list(anios_op or op_def)
+    vida = tuple(vida or vida_def)
+    cand = candidatos(H, anios_op, vida, k, paso)
+    n = cand["ANIO_OP"].size
+    van, deuda = np.empty(n), np.empty(n)
+    for ini in range(0, n, CANDIDATOS_POR_LOTE):
+        sl = slice(ini, ini + CANDIDATOS_POR_LOTE)
+        r = evaluar(params, {c: v[sl] for c, v in cand.items()}, perfiles=perfiles)
+        van[sl], deuda[sl] = r["van"], r["deuda_max"]
+    frente = frente_pareto(van, deuda)
+
+    base = mf.resolver_parametros(params)
+    reparto_actual = np.zeros((1, k + 1 if k >= 1 else 2))
+    reparto_actual[0, :2] = [float(base["CAPEX0"]), float(base["CAPEX1"])]
+    actual = {"ANIO_OP": np.array([float(base["ANIO_OP"])]), "ANIO_REP": np.array([float(base["ANIO_REP"])]),
+              "reparto": reparto_actual}
+    bordes = {"anios_op": anios_op, "vida": vida, "horizonte": H}
+    return {"frente": _filas(params, {c: v[frente] for c, v in cand.items()}, bordes, perfiles),
+            "actual": _filas(params, actual, bordes, perfiles)[0],
+            "evaluadas": n, "k": max(k, 1), "anios_op": anios_op, "vida": vida, "paso": paso}
+
+
+def _borde(op, rep, anios_op, vida, horizonte):
+    """Límites de la búsqueda (no físicos) en los que está un candidato"""
+    marcas = []
+    if op == min(anios_op) and op > 1:
+        marcas.append("ANIO_OP mín.")
+    if op == max(anios_op):
+        marcas.append("ANIO_OP máx.")
+    if rep - op == vida[0] and vida[0] > 1:
+        marcas.append("vida mín.")
+    if rep - op == vida[1] and rep < horizonte:
+        marcas.append("vida máx.")
+    return ", ".join(marcas)
+
+
+def _filas(params, cand, bordes, perfiles=None):
+    r = evaluar(params, cand, series=True, perfiles=perfiles)
+    tir = tir_lote(r["flujo"])[0]
+    # payback desde el primer año con flujo (sin CAPEX en el año 0 el VAN acumulado arranca en 0)
+    inicio = np.argmax(r["flujo"] != 0, axis=1)
+    payback = np.empty(inicio.size)
+    for j in np.unique(inicio):
+        filas = inicio == j
+        payback[filas] = j + payback_interpolado(r["van_acum"][filas, j:])
+    return [{"ANIO_OP": int(cand["ANIO_OP"][i]), "ANIO_REP": int(cand["ANIO_REP"][i]),
+             "reparto": [float(x) for x in cand["reparto"][i]], "van": float(r["van"][i]),
+             "deuda_max": float(r["deuda_max"][i]), "tir": float(tir[i]), "payback": float(payback[i]),
+             "borde": _borde(int(cand["ANIO_OP"][i]), int(cand["ANIO_REP"][i]), **bordes)}
+            for i in range(len(cand["ANIO_OP"]))]
+
+
+def _seleccion(frente, maximo=MAX_FILAS):
+    """Hasta `maximo` filas del frente repartidas a lo largo de él (incluye ambos extremos)"""
+    if len(frente) <= maximo:
+        return frente
+    idx = np.unique(np.linspace(0, len(frente) - 1, maximo).round().astype(int))
+    return [frente[i] for i in idx]
+
+
+def hoja_busqueda(wb, resultado, titulo="Decisiones_Inversion"):
+    """Frente de Pareto VAN vs. deuda máxima frente a la configuración actual"""
+    ws = wb.create_sheet(titulo)
+    frente = resultado["frente"]
+    filas = _seleccion(frente)
+    actual = resultado["actual"]
+    ws["A1"] = "Decisiones de inversión – frente de Pareto VAN vs. deuda máxima"; ws["A1"].font = bold
+    vmin, vmax = resultado["vida"]
+    resumen = [("Combinaciones evaluadas", resultado["evaluadas"]),
+               ("En el frente de Pareto", len(frente)),
+               ("Filas mostradas", len(filas)),
+               ("ANIO_OP buscado", f"{min(resultado['anios_op'])}–{max(resultado['anios_op'])}"),
+               ("Vida del SAE (años desde ANIO_OP)", f"{vmin}–{vmax}"),
+               ("Resolución del reparto de CAPEX", resultado["paso"]),
+               ("Costo de diferir CAPEX", "TASA_CRED por año (proveedor)")]
+    for i, (texto, valor) in enumerate(resumen, start=2):
+        ws.cell(i, 1, texto)
+        ws.cell(i, 2, valor)
+    ws.cell(7, 2).number_format = pct_fmt
+
+    k = resultado["k"]
+    r0 = 3 + len(resumen)
+    encabezados = (["Candidato", "ANIO_OP", "ANIO_REP"] + [f"CAPEX año {j}" for j in range(k + 1)]
+                   + ["VAN", "TIR", "Deuda máxima", "Payback descontado", "Δ VAN vs. actual",
+                      "Δ deuda vs. actual", "En el límite de la búsqueda"])
+    for c, t in enumerate(encabezados, start=1):
+        celda = ws.cell(r0, c, t)
+        celda.font = bold
+        celda.border = border_bottom
+        celda.alignment = Alignment(horizontal="center")
+    todas = [("Actual", actual)] + [(f"P{i}", f) for i, f in enumerate(filas, start=1)]
+
+    def fila(r):
+        nombre, f = todas[r - r0 - 1]
+        reparto = (f["reparto"] + [0.0] * (k + 1))[:k + 1]
+        return ([nombre, f["ANIO_OP"], f["ANIO_REP"]] + reparto
+                + [f["van"], None if np.isnan(f["tir"]) else f["tir"], f["deuda_max"],
+                   None if np.isnan(f["payback"]) else f["payback"],
+                   f["van"] - actual["van"], f["deuda_max"] - actual["deuda_max"], f["borde"] or None])
+    c_van = 4 + k + 1
+    formatos = {**{4 + j: pct_fmt for j in range(k + 1)},
+                c_van: currency_fmt, c_van + 1: pct_fmt, c_van + 2: currency_fmt, c_van + 3: '0.0',
+                c_van + 4: currency_fmt, c_van + 5: currency_fmt}
+    ws.bloque(r0 + 1, len(todas), fila, {c: {"number_format": f} for c, f in formatos.items()})
+    ws.cell(r0 + 1, 1).font = bold
+
+    ws.column_dimensions["A"].width = 36
+    for c in range(2, len(encabezados) + 1):
+        ws.column_dimensions[get_column_letter(c)].width = 16
+
+    ch = ScatterChart(); ch.title = "Frente de Pareto"; ch.style = 13
+    ch.x_axis.title = "Deuda máxima (MXN)"; ch.y_axis.title = "VAN (MXN)"
+    serie = Series(Reference(ws, min_col=c_van, min_row=r0 + 2, max_row=r0 + len(todas)),
+                   Reference(ws, min_col=c_van + 2, min_row=r0 + 2, max_row=r0 + len(todas)),
+                   title="Frente")
+    serie.marker.symbol = "circle"
+    ch.series.append(serie)
+    ch.height, ch.width = 9, 16
+    ws.add_chart(ch, f"{get_column_letter(len(encabezados) + 2)}{r0}")
+    ws.freeze_panes = f"B{r0 + 1}"
+    return ws
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+# Caché en disco direccionada por contenido para el constructor del libro.
+#
+# Cada etapa (motor del escenario activo, Indicadores, Sensibilidad,
+# KPIs_Escenarios, Simulacion_MC, política de liquidez) se guarda bajo la
+# huella SHA-256 de sus insumos (filas de Parametros, tabla de multiplicadores,
+# horizonte, configuración) más la versión del código; el libro completo se
+# guarda igual bajo la huella de todos los insumos y del código del
+# constructor. Si nada cambió, el .xlsx se copia de la caché sin reconstruir;
+# si cambió sólo un multiplicador, se recalculan únicamente las etapas que
+# dependen de él.
+#
+# La caché se limita por tamaño: al superar `max_bytes` se borran las entradas
+# usadas hace más tiempo (la fecha de modificación se renueva en cada acierto).
+
+import glob
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import shutil
+import tempfile
+
+import numpy as np
+
+DIRECTORIO = ".cache_flujo"
+MAX_BYTES = 512 * 1024 ** 2
+
+
+def _canonico(x):
+    """Representación JSON estable de los insumos (dicts ordenados, arreglos por contenido)"""
+    if isinstance(x, dict):
+        return {str(k): _canonico(v) for k, v in sorted(x.items(), key=lambda kv: str(kv[0]))}
+    if isinstance(x, (list, tuple)):
+        return [_canonico(v) for v in x]
+    if isinstance(x, np.ndarray):
+        return {"dtype": str(x.dtype), "forma": list(x.shape),
+                "sha256": hashlib.sha256(np.ascontiguousarray(x).tobytes()).hexdigest()}
+    if isinstance(x, np.generic):
+        return x.item()
+    if isinstance(x, float):
+        return repr(x)       # distingue 0.1 de 0.1000000001 sin redondeos de JSON
+    if x is None or isinstance(x, (bool, int, str)):
+        return x
+    raise TypeError(f"Insumo no serializable para la huella: {type(x).__name__}")
+
+
+def huella(*partes):
+    """SHA-256 hex de los insumos"""
+    texto = json.dumps(_canonico(list(partes)), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+
+def version_codigo(modulos, solo_funciones=()):
+    """Huella del código de `modulos`: un cambio de código invalida la caché.
+
+    De los módulos en `solo_funciones` (los que contienen tablas de insumos,
+    como motor_flujo) sólo cuentan funciones y clases: sus tablas ya forman
+    parte de los insumos de cada etapa, y editar un multiplicador no debe
+    invalidar etapas que no dependen de él.
+    """
+    h = hashlib.sha256()
+    for mod in sorted(modulos, key=lambda m: m.__name__):
+        h.update(mod.__name__.encode() + b"\0")
+        if mod in solo_funciones:
+            for nombre, obj in sorted(vars(mod).items()):
+                if (inspect.isfunction(obj) or inspect.isclass(obj)) and obj.__module__ == mod.__name__:
+                    h.update(inspect.getsource(obj).encode())
+        else:
+            h.update(inspect.getsource(mod).encode())
+    return h.hexdigest()
+
+
+def huella_archivo(ruta):
+    """Huella del contenido de un archivo de insumos (None si no hay ruta)"""
+    if not ruta:
+        return None
+    with open(ruta, "rb") as fh:
+        return hashlib.sha256(fh.read()).hexdigest()
+
+
+class CacheEtapas:
+    """Resultados de etapas (pickle) y libros (.xlsx) indexados por huella"""
+
+    def __init__(self, directorio=DIRECTORIO, max_bytes=MAX_BYTES, version=""):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        self.version = version
+        self.aciertos = 0
+        self.fallos = 0
+        os.makedirs(directorio, exist_ok=True)
+
+    def _ruta(self, clave, ext):
+        return os.path.join(self.directorio, clave[:2], f"{clave}{ext}")
+
+    def clave(self, nombre, entradas):
+        return huella(self.version, nombre, entradas)
+
+    def etapa(self, nombre, entradas, calcular):
+        """Resultado de `calcular()` para estos insumos, desde la caché si existe"""
+        ruta = self._ruta(self.clave(nombre, entradas), ".pkl")
+        if os.path.exists(ruta):
+            try:
+                with open(ruta, "rb") as fh:
+                    valor = pickle.load(fh)
+                os.utime(ruta)
+                self.aciertos += 1
+                return valor
+            except (OSError, EOFError, pickle.UnpicklingError):
+                pass    # entrada corrupta o borrada en paralelo: se recalcula
+        self.fallos += 1
+        valor = calcular()
+        self._escribir(ruta, lambda fh: pickle.dump(valor, fh, protocol=pickle.HIGHEST_PROTOCOL))
+        return valor
+
+    def copiar_libro(self, clave, salida):
+        """Copia el .xlsx en caché a `salida`; False si no está"""
+        ruta = self._ruta(clave, ".xlsx")
+        try:
+            shutil.copyfile(ruta, salida)
+        except OSError:
+            return False
+        os.utime(ruta)
+        self.aciertos += 1
+        return True
+
+    def guardar_libro(self, clave, salida):
+        ruta = self._ruta(clave, ".xlsx")
+        with open(salida, "rb") as origen:
+            self._escribir(ruta, lambda fh: shutil.copyfileobj(origen, fh))
+
+    def _escribir(self, ruta, escribir):
+        """Escritura atómica (temporal + os.replace) y desalojo por tamaño"""
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(ruta), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                escribir(fh)
+            os.replace(tmp, ruta)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self.desalojar()
+
+    def desalojar(self):
+        """Borra las entradas menos recientes hasta quedar en max_bytes"""
+        entradas = []
+        for ruta in glob.glob(os.path.join(self.directorio, "*", "*")):
+            if ruta.endswith(".tmp"):
+                continue
+            try:
+                st = os.stat(ruta)
+            except OSError:
+                continue
+            entradas.append((st.st_mtime, st.st_size, ruta))
+        total = sum(e[1] for e in entradas)
+        for _, tam, ruta in sorted(entradas):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(ruta)
+            except OSError:
+                pass
+            total -= tam
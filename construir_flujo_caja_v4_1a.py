@@ -1,19 +1,73 @@
 # -*- coding: utf-8 -*-
 # Construye "Flujo_Caja_ElectroHub_v4_1a.xlsx" con:
 # Parametros, Escenarios_v4, Flujo_Base, Optimizacion_Flujo, Indicadores,
-# Dashboard (gráficos), KPIs_Escenarios (VAN/TIR/Payback/PI con método robusto),
+# Dashboard (gráficos), Sensibilidad (tornado), KPIs_Escenarios (VAN/TIR/Payback/PI con método robusto),
 # Resumen_Anual, Seguridad_H2, Instrucciones.
 #
-# Requiere: pip install openpyxl
+# Los valores de las fórmulas se precalculan con motor_flujo (NumPy) y se
+# incrustan como resultados en caché, para leer números sin recalcular.
+#
+# Las hojas se arman en un LibroDiferido (libro_diferido.py) y se emiten al
+# guardar; con MODO_STREAMING se usa el modo write_only de openpyxl.
+#
+# Uso como módulo: construir_libro(params, escenarios, horizonte) -> ruta o bytes
+# (alias build_workbook); para lotes de variantes ver lote_libros.py.
+#
+# Requiere: pip install openpyxl numpy
 
-import openpyxl
-from openpyxl import Workbook
+import os
+import tempfile
+
+import numpy as np
 from openpyxl.styles import Font, Alignment, Border, Side
-from openpyxl.utils import get_column_letter
+from openpyxl.utils import get_column_letter, column_index_from_string
 from openpyxl.worksheet.datavalidation import DataValidation
-from openpyxl.chart import LineChart, BarChart, Reference
+from openpyxl.chart import LineChart, Reference
 from openpyxl.workbook.defined_name import DefinedName
 
+import motor_flujo as mf
+from libro_diferido import LibroDiferido
+from instrumentacion import Instrumentos, seccion
+from valores_cache import incrustar_valores
+from simulacion_montecarlo import simular, hoja_montecarlo
+from barrido_escenarios import (escenarios_base, leer_escenarios, hoja_kpis_escenarios,
+                                evaluar as evaluar_escenarios)
+from solver_tir import indicadores, ESTADOS
+from sensibilidad_tornado import tornado, hoja_sensibilidad, grafico_tornado
+from optimizador_liquidez import optimizar, escribir_politica
+from perfiles_subanuales import (agregar as agregar_perfil, anuales as anuales_perfil, formula_serie,
+                                 hoja_perfiles, hoja_liquidez_mensual,
+                                 liquidez_mensual as calcular_liquidez_mensual)
+from portafolio_sitios import leer_sitios, consolidar, hoja_portafolio
+from cubo_escenarios import calcular_cubo, escribir_cubo
+from busqueda_inversion import buscar as buscar_inversion, hoja_busqueda
+from sensibilidad_global import sobol, hoja_sensibilidad_global
+from cache_etapas import CacheEtapas, huella_archivo, version_codigo
+from simulacion_montecarlo import DISTRIBUCIONES
+import barrido_escenarios, busqueda_inversion, cache_etapas, libro_diferido, optimizador_liquidez, perfiles_subanuales
+import cubo_escenarios, portafolio_sitios
+import sensibilidad_global, sensibilidad_tornado, simulacion_montecarlo, solver_tir, valores_cache
+
+# ---------- configuración (valores por defecto de construir_libro) ----------
+SALIDA = "Flujo_Caja_ElectroHub_v4_1a.xlsx"
+ESCENARIO_ACTIVO = "Base"  # selector inicial de Escenarios_v4
+CACHEAR_VALORES = True  # incrustar valores calculados por motor_flujo
+MODO_STREAMING = False  # True: Workbook(write_only=True), memoria acotada
+BARRIDO_ESCENARIOS = None  # CSV: Escenario, f_H2, ..., otros nombres definidos
+SIMULACION_MC = None    # p. ej. {"n": 1_000_000, "semilla": 42} -> hoja Simulacion_MC
+SENSIBILIDAD_DELTA = 0.10  # ±10% por parámetro -> hoja Sensibilidad (None: omitir)
+TIR_CON_FORMULAS = True  # False: TIR acumulada como valores del solver (sin IRR por fila)
+OPTIMIZAR_LIQUIDEZ = None  # "deuda_max" | "interes_total": política óptima en Optimizacion_Flujo
+CACHE_DIR = ".cache_flujo"  # caché de etapas y libros por huella de insumos (None: sin caché)
+CACHE_MAX_MB = 512
+TRAZA_JSON = None       # ruta: traza JSON de tiempos y conteos por sección (None: sin traza)
+PERFILES = None         # {"archivo": "perfil.csv", "resolucion": "horaria" | "mensual"} -> hoja Perfiles
+LIQUIDEZ_MENSUAL = False  # hoja Liquidez_Mensual (recurrencia de liquidez/deuda mes a mes)
+PORTAFOLIO = None       # CSV/JSON de sitios o {"archivo": ruta, "procesos": 4} -> hoja Portafolio
+CUBO_ESCENARIOS = None  # ruta o {"salida": ruta, "ejes": {...}}: cubo binario para el dashboard web
+BUSQUEDA_INVERSION = None  # True o {"anios_op", "vida", "k", "paso"} -> hoja Decisiones_Inversion
+SENSIBILIDAD_SOBOL = None  # True o p. ej. {"n": 4096, "muestreo": "sobol", "procesos": 4} -> hoja Sensibilidad_Global
+
 # ---------- utilería ----------
 bold = Font(bold=True)
 thin = Side(style="thin", color="999999")
@@ -29,460 +83,623 @@ def define_name(wb, name, ref):
 
 def set_formula_by_label(ws, label, formula, numfmt=None):
     """Establece una fórmula en la celda a la derecha de una etiqueta"""
-    for row in ws.rows:
-        for cell in row:
-            if cell.value == label:
-                formula_cell = ws.cell(row=cell.row, column=cell.column + 1)
-                formula_cell.value = formula
-                if numfmt:
-                    formula_cell.number_format = numfmt
-                return formula_cell
-    return None
-
-# ---------- libro ----------
-wb = Workbook()
+    cell = ws.buscar(label)  # índice etiqueta -> celda, O(1)
+    if cell is None:
+        return None
+    formula_cell = ws.cell(row=cell.row, column=cell.column + 1)
+    formula_cell.value = formula
+    if numfmt:
+        formula_cell.number_format = numfmt
+    return formula_cell
+
+# ---------- insumos ----------
+def tabla_escenarios(escenarios=None):
+    """Filas [nombre, f_H2, ..., f_TRATO2] a partir de una lista de filas o de {nombre: {f_*: v}}"""
+    if escenarios is None:
+        return [list(fila) for fila in mf.ESCENARIOS]
+    if isinstance(escenarios, dict):
+        filas = []
+        for nombre, f in escenarios.items():
+            if isinstance(f, dict):
+                faltan = set(mf.FACTORES) - set(f)
+                if faltan:
+                    raise ValueError(f"Escenario {nombre}: faltan multiplicadores {sorted(faltan)}")
+                f = [f[k] for k in mf.FACTORES]
+            filas.append([nombre] + [float(x) for x in f])
+    else:
+        filas = [[fila[0]] + [float(x) for x in fila[1:]] for fila in escenarios]
+    if not filas:
+        raise ValueError("Se requiere al menos un escenario")
+    for fila in filas:
+        if len(fila) != 1 + len(mf.FACTORES):
+            raise ValueError(f"Escenario {fila[0]}: se esperaban {len(mf.FACTORES)} multiplicadores")
+    return filas
+
+def validar_params(params):
+    """Sólo se aceptan nombres de Parametros y bases de Escenarios_v4"""
+    validos = {n for n, _, _, _ in mf.PARAMETROS} | {n for n, _, _ in mf.BASES}
+    desconocidos = set(params) - validos
+    if desconocidos:
+        raise ValueError(f"Parámetros desconocidos: {sorted(desconocidos)}")
 
 # ----------------------- Parametros -----------------------
-wsP = wb.active
-wsP.title = "Parametros"
-rows = [
-    ["Descripción", "Valor", "Unidad / Nota"],
-    ["Horizonte (años)", 15, "años"],
-    ["Tasa de descuento (WACC)", 0.08, "porcentaje"],
-    ["Inflación", 0.04, "porcentaje"],
-    ["CAPEX total inicial (MXN)", 84_300_000, "Incluye terreno (60% año 0 / 40% año 1)"],
-    ["Distribución CAPEX año 0", 0.60, "porcentaje"],
-    ["Distribución CAPEX año 1", 0.40, "porcentaje"],
-    ["Año reemplazo SAE", 10, "año"],
-    ["Costo reemplazo SAE (MXN)", 4_000_000, ""],
-    ["Valor residual terreno (MXN, año N)", 81_000_000, "año final"],
-    ["Ingresos H2 Año operativo 1 (MXN)", 12_600_000, "+2%/año"],
-    ["Ingresos O2 Año operativo 1 (MXN)", 6_720_000, "+2%/año"],
-    ["Ingresos FV/red Año operativo 1 (MXN)", 2_740_000, "-0.7%/año (FV=1.2 MW)"],
-    ["Ingresos carga EV Año operativo 1 (MXN)", 800_000, "+2%/año"],
-    ["Crecimiento H2", 0.02, "porcentaje"],
-    ["Crecimiento O2", 0.02, "porcentaje"],
-    ["Crecimiento FV/red", -0.007, "porcentaje"],
-    ["Crecimiento carga EV", 0.02, "porcentaje"],
-    ["OPEX Base Año operativo 1 (MXN)", 2_600_000, "+3%/año"],
-    ["Crecimiento OPEX Base", 0.03, "porcentaje"],
-    ["OPEX Logística H2 Año op 1 (MXN)", 4_900_000, "+3%/año"],
-    ["Crecimiento OPEX Logística H2", 0.03, "porcentaje"],
-    ["OPEX Tratamiento O2 Año op 1 (MXN)", 2_200_000, "+3%/año"],
-    ["Crecimiento OPEX Tratamiento O2", 0.03, "porcentaje"],
-    ["Año inicio de operación", 2, "año (0 y 1 = inversión)"],
-    ["Reserva liquidez (% OPEX Total)", 0.20, "optimización flujo de caja"],
-    ["Tasa interés línea de crédito", 0.06, "porcentaje"],
-]
-for r, row in enumerate(rows, start=1):
-    for c, val in enumerate(row, start=1):
-        wsP.cell(r, c, val)
-
-wsP["B2"].number_format = int_fmt
-for addr in ["B3","B4","B6","B7","B15","B16","B17","B18","B20","B22","B24","B26","B27"]:
-    wsP[addr].number_format = pct_fmt
-for addr in ["B5","B9","B10","B11","B12","B13","B14","B19","B21","B23"]:
-    wsP[addr].number_format = currency_fmt
-wsP["B8"].number_format = int_fmt
-for col in range(1, 4):
-    wsP.column_dimensions[get_column_letter(col)].width = 40
-for cell in wsP[1]:
-    cell.font = bold
-
-# nombres (para fórmulas entre hojas)
-define_name(wb, 'HORIZONTE', "Parametros!$B$2")
-define_name(wb, 'WACC', "Parametros!$B$3")
-define_name(wb, 'INFLACION', "Parametros!$B$4")
-define_name(wb, 'CAPEX', "Parametros!$B$5")
-define_name(wb, 'CAPEX0', "Parametros!$B$6")
-define_name(wb, 'CAPEX1', "Parametros!$B$7")
-define_name(wb, 'ANIO_REP', "Parametros!$B$8")
-define_name(wb, 'COSTO_REP', "Parametros!$B$9")
-define_name(wb, 'VALOR_TERRENO', "Parametros!$B$10")
-define_name(wb, 'ING_H2_1', "Parametros!$B$11")
-define_name(wb, 'ING_O2_1', "Parametros!$B$12")
-define_name(wb, 'ING_FV_1', "Parametros!$B$13")
-define_name(wb, 'ING_EV_1', "Parametros!$B$14")
-define_name(wb, 'G_H2', "Parametros!$B$15")
-define_name(wb, 'G_O2', "Parametros!$B$16")
-define_name(wb, 'G_FV', "Parametros!$B$17")
-define_name(wb, 'G_EV', "Parametros!$B$18")
-define_name(wb, 'OPEX_BASE_1', "Parametros!$B$19")
-define_name(wb, 'G_OPEX_BASE', "Parametros!$B$20")
-define_name(wb, 'OPEX_LOGH2_1', "Parametros!$B$21")
-define_name(wb, 'G_OPEX_LOGH2', "Parametros!$B$22")
-define_name(wb, 'OPEX_TRATO2_1', "Parametros!$B$23")
-define_name(wb, 'G_OPEX_TRATO2', "Parametros!$B$24")
-define_name(wb, 'ANIO_OP', "Parametros!$B$25")
-define_name(wb, 'RESERVA_PCT', "Parametros!$B$26")
-define_name(wb, 'TASA_CRED', "Parametros!$B$27")
+def hoja_parametros(wb, params):
+    wsP = wb.active
+    wsP.title = "Parametros"
+    rows = [["Descripción", "Valor", "Unidad / Nota"]]
+    rows += [[desc, params.get(nombre, valor), nota] for nombre, desc, valor, nota in mf.PARAMETROS]
+    for r, row in enumerate(rows, start=1):
+        for c, val in enumerate(row, start=1):
+            wsP.cell(r, c, val)
+
+    wsP["B2"].number_format = int_fmt
+    for addr in ["B3","B4","B6","B7","B15","B16","B17","B18","B20","B22","B24","B26","B27"]:
+        wsP[addr].number_format = pct_fmt
+    for addr in ["B5","B9","B10","B11","B12","B13","B14","B19","B21","B23"]:
+        wsP[addr].number_format = currency_fmt
+    wsP["B8"].number_format = int_fmt
+    for col in range(1, 4):
+        wsP.column_dimensions[get_column_letter(col)].width = 40
+    for cell in wsP[1]:
+        cell.font = bold
+
+    # nombres (para fórmulas entre hojas)
+    for r, (nombre, _, _, _) in enumerate(mf.PARAMETROS, start=2):
+        define_name(wb, nombre, f"Parametros!$B${r}")
+    return wsP
 
 # ----------------------- Escenarios_v4 -----------------------
-wsE = wb.create_sheet("Escenarios_v4")
-wsE.append(["Parámetro", "Valor Base (Año op 1)", "Unidad/Nota"])
-base_rows = [
-    ["ING_H2_BASE", 12600000, "MXN/año"],
-    ["ING_O2_BASE",  6720000, "MXN/año"],
-    ["ING_FV_BASE",  2740000, "MXN/año (FV=1.2 MW)"],
-    ["ING_EV_BASE",   800000, "MXN/año"],
-    ["OPEX_BASE_BASE",2600000, "MXN/año"],
-    ["LOGH2_BASE",   4900000, "MXN/año"],
-    ["TRATO2_BASE",  2200000, "MXN/año"],
-]
-for r in base_rows:
-    wsE.append(r)
-for c in wsE[1]:
-    c.font = bold
-    c.border = border_bottom
-for r in range(2, 2 + len(base_rows)):
-    wsE[f"B{r}"].number_format = currency_fmt
-wsE.column_dimensions["A"].width = 24
-wsE.column_dimensions["B"].width = 18
-wsE.column_dimensions["C"].width = 38
-
-wsE["E1"] = "Selector de escenario"; wsE["E1"].font = bold
-wsE["E2"] = "Base"
-wsE["G1"] = "Lista de escenarios"; wsE["G1"].font = bold
-wsE["G2"] = "Optimista"; wsE["G3"] = "Base"; wsE["G4"] = "Conservador"
-dv = DataValidation(type="list", formula1="=$G$2:$G$4")
-wsE.add_data_validation(dv); dv.add(wsE["E2"])
-
-wsE["A11"] = "Multiplicadores por escenario"; wsE["A11"].font = bold
-headers = ["Escenario","f_H2","f_O2","f_FV","f_EV","f_OPEX_BASE","f_LOGH2","f_TRATO2"]
-wsE.append(headers)
-for i,h in enumerate(headers, start=1):
-    wsE.cell(row=12, column=i).font = bold
-    wsE.cell(row=12, column=i).border = border_bottom
-mult = [
-    ["Optimista",   170/150, 12/10, 1.10, 1.10, 0.95, 0.85, 0.90],
-    ["Base",        1.00,    1.00,  1.00, 1.00, 1.00, 1.00, 1.00],
-    ["Conservador", 130/150,  8/10, 0.90, 0.90, 1.05, 1.15, 1.10],
-]
-for row in mult:
-    wsE.append(row)
-for r in range(13, 16):
-    for c in range(2, 9):
-        wsE.cell(row=r, column=c).number_format = '0.00'
-
-# Multiplicadores activos
-wsE["J1"] = "Multiplicadores activos"; wsE["J1"].font = bold
-labels = ["f_H2","f_O2","f_FV","f_EV","f_OPEX_BASE","f_LOGH2","f_TRATO2"]
-for i,lbl in enumerate(labels, start=1):
-    wsE.cell(row=1+i, column=10, value=lbl)
-    wsE.cell(row=1+i, column=11, value=f"=INDEX($B$13:$H$15, MATCH($E$2,$A$13:$A$15,0), {i+1})")
-
-# nombres
-define_name(wb, 'ING_H2_BASE',     "Escenarios_v4!$B$2")
-define_name(wb, 'ING_O2_BASE',     "Escenarios_v4!$B$3")
-define_name(wb, 'ING_FV_BASE',     "Escenarios_v4!$B$4")
-define_name(wb, 'ING_EV_BASE',     "Escenarios_v4!$B$5")
-define_name(wb, 'OPEX_BASE_BASE',  "Escenarios_v4!$B$6")
-define_name(wb, 'LOGH2_BASE',      "Escenarios_v4!$B$7")
-define_name(wb, 'TRATO2_BASE',     "Escenarios_v4!$B$8")
-define_name(wb, 'f_H2',            "Escenarios_v4!$K$2")
-define_name(wb, 'f_O2',            "Escenarios_v4!$K$3")
-define_name(wb, 'f_FV',            "Escenarios_v4!$K$4")
-define_name(wb, 'f_EV',            "Escenarios_v4!$K$5")
-define_name(wb, 'f_OPEX_BASE',     "Escenarios_v4!$K$6")
-define_name(wb, 'f_LOGH2',         "Escenarios_v4!$K$7")
-define_name(wb, 'f_TRATO2',        "Escenarios_v4!$K$8")
-
-# enlazar Parametros a multiplicadores
-set_formula_by_label(wsP, "Ingresos H2 Año operativo 1 (MXN)", "=ING_H2_BASE*f_H2", currency_fmt)
-set_formula_by_label(wsP, "Ingresos O2 Año operativo 1 (MXN)", "=ING_O2_BASE*f_O2", currency_fmt)
-set_formula_by_label(wsP, "Ingresos FV/red Año operativo 1 (MXN)", "=ING_FV_BASE*f_FV", currency_fmt)
-set_formula_by_label(wsP, "Ingresos carga EV Año operativo 1 (MXN)", "=ING_EV_BASE*f_EV", currency_fmt)
-set_formula_by_label(wsP, "OPEX Base Año operativo 1 (MXN)", "=OPEX_BASE_BASE*f_OPEX_BASE", currency_fmt)
-set_formula_by_label(wsP, "OPEX Logística H2 Año op 1 (MXN)", "=LOGH2_BASE*f_LOGH2", currency_fmt)
-set_formula_by_label(wsP, "OPEX Tratamiento O2 Año op 1 (MXN)", "=TRATO2_BASE*f_TRATO2", currency_fmt)
+def hoja_escenarios(wb, wsP, params, tabla, activo):
+    wsE = wb.create_sheet("Escenarios_v4")
+    wsE.append(["Parámetro", "Valor Base (Año op 1)", "Unidad/Nota"])
+    base_rows = [[nombre, params.get(nombre, valor), nota] for nombre, valor, nota in mf.BASES]
+    for r in base_rows:
+        wsE.append(r)
+    for c in wsE[1]:
+        c.font = bold
+        c.border = border_bottom
+    for r in range(2, 2 + len(base_rows)):
+        wsE[f"B{r}"].number_format = currency_fmt
+    wsE.column_dimensions["A"].width = 24
+    wsE.column_dimensions["B"].width = 18
+    wsE.column_dimensions["C"].width = 38
+
+    fin = 12 + len(tabla)  # la tabla de multiplicadores ocupa las filas 13..fin
+    wsE["E1"] = "Selector de escenario"; wsE["E1"].font = bold
+    wsE["E2"] = activo
+    if len(tabla) <= 9:
+        wsE["G1"] = "Lista de escenarios"; wsE["G1"].font = bold
+        for i, fila in enumerate(tabla, start=2):
+            wsE[f"G{i}"] = fila[0]
+        dv = DataValidation(type="list", formula1=f"=$G$2:$G${1 + len(tabla)}")
+    else:  # la lista chocaría con la tabla de multiplicadores: se usa su columna A
+        dv = DataValidation(type="list", formula1=f"=$A$13:$A${fin}")
+    wsE.add_data_validation(dv); dv.add(wsE["E2"])
+
+    wsE["A11"] = "Multiplicadores por escenario"; wsE["A11"].font = bold
+    headers = ["Escenario","f_H2","f_O2","f_FV","f_EV","f_OPEX_BASE","f_LOGH2","f_TRATO2"]
+    # filas fijas (no append): la tabla siempre empieza en la fila 13
+    for i,h in enumerate(headers, start=1):
+        wsE.cell(row=12, column=i, value=h).font = bold
+        wsE.cell(row=12, column=i).border = border_bottom
+    for r, row in enumerate(tabla, start=13):
+        for c, val in enumerate(row, start=1):
+            wsE.cell(r, c, val)
+    for r in range(13, fin + 1):
+        for c in range(2, 9):
+            wsE.cell(row=r, column=c).number_format = '0.00'
+
+    # Multiplicadores activos
+    wsE["J1"] = "Multiplicadores activos"; wsE["J1"].font = bold
+    labels = mf.FACTORES
+    for i,lbl in enumerate(labels, start=1):
+        wsE.cell(row=1+i, column=10, value=lbl)
+        wsE.cell(row=1+i, column=11, value=f"=INDEX($B$13:$H${fin}, MATCH($E$2,$A$13:$A${fin},0), {i})")
+
+    # nombres
+    for r, (nombre, _, _) in enumerate(mf.BASES, start=2):
+        define_name(wb, nombre, f"Escenarios_v4!$B${r}")
+    for r, nombre in enumerate(mf.FACTORES, start=2):
+        define_name(wb, nombre, f"Escenarios_v4!$K${r}")
+
+    # enlazar Parametros a multiplicadores (salvo los fijados explícitamente en params)
+    desc = {nombre: d for nombre, d, _, _ in mf.PARAMETROS}
+    for nombre, base, f in mf.VINCULOS:
+        if nombre not in params:
+            set_formula_by_label(wsP, desc[nombre], f"={base}*{f}", currency_fmt)
+    return wsE
 
 # ----------------------- Flujo_Base -----------------------
-wsF = wb.create_sheet("Flujo_Base")
-headers = [
-    "Año","Ingresos H2","Ingresos O2","Ingresos FV/red","Ingresos EV",
-    "Ingresos totales","OPEX Base","OPEX Log H2","OPEX Trat O2","OPEX Total",
-    "CAPEX/Reemplazos","Valor residual",
-    "Flujo neto","Factor descuento","Flujo descontado","VAN acumulado"
-]
-wsF.append(headers)
-for c in wsF[1]:
-    c.font = bold
-    c.alignment = Alignment(horizontal="center")
-
-H = wsP["B2"].value  # horizonte
-for r in range(2, 2 + H + 1):
-    wsF.cell(r, 1, r - 2)
-
-# Año 0
-wsF["B2"]="=0"; wsF["C2"]="=0"; wsF["D2"]="=0"; wsF["E2"]="=0"; wsF["F2"]="=0"
-wsF["G2"]="=0"; wsF["H2"]="=0"; wsF["I2"]="=0"; wsF["J2"]="=0"
-wsF["K2"]="=CAPEX*CAPEX0"; wsF["L2"]="=0"
-wsF["M2"]="=F2-J2-K2+L2"
-wsF["N2"]="=(1+WACC)^A2"; wsF["O2"]="=M2/N2"; wsF["P2"]="=O2"
-
-# Años >=1
-for r in range(3, 2 + H + 1):
-    wsF[f"B{r}"]=f"=IF(A{r}<ANIO_OP,0,ING_H2_1*(1+G_H2)^(A{r}-ANIO_OP))"
-    wsF[f"C{r}"]=f"=IF(A{r}<ANIO_OP,0,ING_O2_1*(1+G_O2)^(A{r}-ANIO_OP))"
-    wsF[f"D{r}"]=f"=IF(A{r}<ANIO_OP,0,ING_FV_1*(1+G_FV)^(A{r}-ANIO_OP))"
-    wsF[f"E{r}"]=f"=IF(A{r}<ANIO_OP,0,ING_EV_1*(1+G_EV)^(A{r}-ANIO_OP))"
-    wsF[f"F{r}"]=f"=SUM(B{r}:E{r})"
-    wsF[f"G{r}"]=f"=IF(A{r}<ANIO_OP,0,OPEX_BASE_1*(1+G_OPEX_BASE)^(A{r}-ANIO_OP))"
-    wsF[f"H{r}"]=f"=IF(A{r}<ANIO_OP,0,OPEX_LOGH2_1*(1+G_OPEX_LOGH2)^(A{r}-ANIO_OP))"
-    wsF[f"I{r}"]=f"=IF(A{r}<ANIO_OP,0,OPEX_TRATO2_1*(1+G_OPEX_TRATO2)^(A{r}-ANIO_OP))"
-    wsF[f"J{r}"]=f"=G{r}+H{r}+I{r}"
-    wsF[f"K{r}"]=f"=IF(A{r}=1,CAPEX*CAPEX1,IF(A{r}=ANIO_REP,COSTO_REP,0))"
-    wsF[f"L{r}"]=f"=IF(A{r}=HORIZONTE,VALOR_TERRENO,0)"
-    wsF[f"M{r}"]=f"=F{r}-J{r}-K{r}+L{r}"
-    wsF[f"N{r}"]=f"=(1+WACC)^A{r}"
-    wsF[f"O{r}"]=f"=M{r}/N{r}"
-    wsF[f"P{r}"]=f"=P{r-1}+O{r}"
-
-money_cols = "BCDEFGHIJKLMOP"
-for col in money_cols:
-    for r in range(2, 2+H+1):
-        wsF[f"{col}{r}"].number_format = currency_fmt
-for r in range(2, 2+H+1):
-    wsF[f"N{r}"].number_format = '0.0000'
-widths = [6,18,18,18,16,18,16,16,16,16,18,16,18,14,18,18]
-for i,w in enumerate(widths, start=1):
-    wsF.column_dimensions[get_column_letter(i)].width = w
-wsF.freeze_panes = "A2"
+def fila_flujo(r):
+    if r == 2:  # Año 0
+        return [0, "=0", "=0", "=0", "=0", "=0", "=0", "=0", "=0", "=0",
+                "=CAPEX*CAPEX0", "=0", "=F2-J2-K2+L2", "=(1+WACC)^A2", "=M2/N2", "=O2"]
+    # Años >=1
+    return [
+        r - 2,
+        f"=IF(A{r}<ANIO_OP,0,ING_H2_1*(1+G_H2)^(A{r}-ANIO_OP))",
+        f"=IF(A{r}<ANIO_OP,0,ING_O2_1*(1+G_O2)^(A{r}-ANIO_OP))",
+        f"=IF(A{r}<ANIO_OP,0,ING_FV_1*(1+G_FV)^(A{r}-ANIO_OP))",
+        f"=IF(A{r}<ANIO_OP,0,ING_EV_1*(1+G_EV)^(A{r}-ANIO_OP))",
+        f"=SUM(B{r}:E{r})",
+        f"=IF(A{r}<ANIO_OP,0,OPEX_BASE_1*(1+G_OPEX_BASE)^(A{r}-ANIO_OP))",
+        f"=IF(A{r}<ANIO_OP,0,OPEX_LOGH2_1*(1+G_OPEX_LOGH2)^(A{r}-ANIO_OP))",
+        f"=IF(A{r}<ANIO_OP,0,OPEX_TRATO2_1*(1+G_OPEX_TRATO2)^(A{r}-ANIO_OP))",
+        f"=G{r}+H{r}+I{r}",
+        f"=IF(A{r}=1,CAPEX*CAPEX1,IF(A{r}=ANIO_REP,COSTO_REP,0))",
+        f"=IF(A{r}=HORIZONTE,VALOR_TERRENO,0)",
+        f"=F{r}-J{r}-K{r}+L{r}",
+        f"=(1+WACC)^A{r}",
+        f"=M{r}/N{r}",
+        f"=P{r-1}+O{r}",
+    ]
+
+def hoja_flujo_base(wb, H, columnas_perfil=None):
+    """Flujo_Base; las series en `columnas_perfil` ({clave: columna de Perfiles}) leen el perfil"""
+    wsF = wb.create_sheet("Flujo_Base")
+    headers = [
+        "Año","Ingresos H2","Ingresos O2","Ingresos FV/red","Ingresos EV",
+        "Ingresos totales","OPEX Base","OPEX Log H2","OPEX Trat O2","OPEX Total",
+        "CAPEX/Reemplazos","Valor residual",
+        "Flujo neto","Factor descuento","Flujo descontado","VAN acumulado"
+    ]
+    wsF.append(headers)
+    for c in wsF[1]:
+        c.font = bold
+        c.alignment = Alignment(horizontal="center")
+
+    money_cols = "BCDEFGHIJKLMOP"
+    estilosF = {column_index_from_string(col): {"number_format": currency_fmt} for col in money_cols}
+    estilosF[14] = {"number_format": '0.0000'}
+    generador = fila_flujo
+    if columnas_perfil:
+        def generador(r):
+            fila = fila_flujo(r)
+            if r > 2:
+                for clave, col in columnas_perfil.items():
+                    fila[mf.COLUMNAS_FLUJO.index(clave)] = formula_serie(r, clave, col)
+            return fila
+    wsF.bloque(2, H + 1, generador, estilosF)
+    widths = [6,18,18,18,16,18,16,16,16,16,18,16,18,14,18,18]
+    for i,w in enumerate(widths, start=1):
+        wsF.column_dimensions[get_column_letter(i)].width = w
+    wsF.freeze_panes = "A2"
+    return wsF
 
 # ----------------------- Optimizacion_Flujo -----------------------
-wsO = wb.create_sheet("Optimizacion_Flujo")
-headersO = ["Año","Flujo neto base","OPEX Total","Reserva requerida","Δ Reserva","Liquidez inicial",
-            "Préstamo necesario","Interés deuda","Liquidez final","Deuda acumulada"]
-wsO.append(headersO)
-for c in wsO[1]:
-    c.font = bold
-    c.alignment = Alignment(horizontal="center")
-for r in range(2, 2+H+1):
-    wsO.cell(r, 1, r - 2)
-
-wsO["B2"]="=Flujo_Base!M2"
-wsO["C2"]="=Flujo_Base!J2"
-wsO["D2"]="=C2*RESERVA_PCT"
-wsO["E2"]="=D2"
-wsO["F2"]="=0"
-wsO["G2"]="=MAX(0, -(F2 + B2 - E2))"
-wsO["H2"]="=0"
-wsO["I2"]="=F2 + B2 - E2 + G2 - H2"
-wsO["J2"]="=G2"
-
-for r in range(3, 2+H+1):
-    wsO[f"B{r}"]=f"=Flujo_Base!M{r}"
-    wsO[f"C{r}"]=f"=Flujo_Base!J{r}"
-    wsO[f"D{r}"]=f"=C{r}*RESERVA_PCT"
-    wsO[f"E{r}"]=f"=D{r}-D{r-1}"
-    wsO[f"F{r}"]=f"=I{r-1}"
-    wsO[f"G{r}"]=f"=MAX(0, -(F{r} + B{r} - E{r}))"
-    wsO[f"H{r}"]=f"=J{r-1}*TASA_CRED"
-    wsO[f"I{r}"]=f"=F{r} + B{r} - E{r} + G{r} - H{r}"
-    wsO[f"J{r}"]=f"=J{r-1} + G{r} + H{r}"
-
-for col in "BCDEFGHIJ":
-    for r in range(2, 2+H+1):
-        wsO[f"{col}{r}"].number_format = currency_fmt
-wsO.column_dimensions["A"].width = 6
-for col in "BCDEFGHIJ":
-    wsO.column_dimensions[col].width = 18
-wsO.freeze_panes = "A2"
+def fila_optimizacion(r):
+    if r == 2:
+        return [0, "=Flujo_Base!M2", "=Flujo_Base!J2", "=C2*RESERVA_PCT", "=D2", "=0",
+                "=MAX(0, -(F2 + B2 - E2))", "=0", "=F2 + B2 - E2 + G2 - H2", "=G2"]
+    return [
+        r - 2,
+        f"=Flujo_Base!M{r}",
+        f"=Flujo_Base!J{r}",
+        f"=C{r}*RESERVA_PCT",
+        f"=D{r}-D{r-1}",
+        f"=I{r-1}",
+        f"=MAX(0, -(F{r} + B{r} - E{r}))",
+        f"=J{r-1}*TASA_CRED",
+        f"=F{r} + B{r} - E{r} + G{r} - H{r}",
+        f"=J{r-1} + G{r} + H{r}",
+    ]
+
+def hoja_optimizacion(wb, H, politica=None):
+    wsO = wb.create_sheet("Optimizacion_Flujo")
+    headersO = ["Año","Flujo neto base","OPEX Total","Reserva requerida","Δ Reserva","Liquidez inicial",
+                "Préstamo necesario","Interés deuda","Liquidez final","Deuda acumulada"]
+    wsO.append(headersO)
+    for c in wsO[1]:
+        c.font = bold
+        c.alignment = Alignment(horizontal="center")
+
+    wsO.bloque(2, H + 1, fila_optimizacion,
+               {column_index_from_string(col): {"number_format": currency_fmt} for col in "BCDEFGHIJ"})
+    wsO.column_dimensions["A"].width = 6
+    for col in "BCDEFGHIJ":
+        wsO.column_dimensions[col].width = 18
+    wsO.freeze_panes = "A2"
+    if politica:
+        escribir_politica(wsO, politica)
+    return wsO
 
 # ----------------------- Indicadores -----------------------
-wsI = wb.create_sheet("Indicadores")
-wsI.append(["Año","VAN acumulado (Flujo_Base)","TIR acumulada"])
-for c in wsI[1]:
-    c.font = bold
-    c.alignment = Alignment(horizontal="center")
-for r in range(2, 2+H+1):
-    wsI.cell(r, 1, r - 2)
-    wsI[f"B{r}"]=f"=Flujo_Base!P{r}"
-    wsI[f"C{r}"]=f"=IF(A{r}=0,NA(),IRR(Flujo_Base!M$2:INDEX(Flujo_Base!M:M, A{r}+2)))"
-wsI.column_dimensions["A"].width = 6
-wsI.column_dimensions["B"].width = 24
-wsI.column_dimensions["C"].width = 18
+def hoja_indicadores(wb, H, kpiI, tir_formulas):
+    wsI = wb.create_sheet("Indicadores")
+    wsI.append(["Año","VAN acumulado (Flujo_Base)","TIR acumulada","Estado TIR","",
+                "Payback descontado (años, interpolado)"])
+    for c in wsI[1]:
+        c.font = bold
+        c.alignment = Alignment(horizontal="center")
+    # TIR de todos los prefijos y payback interpolado en una sola pasada (solver_tir)
+    def fila_indicadores(r):
+        j = r - 2
+        if tir_formulas:
+            tir = f"=IF(A{r}=0,NA(),IRR(Flujo_Base!M$2:INDEX(Flujo_Base!M:M, A{r}+2)))"
+        else:
+            tir = None if j == 0 or np.isnan(kpiI["tir_prefijos"][0, j]) else float(kpiI["tir_prefijos"][0, j])
+        return [j, f"=Flujo_Base!P{r}", tir, ESTADOS[kpiI["estado_prefijos"][0, j]]]
+
+    wsI.bloque(2, H + 1, fila_indicadores, {3: {"number_format": pct_fmt}})
+    payback_i = kpiI["payback"][0]
+    wsI["F2"] = None if np.isnan(payback_i) else float(payback_i)
+    wsI["F2"].number_format = '0.00'
+    wsI.column_dimensions["A"].width = 6
+    wsI.column_dimensions["B"].width = 24
+    wsI.column_dimensions["C"].width = 18
+    wsI.column_dimensions["D"].width = 26
+    wsI.column_dimensions["F"].width = 36
+    return wsI
 
 # ----------------------- Dashboard (gráficos) -----------------------
-wsD = wb.create_sheet("Dashboard")
-wsD["A1"]="Resumen Ejecutivo – ElectroHub (v4.1a con logística H2/O2, FV=1.2 MW y escenarios)"
-wsD["A1"].font = Font(bold=True, size=13)
-wsD.column_dimensions["A"].width = 100
-
-# Flujo Neto
-ch1 = LineChart(); ch1.title="Flujo Neto Anual"; ch1.y_axis.title="MXN"; ch1.x_axis.title="Año"
-ch1.add_data(Reference(wsF, min_col=13, min_row=1, max_row=2+H), titles_from_data=True)
-ch1.set_categories(Reference(wsF, min_col=1, min_row=2, max_row=2+H))
-wsD.add_chart(ch1, "A3")
-
-# Liquidez
-ch2 = LineChart(); ch2.title="Liquidez Final por Año"; ch2.y_axis.title="MXN"; ch2.x_axis.title="Año"
-ch2.add_data(Reference(wsO, min_col=9, min_row=1, max_row=2+H), titles_from_data=True)
-ch2.set_categories(Reference(wsO, min_col=1, min_row=2, max_row=2+H))
-wsD.add_chart(ch2, "A20")
-
-# VAN acumulado
-ch3 = LineChart(); ch3.title="VAN Acumulado"; ch3.y_axis.title="MXN"; ch3.x_axis.title="Año"
-ch3.add_data(Reference(wsI, min_col=2, min_row=1, max_row=2+H), titles_from_data=True)
-ch3.set_categories(Reference(wsI, min_col=1, min_row=2, max_row=2+H))
-wsD.add_chart(ch3, "M3")
-
-# OPEX Total
-ch4 = LineChart(); ch4.title="OPEX Total"; ch4.y_axis.title="MXN"; ch4.x_axis.title="Año"
-ch4.add_data(Reference(wsF, min_col=10, min_row=1, max_row=2+H), titles_from_data=True)
-ch4.set_categories(Reference(wsF, min_col=1, min_row=2, max_row=2+H))
-wsD.add_chart(ch4, "M20")
-
-# ----------------------- KPIs_Escenarios -----------------------
-wsK = wb.create_sheet("KPIs_Escenarios")
-wsK.append(["Escenario","VAN (MXN)","TIR","Payback (años)","PI"])
-for c in wsK[1]:
-    c.font = bold
-    c.border = border_bottom
-
-wsK.append(["Año","Flujo_Optimista","Flujo_Base","Flujo_Conservador"])
-for i in range(4):
-    wsK.cell(2, 1+i).font = bold
-for r in range(3, 3+16):
-    wsK.cell(r, 1, r - 3)
-
-# Multiplicadores por escenario (helpers en columnas G..I)
-wsK["G2"]="Optimista"; wsK["G2"].font=bold
-for i in range(7):
-    wsK.cell(3+i,7, f"=INDEX(Escenarios_v4!$B$13:$H$15, MATCH($G$2,Escenarios_v4!$A$13:$A$15,0), {i+2})")
-wsK["H2"]="Base"; wsK["H2"].font=bold
-for i in range(7):
-    wsK.cell(3+i,8, 1)  # Base = 1
-wsK["I2"]="Conservador"; wsK["I2"].font=bold
-for i in range(7):
-    wsK.cell(3+i,9, f"=INDEX(Escenarios_v4!$B$13:$H$15, MATCH($I$2,Escenarios_v4!$A$13:$A$15,0), {i+2})")
-
-def set_flow_col(col_letter, base_col_letter):
-    # col_letter: B/C/D; base_col_letter: G/H/I
-    for r in range(3, 3+16):
-        wsK[f"{col_letter}{r}"] = (
-            f"=IF(A{r}<ANIO_OP,0,"
-            f"(Escenarios_v4!$B$2*{base_col_letter}$3*(1+G_H2)^(A{r}-ANIO_OP)"
-            f"+Escenarios_v4!$B$3*{base_col_letter}$4*(1+G_O2)^(A{r}-ANIO_OP)"
-            f"+Escenarios_v4!$B$4*{base_col_letter}$5*(1+G_FV)^(A{r}-ANIO_OP)"
-            f"+Escenarios_v4!$B$5*{base_col_letter}$6*(1+G_EV)^(A{r}-ANIO_OP))"
-            f"-(Escenarios_v4!$B$6*{base_col_letter}$7*(1+G_OPEX_BASE)^(A{r}-ANIO_OP)"
-            f"+Escenarios_v4!$B$7*{base_col_letter}$8*(1+G_OPEX_LOGH2)^(A{r}-ANIO_OP)"
-            f"+Escenarios_v4!$B$8*{base_col_letter}$9*(1+G_OPEX_TRATO2)^(A{r}-ANIO_OP)))"
-            f"+IF(A{r}=0,CAPEX*CAPEX0,IF(A{r}=1,CAPEX*CAPEX1,IF(A{r}=ANIO_REP,COSTO_REP,0)))*(-1)"
-            f"+IF(A{r}=HORIZONTE,VALOR_TERRENO,0)"
-            f")"
-        )
-
-set_flow_col("B","G")  # Optimista
-set_flow_col("C","H")  # Base
-set_flow_col("D","I")  # Conservador
-
-# KPIs (incluye año 0 en la serie para IRR y VAN)
-wsK["A20"] = "KPIs por Escenario"; wsK["A20"].font = bold
-wsK["A21"] = "Optimista"; wsK["A22"] = "Base"; wsK["A23"] = "Conservador"
-
-wsK["B21"] = "=NPV(WACC, B4:B19) + B3"
-wsK["B22"] = "=NPV(WACC, C4:C19) + C3"
-wsK["B23"] = "=NPV(WACC, D4:D19) + D3"
-wsK["C21"] = "=IRR(B3:B19)"; wsK["C22"] = "=IRR(C3:C19)"; wsK["C23"] = "=IRR(D3:D19)"
-
-# Payback robusto con flujos descontados acumulados (helpers E..K)
-wsK["E19"] = "Helper (desc & cum)"; wsK["E19"].font = bold
-wsK["E20"] = "Año"; wsK["F20"] = "B_desc"; wsK["G20"] = "B_cum"; wsK["H20"] = "C_desc"; wsK["I20"] = "C_cum"; wsK["J20"] = "D_desc"; wsK["K20"] = "D_cum"
-for c in "EFGHIJK":
-    wsK[f"{c}20"].font = bold
-for r in range(21, 21+16):
-    wsK.cell(r,5, r-21)  # Año
-    wsK[f"F{r}"] = f"=B{r-17}/(1+WACC)^E{r}"
-    wsK[f"G{r}"] = f"=IF(E{r}=0, F{r}, G{r-1}+F{r})"
-    wsK[f"H{r}"] = f"=C{r-17}/(1+WACC)^E{r}"
-    wsK[f"I{r}"] = f"=IF(E{r}=0, H{r}, I{r-1}+H{r})"
-    wsK[f"J{r}"] = f"=D{r-17}/(1+WACC)^E{r}"
-    wsK[f"K{r}"] = f"=IF(E{r}=0, J{r}, K{r-1}+J{r})"
-
-wsK["D21"] = "=MATCH(TRUE,INDEX(G21:G36>=0,0),0)-1"
-wsK["D22"] = "=MATCH(TRUE,INDEX(I21:I36>=0,0),0)-1"
-wsK["D23"] = "=MATCH(TRUE,INDEX(K21:K36>=0,0),0)-1"
-
-for r in [21,22,23]:
-    wsK[f"B{r}"].number_format = currency_fmt
-    wsK[f"C{r}"].number_format = '0.00%'
-    wsK[f"D{r}"].number_format = '0.0'
-wsK["E20"] = "PI"; wsK["E20"].font = bold
-wsK["E21"] = "=NPV(WACC,B4:B19)/ABS(B3)"
-wsK["E22"] = "=NPV(WACC,C4:C19)/ABS(C3)"
-wsK["E23"] = "=NPV(WACC,D4:D19)/ABS(D3)"
-
-# Gráfico VAN por escenario
-chart = BarChart()
-chart.title = "VAN por escenario"
-chart.add_data(Reference(wsK, min_col=2, min_row=20, max_row=23), titles_from_data=True)
-chart.set_categories(Reference(wsK, min_col=1, min_row=21, max_row=23))
-wsK.add_chart(chart, "M3")
+def hoja_dashboard(wb, H, wsF, wsO, wsI):
+    wsD = wb.create_sheet("Dashboard")
+    wsD["A1"]="Resumen Ejecutivo – ElectroHub (v4.1a con logística H2/O2, FV=1.2 MW y escenarios)"
+    wsD["A1"].font = Font(bold=True, size=13)
+    wsD.column_dimensions["A"].width = 100
+
+    # Flujo Neto
+    ch1 = LineChart(); ch1.title="Flujo Neto Anual"; ch1.y_axis.title="MXN"; ch1.x_axis.title="Año"
+    ch1.add_data(Reference(wsF, min_col=13, min_row=1, max_row=2+H), titles_from_data=True)
+    ch1.set_categories(Reference(wsF, min_col=1, min_row=2, max_row=2+H))
+    wsD.add_chart(ch1, "A3")
+
+    # Liquidez
+    ch2 = LineChart(); ch2.title="Liquidez Final por Año"; ch2.y_axis.title="MXN"; ch2.x_axis.title="Año"
+    ch2.add_data(Reference(wsO, min_col=9, min_row=1, max_row=2+H), titles_from_data=True)
+    ch2.set_categories(Reference(wsO, min_col=1, min_row=2, max_row=2+H))
+    wsD.add_chart(ch2, "A20")
+
+    # VAN acumulado
+    ch3 = LineChart(); ch3.title="VAN Acumulado"; ch3.y_axis.title="MXN"; ch3.x_axis.title="Año"
+    ch3.add_data(Reference(wsI, min_col=2, min_row=1, max_row=2+H), titles_from_data=True)
+    ch3.set_categories(Reference(wsI, min_col=1, min_row=2, max_row=2+H))
+    wsD.add_chart(ch3, "M3")
+
+    # OPEX Total
+    ch4 = LineChart(); ch4.title="OPEX Total"; ch4.y_axis.title="MXN"; ch4.x_axis.title="Año"
+    ch4.add_data(Reference(wsF, min_col=10, min_row=1, max_row=2+H), titles_from_data=True)
+    ch4.set_categories(Reference(wsF, min_col=1, min_row=2, max_row=2+H))
+    wsD.add_chart(ch4, "M20")
+    return wsD
 
 # ----------------------- Resumen_Anual -----------------------
-wsR = wb.create_sheet("Resumen_Anual")
-headers = ["Año","H₂ (MXN)","O₂ (MXN)","FV/red (MXN)","EV (MXN)",
-           "Ingresos totales (MXN)","OPEX Base","OPEX Log H₂","OPEX Trat O₂","OPEX Total",
-           "CAPEX/Reemplazos","Valor residual","Flujo neto","VAN acumulado",
-           "Liquidez final","Deuda acumulada"]
-wsR.append(headers)
-for c in wsR[1]:
-    c.font = bold
-    c.alignment = Alignment(horizontal="center")
-    c.border = border_bottom
-for r in range(2, 2+H+1):
-    yr = r - 2
-    wsR.cell(r,1, yr)
-    wsR[f"B{r}"] = f"=Flujo_Base!B{r}"
-    wsR[f"C{r}"] = f"=Flujo_Base!C{r}"
-    wsR[f"D{r}"] = f"=Flujo_Base!D{r}"
-    wsR[f"E{r}"] = f"=Flujo_Base!E{r}"
-    wsR[f"F{r}"] = f"=Flujo_Base!F{r}"
-    wsR[f"G{r}"] = f"=Flujo_Base!G{r}"
-    wsR[f"H{r}"] = f"=Flujo_Base!H{r}"
-    wsR[f"I{r}"] = f"=Flujo_Base!I{r}"
-    wsR[f"J{r}"] = f"=Flujo_Base!J{r}"
-    wsR[f"K{r}"] = f"=Flujo_Base!K{r}"
-    wsR[f"L{r}"] = f"=Flujo_Base!L{r}"
-    wsR[f"M{r}"] = f"=Flujo_Base!M{r}"
-    wsR[f"N{r}"] = f"=Flujo_Base!P{r}"
-    wsR[f"O{r}"] = f"=Optimizacion_Flujo!I{r}"
-    wsR[f"P{r}"] = f"=Optimizacion_Flujo!J{r}"
-for col in range(2, 16+1):
-    wsR.column_dimensions[get_column_letter(col)].width = 18
-    for r in range(2, 2+H+1):
-        wsR[f"{get_column_letter(col)}{r}"].number_format = currency_fmt
-wsR.column_dimensions["A"].width = 6
-wsR.freeze_panes = "A2"
+def fila_resumen(r):
+    # B..M replican Flujo_Base; N = VAN acumulado; O/P = liquidez y deuda
+    return ([r - 2] + [f"=Flujo_Base!{get_column_letter(c)}{r}" for c in range(2, 14)]
+            + [f"=Flujo_Base!P{r}", f"=Optimizacion_Flujo!I{r}", f"=Optimizacion_Flujo!J{r}"])
+
+def hoja_resumen(wb, H):
+    wsR = wb.create_sheet("Resumen_Anual")
+    headers = ["Año","H₂ (MXN)","O₂ (MXN)","FV/red (MXN)","EV (MXN)",
+               "Ingresos totales (MXN)","OPEX Base","OPEX Log H₂","OPEX Trat O₂","OPEX Total",
+               "CAPEX/Reemplazos","Valor residual","Flujo neto","VAN acumulado",
+               "Liquidez final","Deuda acumulada"]
+    wsR.append(headers)
+    for c in wsR[1]:
+        c.font = bold
+        c.alignment = Alignment(horizontal="center")
+        c.border = border_bottom
+
+    wsR.bloque(2, H + 1, fila_resumen, {col: {"number_format": currency_fmt} for col in range(2, 16+1)})
+    for col in range(2, 16+1):
+        wsR.column_dimensions[get_column_letter(col)].width = 18
+    wsR.column_dimensions["A"].width = 6
+    wsR.freeze_panes = "A2"
+    return wsR
 
 # ----------------------- Seguridad_H2 -----------------------
-wsS = wb.create_sheet("Seguridad_H2")
-wsS["A1"] = "Parámetros de seguridad y flashback – Hidrógeno (H₂)"; wsS["A1"].font = bold
-wsS["A3"] = "Velocidad laminar de combustión (Su)"; wsS["B3"] = 2.86; wsS["C3"] = "m/s (≈286 cm/s)"
-wsS["A5"] = "Normas recomendadas"; wsS["A5"].font = bold
-wsS["A6"] = "ISO 5175-1"; wsS["B6"] = "Arrestadores de retroceso (estaciones/puntos de uso)"
-wsS["A7"] = "ISO 16852"; wsS["B7"] = "Apagallamas en líneas/venteos (deflagración/detonación)"
-wsS["A8"] = "NFPA 2 / CGA G-5.5"; wsS["B8"] = "Distancias/criterios de seguridad y venteo"
-wsS.column_dimensions["A"].width = 36; wsS.column_dimensions["B"].width = 90; wsS.column_dimensions["C"].width = 34
+def hoja_seguridad(wb):
+    wsS = wb.create_sheet("Seguridad_H2")
+    wsS["A1"] = "Parámetros de seguridad y flashback – Hidrógeno (H₂)"; wsS["A1"].font = bold
+    wsS["A3"] = "Velocidad laminar de combustión (Su)"; wsS["B3"] = 2.86; wsS["C3"] = "m/s (≈286 cm/s)"
+    wsS["A5"] = "Normas recomendadas"; wsS["A5"].font = bold
+    wsS["A6"] = "ISO 5175-1"; wsS["B6"] = "Arrestadores de retroceso (estaciones/puntos de uso)"
+    wsS["A7"] = "ISO 16852"; wsS["B7"] = "Apagallamas en líneas/venteos (deflagración/detonación)"
+    wsS["A8"] = "NFPA 2 / CGA G-5.5"; wsS["B8"] = "Distancias/criterios de seguridad y venteo"
+    wsS.column_dimensions["A"].width = 36; wsS.column_dimensions["B"].width = 90; wsS.column_dimensions["C"].width = 34
+    return wsS
 
 # ----------------------- Instrucciones -----------------------
-wsIns = wb.create_sheet("Instrucciones")
-wsIns["A1"]="Cómo usar la plantilla v4.1a"; wsIns["A1"].font = bold
-steps=[
-"1) Elige escenario en Escenarios_v4 (Optimista/Base/Conservador).",
-"2) Parametros toma automáticamente los valores iniciales × multiplicadores del escenario.",
-"3) Flujo_Base y Optimizacion_Flujo se recalculan por fórmula; no edites manualmente celdas calculadas.",
-"4) KPIs_Escenarios compara VAN/TIR/Payback/PI de los 3 escenarios en paralelo (con payback robusto).",
-"5) Resumen_Anual lista por año ingresos, OPEX por componente, flujo neto, VAN, liquidez y deuda.",
-"6) Seguridad_H2 contiene el dato de flashback (Su=2.86 m/s) y normas de referencia (ISO/NFPA/CGA)."
-]
-for i,t in enumerate(steps, start=3):
-    wsIns.cell(i,1,t)
-wsIns.column_dimensions["A"].width = 120
-
-# Guardar
-salida = "Flujo_Caja_ElectroHub_v4_1a.xlsx"
-wb.save(salida)
-print(f"OK -> {salida}")
+def hoja_instrucciones(wb):
+    wsIns = wb.create_sheet("Instrucciones")
+    wsIns["A1"]="Cómo usar la plantilla v4.1a"; wsIns["A1"].font = bold
+    steps=[
+    "1) Elige escenario en Escenarios_v4 (Optimista/Base/Conservador).",
+    "2) Parametros toma automáticamente los valores iniciales × multiplicadores del escenario.",
+    "3) Flujo_Base y Optimizacion_Flujo se recalculan por fórmula; no edites manualmente celdas calculadas.",
+    "4) KPIs_Escenarios compara VAN/TIR/Payback/PI de todos los escenarios en paralelo (con payback robusto).",
+    "5) Resumen_Anual lista por año ingresos, OPEX por componente, flujo neto, VAN, liquidez y deuda.",
+    "6) Seguridad_H2 contiene el dato de flashback (Su=2.86 m/s) y normas de referencia (ISO/NFPA/CGA)."
+    ]
+    for i,t in enumerate(steps, start=3):
+        wsIns.cell(i,1,t)
+    wsIns.column_dimensions["A"].width = 120
+    return wsIns
+
+# ----------------------- Valores en caché -----------------------
+def valores_calculados(wsP, H, p, res, kpiI, cacheK, tir_formulas):
+    """Valores de las celdas con fórmula, calculados con motor_flujo"""
+    v = {h: {} for h in ["Parametros", "Escenarios_v4", "Flujo_Base", "Optimizacion_Flujo",
+                         "Indicadores", "Resumen_Anual", "KPIs_Escenarios"]}
+
+    for r, (nombre, _, _, _) in enumerate(mf.PARAMETROS, start=2):
+        if isinstance(wsP.cell(r, 2).value, str):  # vinculados a multiplicadores
+            v["Parametros"][f"B{r}"] = p[nombre]
+    for r, f in enumerate(mf.FACTORES, start=2):
+        v["Escenarios_v4"][f"K{r}"] = p[f]
+
+    for c, clave in enumerate(mf.COLUMNAS_FLUJO[1:], start=2):
+        col = get_column_letter(c)
+        for j in range(H + 1):
+            v["Flujo_Base"][f"{col}{j+2}"] = res[clave][0, j]
+    for c, clave in enumerate(mf.COLUMNAS_OPTIMIZACION[1:], start=2):
+        col = get_column_letter(c)
+        for j in range(H + 1):
+            v["Optimizacion_Flujo"][f"{col}{j+2}"] = res[clave][0, j]
+    if tir_formulas:
+        v["Indicadores"]["C2"] = "#N/A"
+        for j in range(1, H + 1):
+            tir_j = kpiI["tir_prefijos"][0, j]
+            v["Indicadores"][f"C{j+2}"] = "#NUM!" if np.isnan(tir_j) else tir_j
+    for j in range(H + 1):
+        v["Indicadores"][f"B{j+2}"] = res["van_acum"][0, j]
+        # Resumen_Anual replica Flujo_Base (B..M, P) y Optimizacion_Flujo (I, J)
+        for col in "BCDEFGHIJKLM":
+            v["Resumen_Anual"][f"{col}{j+2}"] = v["Flujo_Base"][f"{col}{j+2}"]
+        v["Resumen_Anual"][f"N{j+2}"] = res["van_acum"][0, j]
+        v["Resumen_Anual"][f"O{j+2}"] = res["liquidez_fin"][0, j]
+        v["Resumen_Anual"][f"P{j+2}"] = res["deuda"][0, j]
+
+    v["KPIs_Escenarios"] = cacheK
+    return v
+
+# ---------- construcción ----------
+def construir_libro(params=None, escenarios=None, horizonte=None, salida=SALIDA, *,
+                    escenario_activo=ESCENARIO_ACTIVO, cachear_valores=CACHEAR_VALORES,
+                    streaming=MODO_STREAMING, barrido=BARRIDO_ESCENARIOS, simulacion_mc=SIMULACION_MC,
+                    sensibilidad=SENSIBILIDAD_DELTA, tir_formulas=TIR_CON_FORMULAS,
+                    liquidez=OPTIMIZAR_LIQUIDEZ, perfiles=PERFILES, liquidez_mensual=LIQUIDEZ_MENSUAL,
+                    portafolio=PORTAFOLIO, cubo=CUBO_ESCENARIOS, busqueda=BUSQUEDA_INVERSION,
+                    sensibilidad_sobol=SENSIBILIDAD_SOBOL, cache_dir=CACHE_DIR, cache_max_mb=CACHE_MAX_MB,
+                    traza=TRAZA_JSON, instrumentos=None, secciones=None):
+    """Construye el libro y devuelve la ruta de `salida` (o los bytes del .xlsx si salida=None).
+
+    params      {nombre definido: valor} sobre los valores de Parametros / bases de Escenarios_v4
+    escenarios  tabla de multiplicadores: filas [nombre, f_H2, ..., f_TRATO2] o {nombre: {f_*: v}}
+    horizonte   años del horizonte (HORIZONTE); por defecto el de Parametros
+    perfiles    perfil subanual {"archivo", "resolucion"} (ver perfiles_subanuales)
+    portafolio  CSV/JSON de sitios o {"archivo", "procesos"}: consolida los sitios en la hoja
+                Portafolio (ver portafolio_sitios)
+    cubo        ruta o {"salida", "ejes"}: exporta el cubo de escenarios (ver cubo_escenarios)
+    busqueda    True o argumentos de busqueda_inversion.buscar: frente de Pareto de ANIO_OP,
+                ANIO_REP y reparto del CAPEX en la hoja Decisiones_Inversion
+    sensibilidad_sobol  True o argumentos de sensibilidad_global.sobol (n, muestreo, semilla, kpis,
+                procesos): índices de Sobol en la hoja Sensibilidad_Global
+    traza       ruta donde volcar la traza JSON de tiempos y conteos (ver instrumentacion)
+    instrumentos  instrumentacion.Instrumentos que recibe los eventos (ganchos, memoria)
+    secciones   dict opcional que se llena con los segundos totales por sección
+    """
+    opciones = dict(escenario_activo=escenario_activo, cachear_valores=cachear_valores,
+                    streaming=streaming, barrido=barrido, simulacion_mc=simulacion_mc,
+                    sensibilidad=sensibilidad, tir_formulas=tir_formulas, liquidez=liquidez,
+                    perfiles=perfiles, liquidez_mensual=liquidez_mensual, portafolio=portafolio,
+                    cubo=cubo, busqueda=busqueda, sensibilidad_sobol=sensibilidad_sobol,
+                    cache_dir=cache_dir, cache_max_mb=cache_max_mb)
+    if salida is None:
+        fd, tmp = tempfile.mkstemp(suffix=".xlsx")
+        os.close(fd)
+        try:
+            construir_libro(params, escenarios, horizonte, tmp, traza=traza, instrumentos=instrumentos,
+                            secciones=secciones, **opciones)
+            with open(tmp, "rb") as fh:
+                return fh.read()
+        finally:
+            os.remove(tmp)
+
+    if instrumentos is None and (traza or secciones is not None):
+        instrumentos = Instrumentos()
+    try:
+        return _construir(params, escenarios, horizonte, salida, instrumentos, **opciones)
+    finally:
+        if instrumentos is not None:
+            if secciones is not None:
+                secciones.update(instrumentos.totales())
+            if traza:
+                instrumentos.a_json(traza)
+            instrumentos.cerrar()
+
+
+def _construir(params, escenarios, horizonte, salida, instrumentos, *, escenario_activo,
+               cachear_valores, streaming, barrido, simulacion_mc, sensibilidad, tir_formulas,
+               liquidez, perfiles, liquidez_mensual, portafolio, cubo, busqueda, sensibilidad_sobol,
+               cache_dir, cache_max_mb):
+    params = dict(params or {})
+    validar_params(params)
+    if horizonte is not None:
+        params["HORIZONTE"] = horizonte
+    if "HORIZONTE" in params:
+        params["HORIZONTE"] = int(params["HORIZONTE"])
+    tabla = tabla_escenarios(escenarios)
+    mult = {fila[0]: dict(zip(mf.FACTORES, fila[1:])) for fila in tabla}
+    if escenario_activo not in mult:
+        raise ValueError(f"Escenario activo desconocido: {escenario_activo}")
+
+    # ---------- caché por etapas ----------
+    # insumos de las etapas: filas de Parametros, bases y multiplicadores, escenario activo
+    # (el horizonte va en Parametros); el libro completo además depende de la configuración
+    version = version_codigo([mf, solver_tir, barrido_escenarios, sensibilidad_tornado, optimizador_liquidez,
+                              simulacion_montecarlo, perfiles_subanuales, portafolio_sitios, cubo_escenarios,
+                              busqueda_inversion, sensibilidad_global, cache_etapas], solo_funciones=(mf,))
+    cache = CacheEtapas(cache_dir, cache_max_mb * 1024 ** 2, version) if cache_dir else None
+    insumos = {"parametros": [(n, params.get(n, v)) for n, _, v, _ in mf.PARAMETROS],
+               "bases": [(n, params.get(n, v)) for n, v, _ in mf.BASES],
+               "vinculos_fijos": sorted(n for n, _, _ in mf.VINCULOS if n in params),
+               "escenarios": tabla, "activo": escenario_activo,
+               "perfiles": (huella_archivo(perfiles["archivo"]), perfiles.get("resolucion", "horaria"))
+                           if perfiles else None}
+    # insumos resueltos del escenario activo: clave de las etapas que sólo dependen de
+    # él (editar otra fila de Escenarios_v4 o una nota de Parametros no las invalida)
+    pE = mf.resolver_parametros({**params, **mult[escenario_activo]})
+    activo = {"params": {k: float(v) for k, v in pE.items()}, "vinculos_fijos": insumos["vinculos_fijos"],
+              "perfiles": insumos["perfiles"]}
+    if portafolio:
+        portafolio = portafolio if isinstance(portafolio, dict) else {"archivo": portafolio}
+    config = {"cachear": cachear_valores, "streaming": streaming,
+              "barrido": huella_archivo(barrido), "mc": simulacion_mc,
+              "sensibilidad": sensibilidad, "tir_formulas": tir_formulas,
+              "liquidez": liquidez, "liquidez_mensual": liquidez_mensual,
+              "portafolio": huella_archivo(portafolio and portafolio["archivo"]), "busqueda": busqueda,
+              "sobol": sensibilidad_sobol}
+
+    def etapa(nombre, entradas, calcular):
+        """Resultado de una etapa, reutilizado de la caché si sus insumos no cambiaron"""
+        if instrumentos is None:
+            return cache.etapa(nombre, entradas, calcular) if cache else calcular()
+        with instrumentos.seccion(f"etapa/{nombre}") as datos:
+            if not cache:
+                return calcular()
+            aciertos = cache.aciertos
+            valor = cache.etapa(nombre, entradas, calcular)
+            datos["cache"] = "acierto" if cache.aciertos > aciertos else "fallo"
+            return valor
+
+    def armar(hoja):
+        return seccion(instrumentos, f"armar/{hoja}")
+
+    # perfil subanual: sus montos anuales entran en todas las etapas que evalúan el motor
+    perfil = None
+    if perfiles:
+        perfil = etapa("perfiles", insumos["perfiles"],
+                       lambda: agregar_perfil(perfiles["archivo"], perfiles.get("resolucion", "horaria")))
+    anuales = anuales_perfil(perfil) if perfil else None
+
+    # ----------------------- Cubo de escenarios (archivo aparte) -----------------------
+    # antes de la caché del libro: el cubo se exporta aunque el .xlsx se copie de la caché
+    if cubo:
+        cubo = cubo if isinstance(cubo, dict) else {"salida": cubo}
+        datos_cubo = etapa("Cubo", (activo, cubo.get("ejes")), lambda: calcular_cubo(
+            cubo.get("ejes"), {**params, **mult[escenario_activo]}, perfiles=anuales))
+        with seccion(instrumentos, "cubo"):
+            escribir_cubo(datos_cubo, cubo["salida"])
+
+    if cache:
+        # las filas completas de Parametros / bases: descripción y nota se escriben en el
+        # libro aunque las etapas sólo dependan del valor
+        clave_libro = cache.clave("libro", {**insumos, **config, "constructor": huella_archivo(__file__),
+                                            "tablas": [list(f) for f in mf.PARAMETROS + mf.BASES],
+                                            "emision": version_codigo([libro_diferido, valores_cache])})
+        with seccion(instrumentos, "cache_libro") as datos:
+            copiado = cache.copiar_libro(clave_libro, salida)
+            if datos is not None:
+                datos["cache"] = "acierto" if copiado else "fallo"
+        if copiado:
+            return salida
+
+    # ---------- libro ----------
+    wb = LibroDiferido()
+    with armar("Parametros"):
+        wsP = hoja_parametros(wb, params)
+    with armar("Escenarios_v4"):
+        hoja_escenarios(wb, wsP, params, tabla, escenario_activo)
+    H = wsP["B2"].value  # horizonte
+
+    # ----------------------- Perfiles subanuales (opcional) -----------------------
+    columnas_perfil = None
+    if perfil:
+        with armar("Perfiles"):
+            _, columnas_perfil, celda_anios = hoja_perfiles(wb, perfil)
+            define_name(wb, "PERFIL_ANIOS", celda_anios)
+    with armar("Flujo_Base"):
+        wsF = hoja_flujo_base(wb, H, columnas_perfil)
+
+    # series del escenario activo (motor_flujo) para la política óptima e Indicadores
+    resE = etapa("motor", activo, lambda: mf.calcular(pE, n_anios=H + 1, perfiles=anuales))
+    politica = None
+    if liquidez:
+        politica = etapa("politica", (activo, liquidez), lambda: optimizar(
+            resE["flujo"][0], resE["opex_total"][0], pE["TASA_CRED"],
+            liquidez, reserva_actual=pE["RESERVA_PCT"]))
+    with armar("Optimizacion_Flujo"):
+        wsO = hoja_optimizacion(wb, H, politica)
+    if liquidez_mensual:
+        mensual = etapa("Liquidez_Mensual", activo, lambda: calcular_liquidez_mensual(resE, pE, perfil))
+        with armar("Liquidez_Mensual"):
+            hoja_liquidez_mensual(wb, mensual, resE["deuda"][0])
+
+    kpiI = etapa("Indicadores", activo, lambda: indicadores(resE["flujo"], resE["van_acum"]))
+    with armar("Indicadores"):
+        wsI = hoja_indicadores(wb, H, kpiI, tir_formulas)
+    with armar("Dashboard"):
+        wsD = hoja_dashboard(wb, H, wsF, wsO, wsI)
+
+    # ----------------------- Sensibilidad (tornado) -----------------------
+    if sensibilidad:
+        sens = etapa("Sensibilidad", (activo, sensibilidad),
+                     lambda: tornado(sensibilidad, {**params, **mult[escenario_activo]}, perfiles=anuales))
+        with armar("Sensibilidad"):
+            wsSens = hoja_sensibilidad(wb, sens)
+            wsD.add_chart(grafico_tornado(wsSens, len(sens["filas"])), "Y3")
+
+    # ----------------------- Decisiones_Inversion (opcional) -----------------------
+    if busqueda:
+        opciones_busqueda = busqueda if isinstance(busqueda, dict) else {}
+        decisiones = etapa("Decisiones_Inversion", (activo, opciones_busqueda), lambda: buscar_inversion(
+            {**params, **mult[escenario_activo]}, **opciones_busqueda, perfiles=anuales))
+        with armar("Decisiones_Inversion"):
+            hoja_busqueda(wb, decisiones)
+
+    # ----------------------- Sensibilidad_Global (opcional) -----------------------
+    if sensibilidad_sobol:
+        argumentos_sobol = sensibilidad_sobol if isinstance(sensibilidad_sobol, dict) else {}
+        opciones_sobol = {k: v for k, v in argumentos_sobol.items() if k != "procesos"}
+        sobolI = etapa("Sensibilidad_Global", (activo, opciones_sobol), lambda: sobol(
+            **argumentos_sobol, cambios={**params, **mult[escenario_activo]}, perfiles=anuales))
+        with armar("Sensibilidad_Global"):
+            hoja_sensibilidad_global(wb, sobolI)
+
+    # ----------------------- KPIs_Escenarios -----------------------
+    # N escenarios × HORIZONTE: con `barrido` se escriben valores precalculados
+    # del CSV; si no, los escenarios de Escenarios_v4 con fórmulas.
+    nombresK, cambiosK = leer_escenarios(barrido) if barrido else escenarios_base(tabla)
+    resK = etapa("KPIs_Escenarios", (insumos["parametros"], insumos["bases"], insumos["vinculos_fijos"],
+                                     insumos["perfiles"], tabla, config["barrido"]),
+                 lambda: evaluar_escenarios(cambiosK, H, params, perfiles=anuales))
+    with armar("KPIs_Escenarios"):
+        cacheK = hoja_kpis_escenarios(wb, nombresK, cambiosK, H, formulas=not barrido, res=resK, tabla=tabla,
+                                      fijos=insumos["vinculos_fijos"], columnas_perfil=columnas_perfil)
+
+    with armar("Resumen_Anual"):
+        hoja_resumen(wb, H)
+    with armar("Seguridad_H2"):
+        hoja_seguridad(wb)
+    with armar("Instrucciones"):
+        hoja_instrucciones(wb)
+
+    # ----------------------- Simulacion_MC (opcional) -----------------------
+    if simulacion_mc:
+        mc = etapa("Simulacion_MC", (activo, DISTRIBUCIONES, simulacion_mc), lambda: simular(
+            **simulacion_mc, cambios={**params, **mult[escenario_activo]}, perfiles=anuales))
+        with armar("Simulacion_MC"):
+            hoja_montecarlo(wb, mc)
+
+    # ----------------------- Portafolio de sitios (opcional) -----------------------
+    if portafolio:
+        cartera = etapa("Portafolio", config["portafolio"], lambda: consolidar(
+            leer_sitios(portafolio["archivo"]), procesos=portafolio.get("procesos")))
+        with armar("Portafolio"):
+            hoja_portafolio(wb, cartera)
+
+    wb.guardar(salida, streaming=streaming, instrumentos=instrumentos)
+    if cachear_valores:
+        with seccion(instrumentos, "valores_cache"):
+            incrustar_valores(salida, valores_calculados(wsP, H, pE, resE, kpiI, cacheK, tir_formulas))
+    if cache:
+        cache.guardar_libro(clave_libro, salida)
+    return salida
+
+build_workbook = construir_libro  # nombre de la API para el pipeline
+
+
+if __name__ == "__main__":
+    print(f"OK -> {construir_libro()}")
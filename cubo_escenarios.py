@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+# Cubo de escenarios precalculado para el dashboard web.
+#
+# Se evalúa una rejilla (producto cartesiano) de valores de nombres definidos
+# —multiplicadores f_*, WACC, CAPEX, tasas G_*, ...— con motor_flujo y se
+# guardan las series anuales y los KPIs de cada punto en un archivo compacto:
+#
+#   bytes 0..7    b"EHCUBO\0\0"
+#   bytes 8..11   versión del formato (uint32 little-endian)
+#   bytes 12..15  longitud L del encabezado JSON (uint32 little-endian)
+#   bytes 16..    encabezado JSON UTF-8, relleno con espacios a múltiplo de 8
+#   después       arreglos contiguos (orden C, little-endian, alineados a 8)
+#
+# El encabezado describe los ejes ({"nombre", "valores"}, en el orden de la
+# rejilla: el último eje varía más rápido), los insumos fijos, el "centro" (valor
+# de cada eje en los insumos del cálculo, para ejes omitidos), el horizonte y
+# cada arreglo ({"nombre", "dtype", "forma", "offset", "bytes"}; offset desde
+# el inicio del archivo). Series: forma (puntos, años); KPIs: (puntos,).
+# El punto (i0, i1, ...) está en la fila ravel_multi_index: en JavaScript
+# basta un DataView para el encabezado y un Float32Array por arreglo, y los
+# sliders interpolan multilinealmente entre los vértices vecinos.
+#
+# Uso: python cubo_escenarios.py [--salida cubo.bin] [--eje f_H2=0.8:1.2:5 ...]
+
+import argparse
+import itertools
+import json
+import struct
+import sys
+
+import numpy as np
+
+import motor_flujo as mf
+from solver_tir import tir_lote, payback_interpolado
+
+MAGICO = b"EHCUBO\0\0"
+VERSION_FORMATO = 1
+PUNTOS_POR_LOTE = 4096
+
+# rejilla por defecto: ±VARIACION alrededor de los insumos resueltos,
+# 5 × 5 × 5 × 3 × 3 = 1 125 puntos (el valor central es exactamente el insumo)
+VARIACION = 0.20
+PUNTOS_EJE = {"f_H2": 5, "f_FV": 5, "f_OPEX_BASE": 5, "WACC": 3, "CAPEX": 3}
+SERIES = ["ingresos", "opex_total", "capex", "flujo", "van_acum", "liquidez_fin", "deuda"]
+KPIS = ["van", "tir", "payback", "pi", "deuda_max"]
+
+
+def _validar_ejes(ejes):
+    validos = set(mf.parametros_base()) - {"HORIZONTE"}
+    desconocidos = set(ejes) - validos
+    if desconocidos:
+        raise ValueError(f"Ejes desconocidos (o no admitidos) en el cubo: {sorted(desconocidos)}")
+    for nombre, valores in ejes.items():
+        v = np.asarray(valores, dtype=float)
+        if v.ndim != 1 or v.size == 0 or np.any(np.diff(v) <= 0):
+            raise ValueError(f"El eje {nombre} debe ser una lista creciente no vacía")
+
+
+def ejes_alrededor(params=None, puntos=None, variacion=VARIACION):
+    """Ejes {nombre: valores} ±variacion (relativa) alrededor de los insumos resueltos"""
+    p = mf.resolver_parametros(params)
+    ejes = {}
+    for nombre, n in (puntos or PUNTOS_EJE).items():
+        centro = float(p[nombre])
+        paso = abs(centro) * variacion
+        ejes[nombre] = [centro] if paso == 0 or n < 2 else \
+            [float(x) for x in centro + paso * np.linspace(-1.0, 1.0, n)]
+    return ejes
+
+
+EJES = ejes_alrededor()
+
+
+def calcular_cubo(ejes=None, params=None, horizonte=None, dtype="<f4", perfiles=None):
+    """Series y KPIs en cada punto de la rejilla; devuelve el cubo como dict.
+
+    `params` fija los demás nombres definidos (p. ej. los multiplicadores del
+    escenario activo); los ejes se aplican encima. Sin `ejes`, la rejilla se
+    arma alrededor de `params` (ver ejes_alrededor). `perfiles` son los montos
+    anuales de perfiles_subanuales.
+    """
+    ejes = {k: [float(x) for x in v] for k, v in (ejes or ejes_alrededor(params)).items()}
+    _validar_ejes(ejes)
+    resueltos = mf.resolver_parametros(params)
+    centro = {k: float(resueltos[k]) for k in ejes}
+    fijos = {k: v for k, v in (params or {}).items() if k not in ejes}
+    if horizonte is not None:
+        fijos["HORIZONTE"] = horizonte
+    H = int(fijos.get("HORIZONTE", mf.parametros_base()["HORIZONTE"]))
+    fijos["HORIZONTE"] = H
+    forma = [len(v) for v in ejes.values()]
+    n = int(np.prod(forma))
+
+    arreglos = {s: np.empty((n, H + 1), dtype=dtype) for s in SERIES}
+    arreglos.update({k: np.empty(n, dtype=dtype) for k in KPIS})
+    rejilla = itertools.product(*ejes.values())
+    for ini in range(0, n, PUNTOS_POR_LOTE):
+        puntos = np.array(list(itertools.islice(rejilla, PUNTOS_POR_LOTE)), dtype=float)
+        fin = ini + puntos.shape[0]
+        res = mf.calcular({**fijos, **{k: puntos[:, j] for j, k in enumerate(ejes)}}, n_anios=H + 1,
+                          perfiles=perfiles)
+        for s in SERIES:
+            arreglos[s][ini:fin] = res[s]
+        arreglos["van"][ini:fin] = res["van"]
+        arreglos["tir"][ini:fin] = tir_lote(res["flujo"])[0]
+        arreglos["payback"][ini:fin] = payback_interpolado(res["van_acum"])
+        arreglos["pi"][ini:fin] = res["pi"]
+        arreglos["deuda_max"][ini:fin] = res["deuda"].max(axis=1)
+    return {"ejes": ejes, "centro": centro, "fijos": fijos, "horizonte": H, "arreglos": arreglos}
+
+
+def escribir_cubo(cubo, ruta):
+    """Escribe el cubo en el formato binario versionado; devuelve los bytes escritos"""
+    arreglos = {k: np.ascontiguousarray(v, dtype=np.dtype(v.dtype).newbyteorder("<"))
+                for k, v in cubo["arreglos"].items()}
+    descriptores, relativo = [], 0
+    for nombre, a in arreglos.items():
+        descriptores.append({"nombre": nombre, "dtype": a.dtype.str, "forma": list(a.shape),
+                             "offset": relativo, "bytes": a.nbytes})
+        relativo += -(-a.nbytes // 8) * 8
+    encabezado = {
+        "version": VERSION_FORMATO,
+        "ejes": [{"nombre": k, "valores": v} for k, v in cubo["ejes"].items()],
+        "fijos": {k: float(v) for k, v in cubo["fijos"].items()},
+        "centro": cubo.get("centro", {}),
+        "horizonte": cubo["horizonte"],
+        "anios": list(range(cubo["horizonte"] + 1)),
+        "series": SERIES, "kpis": KPIS, "arreglos": descriptores,
+    }
+    # offsets absolutos: dependen del largo (relleno) del propio encabezado
+    largo, relativos = 0, [d["offset"] for d in descriptores]
+    while True:
+        for d, r in zip(descriptores, relativos):
+            d["offset"] = 16 + largo + r
+        texto = json.dumps(encabezado, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        if len(texto) <= largo:
+            break
+        largo = -(-len(texto) // 8) * 8
+    with open(ruta, "wb") as fh:
+        fh.write(MAGICO + struct.pack("<II", VERSION_FORMATO, largo))
+        fh.write(texto.ljust(largo, b" "))
+        for a in arreglos.values():
+            fh.write(a.tobytes())
+            fh.write(b"\0" * (-a.nbytes % 8))
+        return fh.tell()
+
+
+def leer_cubo(ruta):
+    """Encabezado y arreglos (vistas de solo lectura sobre un memmap) de un archivo de cubo"""
+    with open(ruta, "rb") as fh:
+        cabeza = fh.read(16)
+        if cabeza[:8] != MAGICO:
+            raise ValueError(f"{ruta} no es un archivo de cubo de escenarios")
+        version, largo = struct.unpack("<II", cabeza[8:])
+        if version > VERSION_FORMATO:
+            raise ValueError(f"Versión de formato {version} no soportada (máx. {VERSION_FORMATO})")
+        encabezado = json.loads(fh.read(largo))
+    datos = np.memmap(ruta, dtype=np.uint8, mode="r")
+    arreglos = {d["nombre"]: datos[d["offset"]:d["offset"] + d["bytes"]].view(d["dtype"]).reshape(d["forma"])
+                for d in encabezado["arreglos"]}
+    return {"encabezado": encabezado, "arreglos": arreglos}
+
+
+def interpolar(cubo, punto, nombre="van"):
+    """Interpolación multilineal de un arreglo del cubo en `punto` {eje: valor}.
+
+    Los ejes omitidos toman el valor de los insumos con que se calculó el cubo
+    ("centro" del encabezado; si falta, el valor base); los valores fuera de
+    rango se recortan al borde.
+    """
+    ejes = cubo["encabezado"]["ejes"]
+    centro = cubo["encabezado"].get("centro", {})
+    base = mf.parametros_base()
+    a = cubo["arreglos"][nombre]
+    forma = [len(e["valores"]) for e in ejes]
+    a = a.reshape(forma + list(a.shape[1:]))
+    for eje in ejes:
+        v = np.asarray(eje["valores"], dtype=float)
+        x = punto.get(eje["nombre"], centro.get(eje["nombre"], base.get(eje["nombre"], v[len(v) // 2])))
+        x = min(max(float(x), v[0]), v[-1])
+        if v.size == 1:
+            a = a[0]
+            continue
+        j = min(int(np.searchsorted(v, x, side="right")) - 1, v.size - 2)
+        t = (x - v[j]) / (v[j + 1] - v[j])
+        a = (1 - t) * a[j].astype(float) + t * a[j + 1].astype(float)
+    return a
+
+
+def _eje(texto):
+    """"f_H2=0.8:1.2:5" (inicio:fin:n) o "WACC=0.08,0.1,0.12" -> (nombre, valores)"""
+    nombre, _, valores = texto.partition("=")
+    if ":" in valores:
+        a, b, n = valores.split(":")
+        return nombre, [float(x) for x in np.linspace(float(a), float(b), int(n))]
+    return nombre, [float(x) for x in valores.split(",")]
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Precalcula el cubo de escenarios para el dashboard")
+    ap.add_argument("--salida", default="cubo_escenarios.bin")
+    ap.add_argument("--eje", action="append", type=_eje, default=[],
+                    help="NOMBRE=inicio:fin:n o NOMBRE=v1,v2,... (repetible; sustituye la rejilla por defecto)")
+    ap.add_argument("--horizonte", type=int, default=None)
+    ap.add_argument("--float64", action="store_true", help="arreglos en doble precisión")
+    args = ap.parse_args(argv)
+
+    cubo = calcular_cubo(dict(args.eje) or None, horizonte=args.horizonte,
+                         dtype="<f8" if args.float64 else "<f4")
+    tam = escribir_cubo(cubo, args.salida)
+    puntos = cubo["arreglos"]["van"].shape[0]
+    print(f"OK -> {args.salida}: {puntos:,} puntos × {cubo['horizonte'] + 1} años, {tam / 1024:,.0f} KiB")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
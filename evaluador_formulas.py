@@ -0,0 +1,690 @@
+# -*- coding: utf-8 -*-
+# Evaluador en proceso de las fórmulas que emite el constructor, para revisar
+# valores sin abrir el libro en Excel / LibreOffice.
+#
+# Cubre el subconjunto que genera construir_flujo_caja_v4_1a: referencias con
+# y sin hoja, rangos (A1:B2, M:M, M$2:INDEX(...)), nombres definidos, + - * /
+# ^ & y comparaciones (también sobre rangos: B14:Q14>=0), y las funciones IF,
+# AND, OR, INDEX, MATCH, SUM, MAX, MIN, ABS, NPV, IRR y NA. La IRR usa el
+# mismo solver que los valores en caché (solver_tir.tir_lote).
+#
+# La evaluación es perezosa: sólo se calcula lo que pide `valor(...)`. Cada
+# celda con fórmula se memoriza y registra las celdas que leyó (dependencias
+# dinámicas: una rama de IF no tomada no cuenta). `fijar(...)` cambia una
+# celda y borra la memoria sólo de sus dependientes transitivos, así que la
+# siguiente consulta recalcula únicamente las celdas sucias.
+#
+# Uso: python evaluador_formulas.py libro.xlsx [VAN Indicadores!B2 ...]
+#          [--fijar WACC=0.12 ...] [--verificar]
+
+import argparse
+import math
+import re
+import sys
+from collections import namedtuple
+from contextlib import contextmanager
+
+import numpy as np
+import openpyxl
+from openpyxl.utils import column_index_from_string, get_column_letter
+
+from solver_tir import tir_lote
+
+PROFUNDIDAD = 50_000    # límite de recursión durante la evaluación (cadenas año a año)
+
+
+class ErrorExcel:
+    """Valor de error de hoja de cálculo (#N/A, #NUM!, ...); se propaga en las operaciones"""
+    __slots__ = ("codigo",)
+
+    def __init__(self, codigo):
+        self.codigo = codigo
+
+    def __eq__(self, otro):
+        return isinstance(otro, ErrorExcel) and otro.codigo == self.codigo
+
+    def __hash__(self):
+        return hash(self.codigo)
+
+    def __repr__(self):
+        return self.codigo
+
+
+ERRORES = {c: ErrorExcel(c) for c in ("#N/A", "#NUM!", "#DIV/0!", "#VALUE!", "#REF!", "#NAME?", "#NULL!")}
+NA, NUM, DIV0, VALOR, REF, NOMBRE = (ERRORES[c] for c in ("#N/A", "#NUM!", "#DIV/0!", "#VALUE!",
+                                                          "#REF!", "#NAME?"))
+
+# r2 = None: columna completa (hasta la última fila usada de la hoja)
+Referencia = namedtuple("Referencia", "hoja r1 c1 r2 c2")
+
+# ---------- análisis léxico y sintáctico ----------
+_HOJA = r"(?:'(?:[^']|'')+'|[A-Za-z_][\w\.]*)!"
+_CELDA = r"\$?[A-Za-z]{1,3}\$?\d+"
+_COLUMNA = r"\$?[A-Za-z]{1,3}"
+_TOKEN = re.compile(rf"""
+    (?P<esp>\s+)
+  | (?P<texto>"(?:[^"]|"")*")
+  | (?P<error>\#(?:N/A|NUM!|DIV/0!|VALUE!|REF!|NAME\?|NULL!))
+  | (?P<ref>(?P<hoja>{_HOJA})?(?:(?P<a>{_CELDA})(?::(?P<b>{_CELDA}))?|(?P<ca>{_COLUMNA}):(?P<cb>{_COLUMNA}))(?![\w(]))
+  | (?P<numero>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<nombre>[A-Za-z_][\w\.]*)
+  | (?P<op><=|>=|<>|[-+*/^&=<>%(),:])
+""", re.X)
+_RE_CELDA = re.compile(r"\$?([A-Za-z]{1,3})\$?(\d+)")
+_COMPARACION = ("=", "<>", "<", ">", "<=", ">=")
+
+
+def _celda(texto):
+    col, fila = _RE_CELDA.fullmatch(texto).groups()
+    return int(fila), column_index_from_string(col.upper())
+
+
+def _tokens(formula):
+    pos, salida = 0, []
+    while pos < len(formula):
+        m = _TOKEN.match(formula, pos)
+        if m is None:
+            raise ValueError(f"Fórmula no soportada en la posición {pos}: {formula}")
+        pos = m.end()
+        tipo = m.lastgroup if m.lastgroup not in ("hoja", "a", "b", "ca", "cb") else "ref"
+        if tipo == "esp":
+            continue
+        if tipo == "ref" or m.group("ref"):
+            hoja = m.group("hoja")
+            hoja = hoja[:-1].strip("'").replace("''", "'") if hoja else None
+            if m.group("a"):
+                r1, c1 = _celda(m.group("a"))
+                r2, c2 = _celda(m.group("b")) if m.group("b") else (r1, c1)
+                ref = Referencia(hoja, min(r1, r2), min(c1, c2), max(r1, r2), max(c1, c2))
+            else:
+                c1, c2 = (column_index_from_string(m.group(k).lstrip("$").upper()) for k in ("ca", "cb"))
+                ref = Referencia(hoja, 1, min(c1, c2), None, max(c1, c2))
+            salida.append(("ref", ref))
+        else:
+            salida.append((tipo, m.group(tipo)))
+    return salida
+
+
+class _Analizador:
+    """Descenso recursivo con la precedencia de Excel (el menos unario antes que ^)"""
+
+    def __init__(self, formula):
+        self.tokens = _tokens(formula[1:] if formula.startswith("=") else formula)
+        self.i = 0
+
+    def _ver(self):
+        return self.tokens[self.i] if self.i < len(self.tokens) else (None, None)
+
+    def _tomar(self, valor=None):
+        tok = self._ver()
+        if valor is not None and tok[1] != valor:
+            raise ValueError(f"Se esperaba {valor!r} y se encontró {tok[1]!r}")
+        self.i += 1
+        return tok
+
+    def analizar(self):
+        nodo = self._comparacion()
+        if self.i != len(self.tokens):
+            raise ValueError(f"Token inesperado: {self._ver()[1]!r}")
+        return nodo
+
+    def _binaria(self, siguiente, ops):
+        nodo = siguiente()
+        while self._ver()[0] == "op" and self._ver()[1] in ops:
+            op = self._tomar()[1]
+            nodo = ("bin", op, nodo, siguiente())
+        return nodo
+
+    def _comparacion(self):
+        return self._binaria(self._concatenacion, _COMPARACION)
+
+    def _concatenacion(self):
+        return self._binaria(self._suma, ("&",))
+
+    def _suma(self):
+        return self._binaria(self._producto, ("+", "-"))
+
+    def _producto(self):
+        return self._binaria(self._potencia, ("*", "/"))
+
+    def _potencia(self):
+        return self._binaria(self._unario, ("^",))
+
+    def _unario(self):
+        tipo, valor = self._ver()
+        if tipo == "op" and valor in ("-", "+"):
+            self._tomar()
+            nodo = self._unario()
+            return ("neg", nodo) if valor == "-" else nodo
+        nodo = self._rango()
+        while self._ver() == ("op", "%"):
+            self._tomar()
+            nodo = ("bin", "/", nodo, ("cte", 100))
+        return nodo
+
+    def _rango(self):
+        nodo = self._primario()
+        while self._ver() == ("op", ":"):
+            self._tomar()
+            nodo = ("rango", nodo, self._primario())
+        return nodo
+
+    def _primario(self):
+        tipo, valor = self._tomar()
+        if tipo == "numero":
+            return ("cte", float(valor) if any(ch in valor for ch in ".eE") else int(valor))
+        if tipo == "texto":
+            return ("cte", valor[1:-1].replace('""', '"'))
+        if tipo == "error":
+            return ("cte", ERRORES[valor])
+        if tipo == "ref":
+            return ("ref", valor)
+        if tipo == "nombre":
+            if self._ver() == ("op", "("):
+                self._tomar()
+                args = []
+                if self._ver() != ("op", ")"):
+                    args.append(self._comparacion())
+                    while self._ver() == ("op", ","):
+                        self._tomar()
+                        args.append(self._comparacion())
+                self._tomar(")")
+                return ("fn", valor.upper(), args)
+            if valor.upper() in ("TRUE", "FALSE"):
+                return ("cte", valor.upper() == "TRUE")
+            return ("nombre", valor.upper())
+        if (tipo, valor) == ("op", "("):
+            nodo = self._comparacion()
+            self._tomar(")")
+            return nodo
+        raise ValueError(f"Token inesperado: {valor!r}")
+
+
+def analizar(formula):
+    """Árbol de la fórmula (tuplas); ValueError si usa sintaxis fuera del subconjunto"""
+    return _Analizador(formula).analizar()
+
+
+# ---------- operaciones sobre valores ----------
+def _es_numero(v):
+    return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+
+def _numero(v):
+    if isinstance(v, ErrorExcel):
+        return v
+    if v is None:
+        return 0
+    if isinstance(v, bool):
+        return int(v)
+    if _es_numero(v):
+        return v
+    try:
+        return float(v)
+    except ValueError:
+        return VALOR
+
+
+def _texto(v):
+    if v is None:
+        return ""
+    if isinstance(v, bool):
+        return "TRUE" if v else "FALSE"
+    if isinstance(v, float) and v.is_integer():
+        return str(int(v))
+    return str(v)
+
+
+def _rango_tipo(v):
+    return 2 if isinstance(v, bool) else 1 if isinstance(v, str) else 0
+
+
+def _comparar(op, a, b):
+    if a is None:
+        a = "" if isinstance(b, str) else False if isinstance(b, bool) else 0
+    if b is None:
+        b = "" if isinstance(a, str) else False if isinstance(a, bool) else 0
+    ta, tb = _rango_tipo(a), _rango_tipo(b)
+    if ta != tb:
+        a, b = ta, tb
+    elif ta == 1:
+        a, b = a.lower(), b.lower()
+    return {"=": a == b, "<>": a != b, "<": a < b, ">": a > b, "<=": a <= b, ">=": a >= b}[op]
+
+
+def _escalar(op, a, b):
+    if isinstance(a, ErrorExcel):
+        return a
+    if isinstance(b, ErrorExcel):
+        return b
+    if op in _COMPARACION:
+        return _comparar(op, a, b)
+    if op == "&":
+        return _texto(a) + _texto(b)
+    x, y = _numero(a), _numero(b)
+    if isinstance(x, ErrorExcel):
+        return x
+    if isinstance(y, ErrorExcel):
+        return y
+    if op == "+":
+        return x + y
+    if op == "-":
+        return x - y
+    if op == "*":
+        return x * y
+    if op == "/":
+        return DIV0 if y == 0 else x / y
+    # ^
+    if x == 0 and y < 0:
+        return DIV0
+    try:
+        r = math.pow(x, y)
+    except (ValueError, OverflowError):
+        return NUM
+    return r
+
+
+def _binario(op, a, b):
+    """Operación con difusión elemento a elemento si algún lado es un arreglo (lista de filas)"""
+    if isinstance(a, list) or isinstance(b, list):
+        fa = a if isinstance(a, list) else None
+        fb = b if isinstance(b, list) else None
+        filas = len(fa or fb)
+        cols = len((fa or fb)[0])
+        return [[_escalar(op, fa[i][j] if fa else a, fb[i][j] if fb else b) for j in range(cols)]
+                for i in range(filas)]
+    return _escalar(op, a, b)
+
+
+def _aplanar(valores):
+    """(valor, viene_de_rango) de los argumentos, aplanando arreglos"""
+    for v in valores:
+        if isinstance(v, list):
+            for fila in v:
+                for x in fila:
+                    yield x, True
+        else:
+            yield v, False
+
+
+def _numeros(valores):
+    """Números de los argumentos (en rangos se omiten textos, lógicos y vacíos) o el primer error"""
+    salida = []
+    for v, de_rango in _aplanar(valores):
+        if isinstance(v, ErrorExcel):
+            return v
+        if _es_numero(v):
+            salida.append(v)
+        elif not de_rango and v is not None:
+            x = _numero(v)
+            if isinstance(x, ErrorExcel):
+                return x
+            salida.append(x)
+    return salida
+
+
+def _igual_match(a, b):
+    if _rango_tipo(a) != _rango_tipo(b) or a is None or b is None:
+        return False
+    return a.lower() == b.lower() if isinstance(a, str) else a == b
+
+
+# ---------- evaluador ----------
+class EvaluadorLibro:
+    """Grafo de celdas del libro con evaluación perezosa y memoria por celda.
+
+    celdas   {hoja: {(fila, columna): valor o "=fórmula"}}
+    nombres  {nombre definido: referencia ("Parametros!$B$2")}
+    """
+
+    def __init__(self, celdas, nombres):
+        self._constantes = {}
+        self._formulas = {}
+        self._max_fila = {}
+        for hoja, contenido in celdas.items():
+            self._max_fila[hoja] = max((r for r, _ in contenido), default=0)
+            for (r, c), v in contenido.items():
+                if isinstance(v, str) and v.startswith("=") and len(v) > 1:
+                    self._formulas[(hoja, r, c)] = v
+                elif v is not None:
+                    self._constantes[(hoja, r, c)] = v
+        self._nombres = {n.upper(): ref for n, ref in nombres.items()}
+        self._arboles = {}
+        self._memoria = {}
+        self._dependientes = {}     # celda -> celdas con fórmula que la leyeron
+        self._pila = []
+        self._en_curso = set()
+        self.evaluadas = 0          # evaluaciones de celdas con fórmula (para medir la reutilización)
+
+    @classmethod
+    def desde_xlsx(cls, ruta):
+        wb = openpyxl.load_workbook(ruta)
+        celdas = {ws.title: {(c.row, c.column): c.value for fila in ws.iter_rows() for c in fila
+                             if c.value is not None}
+                  for ws in wb.worksheets}
+        return cls(celdas, {n: d.attr_text for n, d in wb.defined_names.items()})
+
+    @classmethod
+    def desde_libro(cls, wb):
+        """Desde un LibroDiferido en memoria (antes o después de guardar)"""
+        celdas = {}
+        for titulo in wb.sheetnames:
+            celdas[titulo] = {(r, c): v for r, valores, _ in wb[titulo].iter_filas()
+                              for c, v in valores.items()}
+        return cls(celdas, {n: d.attr_text for n, d in wb.defined_names.items()})
+
+    # ---- API ----
+    def valor(self, destino, hoja=None):
+        """Valor de un nombre, referencia ("Indicadores!B2") o expresión ("=NPV(WACC, ...)").
+
+        Un rango devuelve una lista de filas. `hoja` es la hoja de las referencias sin hoja.
+        """
+        with self._profundidad():
+            return self._valor(self._evaluar(analizar(destino), hoja))
+
+    def fijar(self, destino, valor):
+        """Cambia una celda (o la celda de un nombre) y marca sucios sus dependientes"""
+        ref = self._evaluar(analizar(destino), None)
+        if not isinstance(ref, Referencia) or ref.r2 != ref.r1 or ref.c2 != ref.c1:
+            raise ValueError(f"{destino} no es una sola celda")
+        clave = (ref.hoja, ref.r1, ref.c1)
+        self._formulas.pop(clave, None)
+        self._arboles.pop(clave, None)
+        self._memoria.pop(clave, None)
+        if isinstance(valor, str) and valor.startswith("="):
+            self._formulas[clave] = valor
+            self._constantes.pop(clave, None)
+        else:
+            self._constantes[clave] = valor
+        self._max_fila[ref.hoja] = max(self._max_fila.get(ref.hoja, 0), ref.r1)
+        sucias = [clave]
+        while sucias:
+            for d in self._dependientes.pop(sucias.pop(), ()):
+                if d in self._memoria:
+                    del self._memoria[d]
+                    sucias.append(d)
+
+    def celdas_con_formula(self):
+        """Claves (hoja, fila, columna) de todas las fórmulas"""
+        return list(self._formulas)
+
+    def calcular_todo(self):
+        """{hoja: {"B3": valor}} de todas las fórmulas"""
+        salida = {}
+        with self._profundidad():
+            for hoja, r, c in self._formulas:
+                salida.setdefault(hoja, {})[f"{get_column_letter(c)}{r}"] = self._celda(hoja, r, c)
+        return salida
+
+    # ---- evaluación ----
+    @contextmanager
+    def _profundidad(self):
+        anterior = sys.getrecursionlimit()
+        sys.setrecursionlimit(max(anterior, PROFUNDIDAD))
+        try:
+            yield
+        finally:
+            sys.setrecursionlimit(anterior)
+
+    def _leer(self, hoja, r, c):
+        clave = (hoja, r, c)
+        if self._pila:
+            self._dependientes.setdefault(clave, set()).add(self._pila[-1])
+        if clave in self._formulas:
+            return self._celda(hoja, r, c)
+        return self._constantes.get(clave)
+
+    def _celda(self, hoja, r, c):
+        clave = (hoja, r, c)
+        if clave in self._memoria:
+            return self._memoria[clave]
+        if clave in self._en_curso:
+            raise ValueError(f"Referencia circular en {hoja}!{get_column_letter(c)}{r}")
+        arbol = self._arboles.get(clave)
+        if arbol is None:
+            arbol = self._arboles[clave] = analizar(self._formulas[clave])
+        self._en_curso.add(clave)
+        self._pila.append(clave)
+        try:
+            v = self._valor(self._evaluar(arbol, hoja))
+        finally:
+            self._pila.pop()
+            self._en_curso.discard(clave)
+        if isinstance(v, list):     # intersección implícita: primer elemento
+            v = v[0][0]
+        self._memoria[clave] = v
+        self.evaluadas += 1
+        return v
+
+    def _valor(self, x):
+        """Referencia -> valor (una celda) o lista de filas (rango)"""
+        if not isinstance(x, Referencia):
+            return x
+        r2 = self._max_fila.get(x.hoja, 0) if x.r2 is None else x.r2
+        if x.r1 == r2 and x.c1 == x.c2:
+            return self._leer(x.hoja, x.r1, x.c1)
+        return [[self._leer(x.hoja, r, c) for c in range(x.c1, x.c2 + 1)] for r in range(x.r1, r2 + 1)]
+
+    def _escalar(self, nodo, hoja):
+        v = self._valor(self._evaluar(nodo, hoja))
+        return v[0][0] if isinstance(v, list) else v
+
+    def _evaluar(self, nodo, hoja):
+        tipo = nodo[0]
+        if tipo == "cte":
+            return nodo[1]
+        if tipo == "ref":
+            ref = nodo[1]
+            if ref.hoja is None:
+                if hoja is None:
+                    raise ValueError("Referencia sin hoja fuera de una hoja")
+                ref = ref._replace(hoja=hoja)
+            if ref.hoja not in self._max_fila:
+                return REF
+            return ref
+        if tipo == "nombre":
+            texto = self._nombres.get(nodo[1])
+            return NOMBRE if texto is None else self._evaluar(analizar(texto), hoja)
+        if tipo == "bin":
+            return _binario(nodo[1], self._valor(self._evaluar(nodo[2], hoja)),
+                            self._valor(self._evaluar(nodo[3], hoja)))
+        if tipo == "neg":
+            return _binario("*", -1, self._valor(self._evaluar(nodo[1], hoja)))
+        if tipo == "rango":
+            a, b = self._evaluar(nodo[1], hoja), self._evaluar(nodo[2], hoja)
+            if not (isinstance(a, Referencia) and isinstance(b, Referencia)) or a.hoja != b.hoja:
+                return REF
+            r2a = self._max_fila.get(a.hoja, 0) if a.r2 is None else a.r2
+            r2b = self._max_fila.get(b.hoja, 0) if b.r2 is None else b.r2
+            return Referencia(a.hoja, min(a.r1, b.r1), min(a.c1, b.c1), max(r2a, r2b), max(a.c2, b.c2))
+        if tipo == "fn":
+            funcion = _FUNCIONES.get(nodo[1])
+            if funcion is None:
+                raise ValueError(f"Función no soportada: {nodo[1]}")
+            return funcion(self, nodo[2], hoja)
+        raise ValueError(f"Nodo desconocido: {tipo}")
+
+    def _argumentos(self, args, hoja):
+        return [self._valor(self._evaluar(a, hoja)) for a in args]
+
+    # ---- funciones ----
+    def _fn_if(self, args, hoja):
+        cond = self._escalar(args[0], hoja)
+        if isinstance(cond, ErrorExcel):
+            return cond
+        cond = _numero(cond) if not isinstance(cond, str) else VALOR
+        if isinstance(cond, ErrorExcel):
+            return cond
+        if cond:
+            return self._evaluar(args[1], hoja) if len(args) > 1 else True
+        return self._evaluar(args[2], hoja) if len(args) > 2 else False
+
+    def _fn_logica(self, args, hoja, combinar):
+        valores = []
+        for v, _ in _aplanar(self._argumentos(args, hoja)):
+            if isinstance(v, ErrorExcel):
+                return v
+            if isinstance(v, (bool, int, float)):
+                valores.append(bool(v))
+        return combinar(valores) if valores else VALOR
+
+    def _fn_agregado(self, args, hoja, combinar):
+        numeros = _numeros(self._argumentos(args, hoja))
+        return numeros if isinstance(numeros, ErrorExcel) else combinar(numeros)
+
+    def _fn_abs(self, args, hoja):
+        x = _numero(self._escalar(args[0], hoja))
+        return x if isinstance(x, ErrorExcel) else abs(x)
+
+    def _fn_npv(self, args, hoja):
+        tasa = _numero(self._escalar(args[0], hoja))
+        if isinstance(tasa, ErrorExcel):
+            return tasa
+        numeros = _numeros(self._argumentos(args[1:], hoja))
+        if isinstance(numeros, ErrorExcel):
+            return numeros
+        if tasa == -1:
+            return DIV0
+        return sum(v / (1 + tasa) ** (t + 1) for t, v in enumerate(numeros))
+
+    def _fn_irr(self, args, hoja):
+        numeros = _numeros(self._argumentos(args[:1], hoja))
+        if isinstance(numeros, ErrorExcel):
+            return numeros
+        semilla = _numero(self._escalar(args[1], hoja)) if len(args) > 1 else 0.1
+        if isinstance(semilla, ErrorExcel) or len(numeros) < 2:
+            return NUM
+        tir, _ = tir_lote(np.array([numeros], dtype=float), semilla=semilla)
+        return NUM if np.isnan(tir[0]) else float(tir[0])
+
+    def _fn_index(self, args, hoja):
+        base = self._evaluar(args[0], hoja)
+        indices = []
+        for a in args[1:3]:
+            k = _numero(self._escalar(a, hoja))
+            if isinstance(k, ErrorExcel):
+                return k
+            indices.append(int(k))
+        if isinstance(base, ErrorExcel):
+            return base
+        if isinstance(base, Referencia):
+            r2 = self._max_fila.get(base.hoja, 0) if base.r2 is None else base.r2
+            filas, cols = r2 - base.r1 + 1, base.c2 - base.c1 + 1
+        else:
+            base = base if isinstance(base, list) else [[base]]
+            filas, cols = len(base), len(base[0])
+        fila = indices[0] if indices else 0
+        col = indices[1] if len(indices) > 1 else None
+        if col is None:
+            if filas == 1 and cols > 1:     # vector fila: el índice recorre columnas
+                fila, col = 0, fila
+            else:
+                col = 0 if cols > 1 else 1
+        if fila < 0 or col < 0 or fila > filas or col > cols:
+            return REF
+        if isinstance(base, Referencia):
+            r1, r2b = (base.r1, base.r1 + filas - 1) if fila == 0 else (base.r1 + fila - 1,) * 2
+            c1, c2 = (base.c1, base.c2) if col == 0 else (base.c1 + col - 1,) * 2
+            return Referencia(base.hoja, r1, c1, r2b, c2)
+        sel = base if fila == 0 else [base[fila - 1]]
+        sel = [f[:] for f in sel] if col == 0 else [[f[col - 1]] for f in sel]
+        return sel if len(sel) > 1 or len(sel[0]) > 1 else sel[0][0]
+
+    def _fn_match(self, args, hoja):
+        buscado = self._escalar(args[0], hoja)
+        if isinstance(buscado, ErrorExcel):
+            return buscado
+        vector = [v for v, _ in _aplanar([self._valor(self._evaluar(args[1], hoja))])]
+        tipo = _numero(self._escalar(args[2], hoja)) if len(args) > 2 else 1
+        if tipo == 0:
+            for i, v in enumerate(vector, start=1):
+                if _igual_match(buscado, v):
+                    return i
+            return NA
+        # búsqueda aproximada sobre un vector ordenado (1: ascendente, -1: descendente)
+        mejor = NA
+        for i, v in enumerate(vector, start=1):
+            if v is None or isinstance(v, ErrorExcel) or _rango_tipo(v) != _rango_tipo(buscado):
+                continue
+            if (tipo > 0 and _comparar("<=", v, buscado)) or (tipo < 0 and _comparar(">=", v, buscado)):
+                mejor = i
+            else:
+                break
+        return mejor
+
+
+_FUNCIONES = {
+    "IF": EvaluadorLibro._fn_if,
+    "AND": lambda ev, a, h: ev._fn_logica(a, h, all),
+    "OR": lambda ev, a, h: ev._fn_logica(a, h, any),
+    "SUM": lambda ev, a, h: ev._fn_agregado(a, h, sum),
+    "MAX": lambda ev, a, h: ev._fn_agregado(a, h, lambda x: max(x, default=0)),
+    "MIN": lambda ev, a, h: ev._fn_agregado(a, h, lambda x: min(x, default=0)),
+    "ABS": EvaluadorLibro._fn_abs,
+    "NPV": EvaluadorLibro._fn_npv,
+    "IRR": EvaluadorLibro._fn_irr,
+    "INDEX": EvaluadorLibro._fn_index,
+    "MATCH": EvaluadorLibro._fn_match,
+    "NA": lambda ev, a, h: NA,
+}
+
+
+def verificar(ruta, tolerancia=1e-9):
+    """Compara las fórmulas evaluadas con los valores en caché del .xlsx.
+
+    Devuelve (comparadas, [(hoja, celda, en caché, evaluado), ...] que difieren).
+    """
+    ev = EvaluadorLibro.desde_xlsx(ruta)
+    calculados = ev.calcular_todo()
+    wb = openpyxl.load_workbook(ruta, data_only=True)
+    comparadas, diferencias = 0, []
+    for hoja, celdas in calculados.items():
+        ws = wb[hoja]
+        for coord, v in celdas.items():
+            cache = ws[coord].value
+            if cache is None:
+                continue
+            comparadas += 1
+            if isinstance(v, ErrorExcel) or isinstance(cache, str):
+                igual = str(v) == str(cache)
+            elif _es_numero(v) and _es_numero(cache):
+                igual = math.isclose(v, cache, rel_tol=tolerancia, abs_tol=tolerancia)
+            else:
+                igual = v == cache
+            if not igual:
+                diferencias.append((hoja, coord, cache, v))
+    return comparadas, diferencias
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Evalúa fórmulas y nombres definidos de un libro generado")
+    ap.add_argument("libro")
+    ap.add_argument("destinos", nargs="*", help='nombres, celdas ("Indicadores!B2") o expresiones ("=...")')
+    ap.add_argument("--fijar", action="append", default=[], metavar="DESTINO=VALOR",
+                    help="cambia una celda o nombre antes de evaluar (repetible)")
+    ap.add_argument("--verificar", action="store_true",
+                    help="compara todas las fórmulas con los valores en caché del archivo")
+    args = ap.parse_intermixed_args(argv)
+
+    if args.verificar:
+        comparadas, diferencias = verificar(args.libro)
+        for hoja, coord, cache, v in diferencias[:20]:
+            print(f"{hoja}!{coord}: caché {cache!r}, evaluado {v!r}")
+        print(f"{comparadas - len(diferencias)}/{comparadas} fórmulas coinciden con la caché")
+        if diferencias:
+            return 1
+    ev = EvaluadorLibro.desde_xlsx(args.libro)
+    for asignacion in args.fijar:
+        destino, _, texto = asignacion.partition("=")
+        try:
+            valor = float(texto)
+        except ValueError:
+            valor = texto
+        ev.fijar(destino, valor)
+    for destino in args.destinos:
+        print(f"{destino} = {ev.valor(destino)!r}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
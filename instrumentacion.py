@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+# Instrumentación de la construcción del libro: temporizadores por sección,
+# conteo de celdas / fórmulas / estilos por hoja y, opcionalmente, memoria
+# (tracemalloc). Los eventos se entregan a ganchos (callables) y se pueden
+# volcar como traza JSON.
+#
+# Secciones que reporta construir_libro:
+#   armar/<hoja>     construcción diferida (fórmulas fijas, gráficos, validaciones)
+#   etapa/<nombre>   cálculos del motor; el evento lleva "cache": acierto/fallo
+#   emitir/<hoja>    materialización de la hoja en openpyxl al guardar, que incluye
+#     generar/<hoja>   ejecución de los generadores de bloques (texto de fórmulas)
+#     estilos/<hoja>   asignación de estilos con nombre por celda (modo normal)
+#   escribir         wb.save (XML de hojas y gráficos + zip)
+#   valores_cache    inyección de valores calculados
+# y un conteo por hoja: celdas, formulas, estilos (celdas con estilo), graficos.
+#
+# Sin instrumentos (None) las secciones son un contexto nulo compartido y
+# los contadores no se evalúan, así que el costo es una comparación por sección.
+
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+_NULO = nullcontext()
+
+
+def seccion(instrumentos, nombre):
+    """Contexto que mide `nombre` con `instrumentos` (nulo si instrumentos es None)"""
+    return _NULO if instrumentos is None else instrumentos.seccion(nombre)
+
+
+class Instrumentos:
+    """Colector de eventos de construcción.
+
+    ganchos     callables `gancho(evento)`; evento es un dict con "tipo"
+                ("seccion" o "conteo") y sus datos
+    memoria     registra con tracemalloc la memoria neta y el pico de cada sección
+    instantaneas  con memoria, guarda las N líneas que más memoria retienen al
+                cerrar cada sección de primer nivel (costoso)
+    """
+
+    def __init__(self, ganchos=(), memoria=False, instantaneas=0):
+        self.ganchos = list(ganchos)
+        self.memoria = memoria
+        self.instantaneas = instantaneas
+        self.eventos = []
+        self.conteos = {}
+        self._t0 = time.perf_counter()
+        self._pila = []
+        self._inicio_traza = False
+
+    def agregar(self, gancho):
+        self.ganchos.append(gancho)
+        return gancho
+
+    def _emitir(self, evento):
+        self.eventos.append(evento)
+        for gancho in self.ganchos:
+            gancho(evento)
+
+    @contextmanager
+    def seccion(self, nombre, **datos):
+        """Mide el bloque; `datos` (mutable dentro del bloque) viaja en el evento"""
+        if self.memoria and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._inicio_traza = True
+        mem0 = tracemalloc.get_traced_memory()[0] if self.memoria else 0
+        self._pila.append(nombre)
+        t0 = time.perf_counter()
+        try:
+            yield datos
+        finally:
+            fin = time.perf_counter()
+            self._pila.pop()
+            evento = {"tipo": "seccion", "nombre": nombre, "inicio_s": t0 - self._t0,
+                      "segundos": fin - t0, "nivel": len(self._pila), **datos}
+            if self.memoria:
+                actual, pico = tracemalloc.get_traced_memory()
+                evento["memoria_neta_bytes"] = actual - mem0
+                evento["memoria_pico_bytes"] = pico
+                if self.instantaneas and not self._pila:
+                    lineas = tracemalloc.take_snapshot().statistics("lineno")[:self.instantaneas]
+                    evento["instantanea"] = [{"linea": str(s.traceback[0]), "bytes": s.size,
+                                              "bloques": s.count} for s in lineas]
+            self._emitir(evento)
+
+    def registrar(self, nombre, segundos, **datos):
+        """Sección medida por fuera (p. ej. tiempos acumulados dentro de un bucle)"""
+        self._emitir({"tipo": "seccion", "nombre": nombre, "inicio_s": None,
+                      "segundos": segundos, "nivel": len(self._pila), **datos})
+
+    def contar(self, hoja, **conteos):
+        """Suma conteos (celdas, formulas, estilos, ...) de una hoja"""
+        acumulado = self.conteos.setdefault(hoja, {})
+        for k, v in conteos.items():
+            acumulado[k] = acumulado.get(k, 0) + v
+        self._emitir({"tipo": "conteo", "hoja": hoja, **conteos})
+
+    def totales(self):
+        """{sección: segundos acumulados}"""
+        suma = {}
+        for e in self.eventos:
+            if e["tipo"] == "seccion":
+                suma[e["nombre"]] = suma.get(e["nombre"], 0.0) + e["segundos"]
+        return suma
+
+    def cerrar(self):
+        """Detiene tracemalloc si lo inició este colector"""
+        if self._inicio_traza:
+            tracemalloc.stop()
+            self._inicio_traza = False
+
+    def traza(self):
+        return {"total_s": time.perf_counter() - self._t0, "totales_s": self.totales(),
+                "conteos": self.conteos, "eventos": self.eventos}
+
+    def a_json(self, ruta):
+        with open(ruta, "w", encoding="utf-8") as fh:
+            json.dump(self.traza(), fh, indent=2, ensure_ascii=False)
+        return ruta
+
+
+def imprimir(evento):
+    """Gancho de ejemplo: una línea por sección de primer y segundo nivel"""
+    if evento["tipo"] == "seccion" and evento["nivel"] <= 1:
+        print(f"{'  ' * evento['nivel']}{evento['nombre']}: {evento['segundos'] * 1000:.1f} ms")
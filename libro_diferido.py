@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+# Libro "diferido": el constructor escribe valores y estilos en hojas ligeras
+# (diccionarios por fila + índice etiqueta -> celda) y el libro real se emite
+# al guardar, ya sea como Workbook normal o en modo streaming (write_only).
+#
+# - Los estilos se combinan en estilos con nombre compartidos (uno por
+#   combinación fuente/borde/alineación/formato) en lugar de estilos por celda.
+# - Los bloques de filas (`bloque`) se generan al vuelo al guardar, así que en
+#   modo streaming las hojas anuales no ocupan memoria proporcional a HORIZONTE.
+# - `buscar(etiqueta)` es O(1) gracias al índice de etiquetas.
+
+import time
+from collections import defaultdict
+from copy import copy
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import NamedStyle
+from openpyxl.styles.fonts import DEFAULT_FONT
+from openpyxl.utils import get_column_letter, column_index_from_string
+from openpyxl.utils.cell import coordinate_from_string
+
+from instrumentacion import seccion
+
+# posiciones dentro de la combinación de estilo
+_FUENTE, _BORDE, _ALINEACION, _FORMATO = range(4)
+_SIN_ESTILO = (None, None, None, None)
+
+
+class _Dimension:
+    __slots__ = ("width",)
+
+    def __init__(self):
+        self.width = None
+
+
+class CeldaDiferida:
+    """Vista de una celda de HojaDiferida con la interfaz mínima de openpyxl"""
+    __slots__ = ("_hoja", "row", "column")
+
+    def __init__(self, hoja, row, column):
+        self._hoja, self.row, self.column = hoja, row, column
+
+    @property
+    def coordinate(self):
+        return f"{get_column_letter(self.column)}{self.row}"
+
+    @property
+    def value(self):
+        return self._hoja._filas.get(self.row, {}).get(self.column)
+
+    @value.setter
+    def value(self, valor):
+        self._hoja._poner(self.row, self.column, valor)
+
+    def _componente(self, pos):
+        return self._hoja._libro._combinacion(self._hoja._estilos.get(self.row, {}).get(self.column))[pos]
+
+    def _fijar(self, pos, valor):
+        self._hoja._estilo(self.row, self.column, pos, valor)
+
+    font = property(lambda s: s._componente(_FUENTE), lambda s, v: s._fijar(_FUENTE, v))
+    border = property(lambda s: s._componente(_BORDE), lambda s, v: s._fijar(_BORDE, v))
+    alignment = property(lambda s: s._componente(_ALINEACION), lambda s, v: s._fijar(_ALINEACION, v))
+    number_format = property(lambda s: s._componente(_FORMATO), lambda s, v: s._fijar(_FORMATO, v))
+
+
+class HojaDiferida:
+    """Hoja en memoria compacta; imita el subconjunto de Worksheet que usa el constructor"""
+
+    def __init__(self, libro, title):
+        self._libro = libro
+        self.title = title
+        self._filas = {}        # fila -> {columna: valor}
+        self._estilos = {}      # fila -> {columna: id de combinación}
+        self._etiquetas = {}    # texto -> (fila, columna) de su primera aparición
+        self._bloques = []      # (fila_ini, fila_fin, generador, estilos por columna)
+        self._fila_actual = 0
+        self.max_column = 0
+        self.column_dimensions = defaultdict(_Dimension)
+        self.freeze_panes = None
+        self._graficos = []
+        self._validaciones = []
+
+    # ---- acceso a celdas ----
+    def _tocar(self, row, column):
+        self._fila_actual = max(self._fila_actual, row)
+        self.max_column = max(self.max_column, column)
+
+    def _poner(self, row, column, valor):
+        self._tocar(row, column)
+        fila = self._filas.setdefault(row, {})
+        anterior = fila.get(column)
+        if isinstance(anterior, str) and self._etiquetas.get(anterior) == (row, column):
+            del self._etiquetas[anterior]
+        fila[column] = valor
+        if isinstance(valor, str) and not valor.startswith("="):
+            pos = self._etiquetas.get(valor)
+            if pos is None or (row, column) < pos:
+                self._etiquetas[valor] = (row, column)
+
+    def _estilo(self, row, column, pos, valor):
+        self._tocar(row, column)
+        fila = self._estilos.setdefault(row, {})
+        combo = list(self._libro._combinacion(fila.get(column)))
+        combo[pos] = valor
+        fila[column] = self._libro._id_combinacion(tuple(combo))
+
+    def cell(self, row, column, value=None):
+        self._tocar(row, column)
+        if value is not None:
+            self._poner(row, column, value)
+        return CeldaDiferida(self, row, column)
+
+    def __getitem__(self, clave):
+        if isinstance(clave, int):
+            self._tocar(clave, 1)
+            return [CeldaDiferida(self, clave, c) for c in range(1, self.max_column + 1)]
+        col, row = coordinate_from_string(clave)
+        return self.cell(row, column_index_from_string(col))
+
+    def __setitem__(self, clave, valor):
+        col, row = coordinate_from_string(clave)
+        self._poner(row, column_index_from_string(col), valor)
+
+    def append(self, valores):
+        row = self._fila_actual + 1
+        for c, v in enumerate(valores, start=1):
+            if v is not None:
+                self._poner(row, c, v)
+        self._fila_actual = row
+
+    def buscar(self, etiqueta):
+        """Celda con el texto `etiqueta` (la primera en orden fila/columna) o None"""
+        pos = self._etiquetas.get(etiqueta)
+        return CeldaDiferida(self, *pos) if pos else None
+
+    def bloque(self, fila_ini, n_filas, generador, estilos=None):
+        """Reserva n_filas a partir de fila_ini que se generan al guardar.
+
+        `generador(fila)` devuelve la lista de valores de la fila (columna 1 en
+        adelante); `estilos` es {columna: {"number_format": ..., "font": ...}}
+        y se aplica a todas las filas del bloque.
+        """
+        ids = {}
+        for col, comp in (estilos or {}).items():
+            combo = [None] * 4
+            for clave, pos in (("font", _FUENTE), ("border", _BORDE),
+                               ("alignment", _ALINEACION), ("number_format", _FORMATO)):
+                combo[pos] = comp.get(clave)
+            ids[col] = self._libro._id_combinacion(tuple(combo))
+            self.max_column = max(self.max_column, col)
+        self._bloques.append((fila_ini, fila_ini + n_filas, generador, ids))
+        self._fila_actual = max(self._fila_actual, fila_ini + n_filas - 1)
+
+    # ---- objetos de hoja ----
+    def add_chart(self, chart, anchor=None):
+        self._graficos.append((chart, anchor))
+
+    def add_data_validation(self, dv):
+        self._validaciones.append(dv)
+
+    @property
+    def max_row(self):
+        return self._fila_actual
+
+    def iter_filas(self):
+        """(fila, {columna: valor}, {columna: id estilo}) en orden, con bloques expandidos"""
+        bloques = sorted(self._bloques, key=lambda b: b[0])
+        filas = set(self._filas) | set(self._estilos)
+        for ini, fin, _, _ in bloques:
+            filas.update(range(ini, fin))
+        for r in sorted(filas):
+            valores, estilos = {}, {}
+            for ini, fin, gen, ids in bloques:
+                if ini <= r < fin:
+                    valores.update((c, v) for c, v in enumerate(gen(r), start=1) if v is not None)
+                    estilos.update(ids)
+            valores.update(self._filas.get(r, {}))
+            estilos.update(self._estilos.get(r, {}))
+            yield r, valores, estilos
+
+
+class LibroDiferido:
+    """Colección de HojaDiferida + nombres definidos; se materializa con `guardar`"""
+
+    def __init__(self):
+        self._hojas = []
+        self._combos = {}       # combinación -> id
+        self._por_id = [_SIN_ESTILO]
+        self._combos[_SIN_ESTILO] = 0
+        self.defined_names = {}
+        self.active = self.create_sheet("Sheet")
+
+    def create_sheet(self, title):
+        hoja = HojaDiferida(self, title)
+        self._hojas.append(hoja)
+        return hoja
+
+    def __getitem__(self, titulo):
+        for hoja in self._hojas:
+            if hoja.title == titulo:
+                return hoja
+        raise KeyError(titulo)
+
+    @property
+    def sheetnames(self):
+        return [h.title for h in self._hojas]
+
+    def _id_combinacion(self, combo):
+        if combo not in self._combos:
+            self._combos[combo] = len(self._por_id)
+            self._por_id.append(combo)
+        return self._combos[combo]
+
+    def _combinacion(self, cid):
+        return self._por_id[cid or 0]
+
+    def _estilos_con_nombre(self, wb):
+        """Registra un NamedStyle por combinación usada; devuelve id -> nombre"""
+        usados = set()
+        for hoja in self._hojas:
+            for fila in hoja._estilos.values():
+                usados.update(fila.values())
+            for _, _, _, ids in hoja._bloques:
+                usados.update(ids.values())
+        nombres = {}
+        for cid in sorted(usados - {0}):
+            fuente, borde, alineacion, formato = self._por_id[cid]
+            estilo = NamedStyle(name=f"EH_{cid}", font=fuente or DEFAULT_FONT)
+            if borde is not None:
+                estilo.border = borde
+            if alineacion is not None:
+                estilo.alignment = alineacion
+            if formato is not None:
+                estilo.number_format = formato
+            wb.add_named_style(estilo)
+            nombres[cid] = estilo.name
+        return nombres
+
+    def guardar(self, ruta, streaming=False, instrumentos=None):
+        """Emite el libro con openpyxl; `streaming=True` usa Workbook(write_only=True).
+
+        Con `instrumentos` (instrumentacion.Instrumentos) mide "emitir/<hoja>" (en
+        streaming incluye serializar), "generar/<hoja>", "estilos/<hoja>" y
+        "escribir", y cuenta celdas, fórmulas, estilos y gráficos por hoja.
+        """
+        wb = Workbook(write_only=streaming)
+        if not streaming:
+            wb.remove(wb.active)
+        nombres = self._estilos_con_nombre(wb)
+        plantillas = {}
+        for hoja in self._hojas:
+            with seccion(instrumentos, f"emitir/{hoja.title}"):
+                self._emitir_hoja(wb, hoja, streaming, nombres, plantillas, instrumentos)
+        for nombre, defn in self.defined_names.items():
+            wb.defined_names[nombre] = defn
+        with seccion(instrumentos, "escribir"):
+            wb.save(ruta)
+        if instrumentos is not None:
+            instrumentos.contar("(libro)", estilos_con_nombre=len(nombres))
+
+    def _emitir_hoja(self, wb, hoja, streaming, nombres, plantillas, instrumentos):
+        medir = instrumentos is not None
+        filas = hoja.iter_filas()
+        if medir:
+            conteo = {"celdas": 0, "formulas": 0, "estilos": 0}
+            reloj = {"generar": 0.0, "estilos": 0.0}
+            filas = _filas_medidas(filas, conteo, reloj)
+        ws = wb.create_sheet(hoja.title)
+        for col, dim in hoja.column_dimensions.items():
+            if dim.width is not None:
+                ws.column_dimensions[col].width = dim.width
+        if hoja.freeze_panes:
+            ws.freeze_panes = hoja.freeze_panes
+        for dv in hoja._validaciones:
+            ws.data_validations.append(dv)
+        for chart, anchor in hoja._graficos:
+            ws.add_chart(chart, anchor)
+        if streaming:
+            esperada = 1
+            for r, valores, estilos in filas:
+                for _ in range(esperada, r):
+                    ws.append([])
+                ws.append(_fila_streaming(ws, valores, estilos, nombres, plantillas))
+                esperada = r + 1
+        else:
+            for r, valores, estilos in filas:
+                for c, v in valores.items():
+                    ws.cell(r, c, v)
+                if medir:
+                    t0 = time.perf_counter()
+                for c, cid in estilos.items():
+                    if cid:
+                        ws.cell(r, c).style = nombres[cid]
+                if medir:
+                    reloj["estilos"] += time.perf_counter() - t0
+        if medir:
+            instrumentos.registrar(f"generar/{hoja.title}", reloj["generar"])
+            if not streaming:
+                instrumentos.registrar(f"estilos/{hoja.title}", reloj["estilos"])
+            instrumentos.contar(hoja.title, **conteo, graficos=len(hoja._graficos),
+                                validaciones=len(hoja._validaciones))
+
+
+def _filas_medidas(filas, conteo, reloj):
+    """Envuelve iter_filas: mide la generación y cuenta celdas, fórmulas y estilos"""
+    while True:
+        t0 = time.perf_counter()
+        try:
+            r, valores, estilos = next(filas)
+        except StopIteration:
+            reloj["generar"] += time.perf_counter() - t0
+            return
+        reloj["generar"] += time.perf_counter() - t0
+        conteo["celdas"] += len(valores)
+        conteo["formulas"] += sum(1 for v in valores.values() if isinstance(v, str) and v.startswith("="))
+        conteo["estilos"] += sum(1 for cid in estilos.values() if cid)
+        yield r, valores, estilos
+
+
+def _fila_streaming(ws, valores, estilos, nombres, plantillas):
+    ultima = max(list(valores) + [c for c, cid in estilos.items() if cid], default=0)
+    fila = []
+    for c in range(1, ultima + 1):
+        v = valores.get(c)
+        cid = estilos.get(c)
+        if cid:
+            celda = WriteOnlyCell(ws, v)
+            if cid not in plantillas:
+                celda.style = nombres[cid]
+                plantillas[cid] = celda._style
+            # copia del arreglo de estilo ya resuelto: evita buscar el nombre por celda
+            celda._style = copy(plantillas[cid])
+            fila.append(celda)
+        else:
+            fila.append(v)
+    return fila
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+# Genera muchos libros (variantes de parámetros) en paralelo con un pool de
+# procesos. Cada variante se construye de forma independiente con
+# construir_libro; un error en una variante se reporta y no detiene el lote.
+#
+# Entrada CSV: columnas nombre, horizonte, escenario_activo (opcionales) y una
+# columna por nombre definido de Parametros / bases (celdas vacías = valor por
+# defecto). Entrada JSON: lista de objetos
+#   {"nombre": ..., "params": {...}, "escenarios": [[nombre, f_H2, ...], ...],
+#    "horizonte": 20, "escenario_activo": "Base"}
+#
+# Uso: python lote_libros.py variantes.csv [--salida dir] [--procesos N]
+
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from construir_flujo_caja_v4_1a import construir_libro
+
+_COLUMNAS_CONTROL = {"nombre", "horizonte", "escenario_activo"}
+
+
+def leer_variantes(ruta):
+    """Lista de variantes {"nombre", "params", ...} desde un CSV o JSON"""
+    if ruta.lower().endswith(".json"):
+        with open(ruta, encoding="utf-8") as fh:
+            variantes = json.load(fh)
+    else:
+        variantes = []
+        with open(ruta, newline="", encoding="utf-8-sig") as fh:
+            for fila in csv.DictReader(fh):
+                # los valores se convierten en _construir: una celda mala sólo falla su variante
+                v = {"params": {k: x for k, x in fila.items()
+                                if k not in _COLUMNAS_CONTROL and x not in ("", None)}}
+                for k in _COLUMNAS_CONTROL:
+                    if fila.get(k):
+                        v[k] = fila[k]
+                variantes.append(v)
+    for i, v in enumerate(variantes, start=1):
+        v.setdefault("nombre", f"variante_{i:04d}")
+    return variantes
+
+
+def archivo(nombre):
+    """Nombre de archivo de una variante: lo que no sea letra, dígito, '.', '-' o '_' pasa a '_'"""
+    return re.sub(r"[^\w.-]", "_", str(nombre)) + ".xlsx"
+
+
+def _construir(variante, directorio, opciones):
+    """Construye una variante; devuelve (nombre, ruta, segundos, error)"""
+    t0 = time.perf_counter()
+    nombre = variante["nombre"]
+    try:
+        params = {k: float(x) for k, x in (variante.get("params") or {}).items()}
+        extra = {}
+        if variante.get("escenario_activo"):
+            extra["escenario_activo"] = variante["escenario_activo"]
+        ruta = construir_libro(params, variante.get("escenarios"),
+                               int(float(variante["horizonte"])) if variante.get("horizonte") else None,
+                               os.path.join(directorio, archivo(nombre)), **extra, **opciones)
+        return nombre, ruta, time.perf_counter() - t0, None
+    except Exception:
+        return nombre, None, time.perf_counter() - t0, traceback.format_exc()
+
+
+def construir_lote(variantes, directorio=".", procesos=None, opciones=None, progreso=None):
+    """Construye todas las variantes en un pool; devuelve la lista de resultados.
+
+    `progreso(hechos, total, resultado)` se llama al terminar cada variante.
+    """
+    os.makedirs(directorio, exist_ok=True)
+    # únicos ya como archivos (y sin distinguir mayúsculas, como en Windows / macOS)
+    vistos = {}
+    for v in variantes:
+        destino = archivo(v["nombre"]).casefold()
+        if destino in vistos:
+            raise ValueError(f"Las variantes {vistos[destino]!r} y {v['nombre']!r} escribirían el mismo "
+                             f"archivo {archivo(v['nombre'])}")
+        vistos[destino] = v["nombre"]
+    resultados = []
+    with ProcessPoolExecutor(max_workers=procesos) as pool:
+        futuros = {pool.submit(_construir, v, directorio, opciones or {}): v["nombre"] for v in variantes}
+        for futuro in as_completed(futuros):
+            try:
+                r = futuro.result()
+            except Exception:   # p. ej. el proceso murió (BrokenProcessPool)
+                r = (futuros[futuro], None, 0.0, traceback.format_exc())
+            resultados.append(r)
+            if progreso:
+                progreso(len(resultados), len(variantes), r)
+    return resultados
+
+
+def _reportar(hechos, total, resultado):
+    nombre, ruta, dt, error = resultado
+    estado = f"OK {ruta}" if error is None else "ERROR " + error.strip().splitlines()[-1]
+    print(f"[{hechos}/{total}] {nombre}: {estado} ({dt:.2f} s)", file=sys.stderr, flush=True)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Genera libros de flujo de caja para un lote de variantes")
+    ap.add_argument("variantes", help="CSV o JSON con las variantes")
+    ap.add_argument("--salida", default="libros", help="directorio de salida")
+    ap.add_argument("--procesos", type=int, default=None, help="procesos del pool (por defecto, núcleos)")
+    ap.add_argument("--streaming", action="store_true", help="emitir en modo write_only")
+    ap.add_argument("--sin-cache", action="store_true", help="no usar la caché de etapas")
+    args = ap.parse_args(argv)
+
+    opciones = {"streaming": args.streaming}
+    if args.sin_cache:
+        opciones["cache_dir"] = None
+    variantes = leer_variantes(args.variantes)
+    t0 = time.perf_counter()
+    resultados = construir_lote(variantes, args.salida, args.procesos, opciones, _reportar)
+    fallidas = [r for r in resultados if r[3] is not None]
+    print(f"{len(resultados) - len(fallidas)}/{len(resultados)} libros en "
+          f"{time.perf_counter() - t0:.2f} s", file=sys.stderr)
+    for nombre, _, _, error in fallidas:
+        print(f"--- {nombre}\n{error}", file=sys.stderr)
+    return 1 if fallidas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
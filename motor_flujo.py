@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+# Motor vectorizado (NumPy) del flujo de caja ElectroHub v4.1a.
+# Reproduce en memoria las series de Flujo_Base y Optimizacion_Flujo a partir
+# de los insumos de Parametros / Escenarios_v4, sin recalcular el libro.
+#
+# Todas las funciones trabajan por lotes: cada parámetro puede ser un escalar o
+# un arreglo de forma (n,), y las series resultantes tienen forma (n, años).
+#
+# Requiere: pip install numpy
+
+import numpy as np
+
+from solver_tir import tir_lote
+
+# ---------- tablas de insumos (fuente única para el constructor) ----------
+# (nombre definido, descripción, valor, unidad / nota) en el orden de Parametros
+PARAMETROS = [
+    ("HORIZONTE",     "Horizonte (años)", 15, "años"),
+    ("WACC",          "Tasa de descuento (WACC)", 0.08, "porcentaje"),
+    ("INFLACION",     "Inflación", 0.04, "porcentaje"),
+    ("CAPEX",         "CAPEX total inicial (MXN)", 84_300_000, "Incluye terreno (60% año 0 / 40% año 1)"),
+    ("CAPEX0",        "Distribución CAPEX año 0", 0.60, "porcentaje"),
+    ("CAPEX1",        "Distribución CAPEX año 1", 0.40, "porcentaje"),
+    ("ANIO_REP",      "Año reemplazo SAE", 10, "año"),
+    ("COSTO_REP",     "Costo reemplazo SAE (MXN)", 4_000_000, ""),
+    ("VALOR_TERRENO", "Valor residual terreno (MXN, año N)", 81_000_000, "año final"),
+    ("ING_H2_1",      "Ingresos H2 Año operativo 1 (MXN)", 12_600_000, "+2%/año"),
+    ("ING_O2_1",      "Ingresos O2 Año operativo 1 (MXN)", 6_720_000, "+2%/año"),
+    ("ING_FV_1",      "Ingresos FV/red Año operativo 1 (MXN)", 2_740_000, "-0.7%/año (FV=1.2 MW)"),
+    ("ING_EV_1",      "Ingresos carga EV Año operativo 1 (MXN)", 800_000, "+2%/año"),
+    ("G_H2",          "Crecimiento H2", 0.02, "porcentaje"),
+    ("G_O2",          "Crecimiento O2", 0.02, "porcentaje"),
+    ("G_FV",          "Crecimiento FV/red", -0.007, "porcentaje"),
+    ("G_EV",          "Crecimiento carga EV", 0.02, "porcentaje"),
+    ("OPEX_BASE_1",   "OPEX Base Año operativo 1 (MXN)", 2_600_000, "+3%/año"),
+    ("G_OPEX_BASE",   "Crecimiento OPEX Base", 0.03, "porcentaje"),
+    ("OPEX_LOGH2_1",  "OPEX Logística H2 Año op 1 (MXN)", 4_900_000, "+3%/año"),
+    ("G_OPEX_LOGH2",  "Crecimiento OPEX Logística H2", 0.03, "porcentaje"),
+    ("OPEX_TRATO2_1", "OPEX Tratamiento O2 Año op 1 (MXN)", 2_200_000, "+3%/año"),
+    ("G_OPEX_TRATO2", "Crecimiento OPEX Tratamiento O2", 0.03, "porcentaje"),
+    ("ANIO_OP",       "Año inicio de operación", 2, "año (0 y 1 = inversión)"),
+    ("RESERVA_PCT",   "Reserva liquidez (% OPEX Total)", 0.20, "optimización flujo de caja"),
+    ("TASA_CRED",     "Tasa interés línea de crédito", 0.06, "porcentaje"),
+]
+
+# (nombre definido, valor base año op 1, unidad / nota) de Escenarios_v4
+BASES = [
+    ("ING_H2_BASE",    12_600_000, "MXN/año"),
+    ("ING_O2_BASE",     6_720_000, "MXN/año"),
+    ("ING_FV_BASE",     2_740_000, "MXN/año (FV=1.2 MW)"),
+    ("ING_EV_BASE",       800_000, "MXN/año"),
+    ("OPEX_BASE_BASE",  2_600_000, "MXN/año"),
+    ("LOGH2_BASE",      4_900_000, "MXN/año"),
+    ("TRATO2_BASE",     2_200_000, "MXN/año"),
+]
+
+FACTORES = ["f_H2", "f_O2", "f_FV", "f_EV", "f_OPEX_BASE", "f_LOGH2", "f_TRATO2"]
+
+ESCENARIOS = [
+    ["Optimista",   170/150, 12/10, 1.10, 1.10, 0.95, 0.85, 0.90],
+    ["Base",        1.00,    1.00,  1.00, 1.00, 1.00, 1.00, 1.00],
+    ["Conservador", 130/150,  8/10, 0.90, 0.90, 1.05, 1.15, 1.10],
+]
+
+# Parametros!ING_*_1 / OPEX_*_1 = base de Escenarios_v4 × multiplicador activo
+VINCULOS = [
+    ("ING_H2_1",      "ING_H2_BASE",    "f_H2"),
+    ("ING_O2_1",      "ING_O2_BASE",    "f_O2"),
+    ("ING_FV_1",      "ING_FV_BASE",    "f_FV"),
+    ("ING_EV_1",      "ING_EV_BASE",    "f_EV"),
+    ("OPEX_BASE_1",   "OPEX_BASE_BASE", "f_OPEX_BASE"),
+    ("OPEX_LOGH2_1",  "LOGH2_BASE",     "f_LOGH2"),
+    ("OPEX_TRATO2_1", "TRATO2_BASE",    "f_TRATO2"),
+]
+
+# (clave, nivel año op 1, crecimiento) de cada serie que arranca en ANIO_OP
+INGRESOS = [
+    ("ing_h2", "ING_H2_1", "G_H2"),
+    ("ing_o2", "ING_O2_1", "G_O2"),
+    ("ing_fv", "ING_FV_1", "G_FV"),
+    ("ing_ev", "ING_EV_1", "G_EV"),
+]
+OPEX = [
+    ("opex_base",   "OPEX_BASE_1",   "G_OPEX_BASE"),
+    ("opex_logh2",  "OPEX_LOGH2_1",  "G_OPEX_LOGH2"),
+    ("opex_trato2", "OPEX_TRATO2_1", "G_OPEX_TRATO2"),
+]
+
+# multiplicador de escenario que escala cada serie (vía VINCULOS)
+FACTOR_SERIE = {clave: f for clave, nivel, _ in INGRESOS + OPEX
+                for nombre, _, f in VINCULOS if nombre == nivel}
+
+# columnas de Flujo_Base (A..P) y Optimizacion_Flujo (A..J) en orden de hoja
+COLUMNAS_FLUJO = [
+    "anio", "ing_h2", "ing_o2", "ing_fv", "ing_ev", "ingresos",
+    "opex_base", "opex_logh2", "opex_trato2", "opex_total",
+    "capex", "residual", "flujo", "factor", "flujo_desc", "van_acum",
+]
+COLUMNAS_OPTIMIZACION = [
+    "anio", "flujo", "opex_total", "reserva", "delta_reserva", "liquidez_ini",
+    "prestamo", "interes", "liquidez_fin", "deuda",
+]
+
+
+def parametros_base():
+    """Diccionario nombre -> valor con todos los insumos por defecto (escenario Base)"""
+    p = {nombre: valor for nombre, _, valor, _ in PARAMETROS}
+    p.update({nombre: valor for nombre, valor, _ in BASES})
+    p.update({f: 1.0 for f in FACTORES})
+    return p
+
+
+def multiplicadores(escenario):
+    """Multiplicadores f_* de un escenario de la tabla ESCENARIOS"""
+    for fila in ESCENARIOS:
+        if fila[0] == escenario:
+            return dict(zip(FACTORES, fila[1:]))
+    raise KeyError(f"Escenario desconocido: {escenario}")
+
+
+def resolver_parametros(cambios=None):
+    """Combina los cambios con los valores base y vincula ING_*_1 / OPEX_*_1.
+
+    Igual que en Parametros, los niveles del año operativo 1 se obtienen como
+    base × multiplicador, salvo que el llamador los fije explícitamente.
+    """
+    cambios = cambios or {}
+    p = parametros_base()
+    p.update(cambios)
+    for nombre, base, factor in VINCULOS:
+        if nombre not in cambios:
+            p[nombre] = np.multiply(p[base], p[factor])
+    return p
+
+
+def _lote(p, nombres):
+    """Convierte los parámetros pedidos en columnas (n, 1) con la misma n"""
+    cols = np.broadcast_arrays(*[np.asarray(p[k], dtype=float) for k in nombres])
+    return {k: np.atleast_1d(c).reshape(-1, 1) for k, c in zip(nombres, cols)}
+
+
+def flujo_base(p, n_anios=None, perfiles=None):
+    """Series anuales de Flujo_Base (años 0..n_anios-1) para un lote de parámetros.
+
+    Por defecto se calculan HORIZONTE+1 años, como en la hoja. `perfiles` es
+    {clave de INGRESOS/OPEX: montos anuales de los años operativos 1..N}
+    (perfiles_subanuales): en esos años reemplazan nivel·(1+g)^t, escalados por
+    el multiplicador del escenario; los años posteriores siguen la fórmula.
+    """
+    if n_anios is None:
+        n_anios = int(np.max(p["HORIZONTE"])) + 1
+    nombres = [n for n, _, _, _ in PARAMETROS]
+    q = _lote(p, nombres)
+    anio = np.arange(n_anios, dtype=float)
+    n = q["WACC"].shape[0]
+
+    # el año 0 es sólo inversión: ingresos y OPEX en cero aunque ANIO_OP <= 0
+    operando = (anio >= q["ANIO_OP"]) & (anio > 0)
+    t = np.where(operando, anio - q["ANIO_OP"], 0.0)
+
+    res = {"anio": np.broadcast_to(anio, (n, n_anios))}
+    for clave, nivel, g in INGRESOS + OPEX:
+        # nivel·(1+g)^t como exp(t·log1p(g)): evita pow elemento a elemento
+        res[clave] = np.where(operando, q[nivel] * np.exp(t * np.log1p(q[g])), 0.0)
+    for clave, montos in (perfiles or {}).items():
+        montos = np.asarray(montos, dtype=float)
+        f = _lote(p, [FACTOR_SERIE[clave]])[FACTOR_SERIE[clave]]
+        k = t.astype(int)
+        con_perfil = operando & (k < montos.size)
+        res[clave] = np.where(con_perfil, f * montos[np.minimum(k, montos.size - 1)], res[clave])
+    res["ingresos"] = res["ing_h2"] + res["ing_o2"] + res["ing_fv"] + res["ing_ev"]
+    res["opex_total"] = res["opex_base"] + res["opex_logh2"] + res["opex_trato2"]
+
+    capex = np.where(anio == 1, q["CAPEX"] * q["CAPEX1"],
+                     np.where(anio == q["ANIO_REP"], q["COSTO_REP"], 0.0))
+    capex[:, 0] = (q["CAPEX"] * q["CAPEX0"])[:, 0]
+    res["capex"] = capex
+    res["residual"] = np.where((anio == q["HORIZONTE"]) & (anio > 0), q["VALOR_TERRENO"], 0.0)
+
+    res["flujo"] = res["ingresos"] - res["opex_total"] - res["capex"] + res["residual"]
+    res["factor"] = (1 + q["WACC"]) ** anio
+    res["flujo_desc"] = res["flujo"] / res["factor"]
+    res["van_acum"] = np.cumsum(res["flujo_desc"], axis=1)
+    return res
+
+
+def optimizacion_flujo(flujo, opex_total, reserva_pct, tasa_cred):
+    """Recurrencia de liquidez / deuda de Optimizacion_Flujo.
+
+    El bucle es sobre años (la recurrencia es secuencial); cada paso opera
+    sobre el lote completo de escenarios.
+    """
+    flujo = np.atleast_2d(flujo)
+    opex_total = np.atleast_2d(opex_total)
+    reserva_pct = np.asarray(reserva_pct, dtype=float).reshape(-1, 1)
+    tasa_cred = np.asarray(tasa_cred, dtype=float).reshape(-1)
+    n, m = flujo.shape
+
+    reserva = opex_total * reserva_pct
+    delta = np.diff(reserva, axis=1, prepend=0.0)
+    liq_ini = np.zeros((n, m))
+    prestamo = np.zeros((n, m))
+    interes = np.zeros((n, m))
+    liq_fin = np.zeros((n, m))
+    deuda = np.zeros((n, m))
+    for j in range(m):
+        if j > 0:
+            liq_ini[:, j] = liq_fin[:, j - 1]
+            interes[:, j] = deuda[:, j - 1] * tasa_cred
+        disponible = liq_ini[:, j] + flujo[:, j] - delta[:, j]
+        prestamo[:, j] = np.maximum(0.0, -disponible)
+        liq_fin[:, j] = disponible + prestamo[:, j] - interes[:, j]
+        deuda[:, j] = (deuda[:, j - 1] if j > 0 else 0.0) + prestamo[:, j] + interes[:, j]
+
+    return {
+        "reserva": reserva, "delta_reserva": delta, "liquidez_ini": liq_ini,
+        "prestamo": prestamo, "interes": interes, "liquidez_fin": liq_fin,
+        "deuda": deuda,
+    }
+
+
+def van(flujo, wacc):
+    """VAN con el año 0 sin descontar (equivale a NPV(WACC, años 1..N) + año 0)"""
+    flujo = np.atleast_2d(flujo)
+    wacc = np.asarray(wacc, dtype=float).reshape(-1, 1)
+    factor = (1 + wacc) ** np.arange(flujo.shape[1])
+    return np.sum(flujo / factor, axis=1)
+
+
+def tir(flujo):
+    """TIR por lotes (NaN si no hay raíz o no converge); ver solver_tir.tir_lote"""
+    return tir_lote(flujo)[0]
+
+
+def indice_rentabilidad(flujo, wacc):
+    """PI = NPV(WACC, años 1..N) / |flujo año 0|"""
+    flujo = np.atleast_2d(flujo)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (van(flujo, wacc) - flujo[:, 0]) / np.abs(flujo[:, 0])
+
+
+def payback(van_acum):
+    """Primer año con VAN acumulado >= 0 (NaN si nunca se recupera)"""
+    van_acum = np.atleast_2d(van_acum)
+    recuperado = van_acum >= 0
+    anio = np.argmax(recuperado, axis=1).astype(float)
+    anio[~recuperado.any(axis=1)] = np.nan
+    return anio
+
+
+def calcular(cambios=None, n_anios=None, perfiles=None):
+    """Flujo_Base + Optimizacion_Flujo + KPIs para un lote de parámetros.
+
+    `cambios` sobrescribe cualquier nombre definido (Parametros, bases o f_*);
+    los valores pueden ser escalares o arreglos (n,) para evaluar n casos.
+    `perfiles`: montos anuales agregados de perfiles subanuales (ver flujo_base).
+    """
+    p = resolver_parametros(cambios)
+    res = flujo_base(p, n_anios, perfiles)
+    res.update(optimizacion_flujo(res["flujo"], res["opex_total"],
+                                  p["RESERVA_PCT"], p["TASA_CRED"]))
+    res["van"] = res["van_acum"][:, -1]
+    res["pi"] = indice_rentabilidad(res["flujo"], p["WACC"])
+    res["payback"] = payback(res["van_acum"])
+    return res
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+# Búsqueda de la política de reserva / crédito de Optimizacion_Flujo.
+#
+# Una política se describe con tres números:
+#   reserva_pct   reserva de liquidez como % del OPEX Total (RESERVA_PCT)
+#   colchon_pct   piso de caja operativa como % del OPEX Total: el crédito se
+#                 dispone en cuanto la caja caería por debajo (momento de disposición)
+#   amortizacion  fracción del excedente sobre el piso que se usa cada año para
+#                 pagar deuda (calendario de amortización; 0 = nunca se paga)
+#
+# La recurrencia liquidez/deuda se evalúa para miles de políticas a la vez
+# (lote en filas, bucle sobre años) y se elige la que minimiza la deuda máxima
+# o el interés total, sujeta a liquidez final + reserva >= liq_min_pct·OPEX en
+# todos los años. La búsqueda es una malla gruesa seguida de una malla fina
+# alrededor del mejor punto.
+#
+# Convención: el interés se paga en efectivo (se dispone crédito si no alcanza)
+# y no se capitaliza. La política actual (reserva = RESERVA_PCT, sin colchón ni
+# amortización) se evalúa con esta misma recurrencia, no con la de las columnas
+# D..J (que capitalizan el interés), para que la comparación sea entre modelos
+# iguales; el resumen lo indica.
+
+import numpy as np
+from openpyxl.styles import Font, Alignment
+from openpyxl.utils import get_column_letter
+
+bold = Font(bold=True)
+currency_fmt = '"$"#,##0;[RED]"$"#,##0'
+pct_fmt = '0.00%'
+
+OBJETIVOS = {
+    "deuda_max":     "Deuda máxima",
+    "interes_total": "Interés total",
+}
+LIQ_MIN_PCT = 0.10
+MALLA = {
+    "reserva_pct":  np.linspace(0.0, 0.50, 11),
+    "colchon_pct":  np.linspace(0.0, 0.50, 11),
+    "amortizacion": np.linspace(0.0, 1.00, 11),
+}
+POLITICA = list(MALLA)
+COLUMNAS_POLITICA = ["reserva", "interes", "prestamo", "pago", "liquidez_fin", "deuda"]
+
+
+def evaluar_politicas(flujo, opex_total, tasa_cred, reserva_pct, colchon_pct, amortizacion):
+    """Trayectorias (n, años) de un lote de políticas sobre una sola serie de flujo"""
+    flujo = np.asarray(flujo, dtype=float).reshape(1, -1)
+    opex_total = np.asarray(opex_total, dtype=float).reshape(1, -1)
+    rp, cp, am = (np.asarray(x, dtype=float).reshape(-1, 1)
+                  for x in np.broadcast_arrays(reserva_pct, colchon_pct, amortizacion))
+    n, m = rp.shape[0], flujo.shape[1]
+
+    reserva = opex_total * rp
+    delta = np.diff(reserva, axis=1, prepend=0.0)
+    piso = opex_total * cp
+    res = {k: np.zeros((n, m)) for k in COLUMNAS_POLITICA}
+    res["reserva"] = reserva
+    liq = np.zeros(n)
+    deuda = np.zeros(n)
+    for j in range(m):
+        interes = deuda * tasa_cred
+        disponible = liq + flujo[0, j] - delta[:, j] - interes
+        prestamo = np.maximum(0.0, piso[:, j] - disponible)
+        pago = np.minimum(deuda, am[:, 0] * np.maximum(0.0, disponible - piso[:, j]))
+        liq = disponible + prestamo - pago
+        deuda = deuda + prestamo - pago
+        res["interes"][:, j] = interes
+        res["prestamo"][:, j] = prestamo
+        res["pago"][:, j] = pago
+        res["liquidez_fin"][:, j] = liq
+        res["deuda"][:, j] = deuda
+    return res
+
+
+def _costo(tray, opex_total, objetivo, liq_min_pct):
+    valor = tray["deuda"].max(axis=1) if objetivo == "deuda_max" else tray["interes"].sum(axis=1)
+    factible = np.all(tray["liquidez_fin"] + tray["reserva"]
+                      >= liq_min_pct * np.asarray(opex_total).reshape(1, -1) - 1e-6, axis=1)
+    return valor, factible
+
+
+def _malla(ejes):
+    rejilla = np.meshgrid(*ejes.values(), indexing="ij")
+    return {k: g.ravel() for k, g in zip(ejes, rejilla)}
+
+
+def optimizar(flujo, opex_total, tasa_cred, objetivo="deuda_max", liq_min_pct=LIQ_MIN_PCT,
+              malla=None, refinar=True, reserva_actual=None):
+    """Mejor política factible; devuelve {"politica", "trayectoria", "valor", "evaluadas"}.
+
+    `malla` es {nombre: valores} para cada eje de POLITICA. Con `refinar`, se
+    evalúa una segunda malla de 11 puntos por eje en ±1 paso alrededor del mejor.
+    Con `reserva_actual` (RESERVA_PCT) agrega "actual" para comparar.
+    Lanza ValueError si ninguna política cumple la liquidez mínima.
+    """
+    if objetivo not in OBJETIVOS:
+        raise ValueError(f"Objetivo desconocido: {objetivo}")
+    ejes = {k: np.asarray(v, dtype=float) for k, v in (malla or MALLA).items()}
+    evaluadas = 0
+    mejor = None
+    for _ in range(2 if refinar else 1):
+        cand = _malla(ejes)
+        tray = evaluar_politicas(flujo, opex_total, tasa_cred, *(cand[k] for k in POLITICA))
+        valor, factible = _costo(tray, opex_total, objetivo, liq_min_pct)
+        evaluadas += valor.size
+        if factible.any():
+            # desempate: menor interés total y luego menor reserva
+            orden = np.lexsort((cand["reserva_pct"], tray["interes"].sum(axis=1),
+                                np.where(factible, valor, np.inf)))
+            i = orden[0]
+            if mejor is None or valor[i] <= mejor["valor"]:
+                mejor = {"politica": {k: float(cand[k][i]) for k in POLITICA},
+                         "trayectoria": {k: v[i] for k, v in tray.items()},
+                         "valor": float(valor[i])}
+        if mejor is None:
+            raise ValueError("Ninguna política cumple la liquidez mínima; amplía la malla")
+        # malla fina: ±1 paso de la malla actual alrededor del mejor punto
+        nuevos = {}
+        for k, v in ejes.items():
+            h = (v.max() - v.min()) / max(len(v) - 1, 1)
+            c = mejor["politica"][k]
+            lo, hi = max(c - h, ejes[k].min()), min(c + h, ejes[k].max())
+            nuevos[k] = np.linspace(lo, hi, 11) if hi > lo else np.array([c])
+        ejes = nuevos
+
+    resultado = {**mejor, "objetivo": objetivo, "liq_min_pct": liq_min_pct, "evaluadas": evaluadas}
+    if reserva_actual is not None:
+        tray = evaluar_politicas(flujo, opex_total, tasa_cred, reserva_actual, 0.0, 0.0)
+        valor, factible = _costo(tray, opex_total, objetivo, liq_min_pct)
+        resultado["actual"] = {"politica": {"reserva_pct": float(reserva_actual),
+                                            "colchon_pct": 0.0, "amortizacion": 0.0},
+                               "trayectoria": {k: v[0] for k, v in tray.items()},
+                               "valor": float(valor[0]), "factible": bool(factible[0])}
+    return resultado
+
+
+def escribir_politica(ws, resultado, columna=12):
+    """Escribe la trayectoria óptima junto a la tabla (fila r = año r-2) y un resumen"""
+    tray = resultado["trayectoria"]
+    m = tray["deuda"].size
+    c0 = columna
+    titulos = ["Reserva (óptima)", "Interés (óptima)", "Préstamo (óptima)", "Amortización (óptima)",
+               "Liquidez final (óptima)", "Deuda (óptima)"]
+    for k, t in enumerate(titulos):
+        celda = ws.cell(1, c0 + k, t)
+        celda.font = bold
+        celda.alignment = Alignment(horizontal="center")
+    ws.bloque(2, m, lambda r: [None] * (c0 - 1) + [float(tray[k][r - 2]) for k in COLUMNAS_POLITICA],
+              {c0 + k: {"number_format": currency_fmt} for k in range(len(COLUMNAS_POLITICA))})
+    for k in range(len(COLUMNAS_POLITICA)):
+        ws.column_dimensions[get_column_letter(c0 + k)].width = 20
+
+    # resumen: política óptima vs. actual
+    cr = c0 + len(COLUMNAS_POLITICA) + 1
+    etiqueta = OBJETIVOS[resultado["objetivo"]]
+    ws.cell(1, cr, f"Política óptima – mín. {etiqueta.lower()}").font = bold
+    ws.cell(1, cr + 1, "Óptima").font = bold
+    filas = [("Reserva (% OPEX Total)", "reserva_pct", pct_fmt),
+             ("Piso de caja (% OPEX Total)", "colchon_pct", pct_fmt),
+             ("Amortización (% excedente)", "amortizacion", pct_fmt)]
+    actual = resultado.get("actual")
+    if actual:
+        ws.cell(1, cr + 2, "Actual").font = bold
+    for i, (texto, clave, fmt) in enumerate(filas, start=2):
+        ws.cell(i, cr, texto)
+        ws.cell(i, cr + 1, resultado["politica"][clave]).number_format = fmt
+        if actual:
+            ws.cell(i, cr + 2, actual["politica"][clave]).number_format = fmt
+    metricas = [("Deuda máxima", lambda t: t["deuda"].max()),
+                ("Interés total", lambda t: t["interes"].sum()),
+                ("Deuda final", lambda t: t["deuda"][-1])]
+    for i, (texto, f) in enumerate(metricas, start=2 + len(filas)):
+        ws.cell(i, cr, texto)
+        ws.cell(i, cr + 1, float(f(tray))).number_format = currency_fmt
+        if actual:
+            ws.cell(i, cr + 2, float(f(actual["trayectoria"]))).number_format = currency_fmt
+    i = 2 + len(filas) + len(metricas)
+    ws.cell(i, cr, "Liquidez mínima (% OPEX Total)")
+    ws.cell(i, cr + 1, resultado["liq_min_pct"]).number_format = pct_fmt
+    if actual:
+        ws.cell(i + 1, cr, "Actual cumple liquidez mínima")
+        ws.cell(i + 1, cr + 2, "sí" if actual["factible"] else "no")
+    ws.cell(i + 2, cr, "Políticas evaluadas")
+    ws.cell(i + 2, cr + 1, resultado["evaluadas"])
+    if actual:
+        ws.cell(i + 3, cr, "Ambas con interés pagado en efectivo (D..J lo capitalizan)")
+    ws.column_dimensions[get_column_letter(cr)].width = 34
+    ws.column_dimensions[get_column_letter(cr + 1)].width = 18
+    ws.column_dimensions[get_column_letter(cr + 2)].width = 18
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+# Perfiles subanuales (horarios u mensuales) de producción, precio y demanda.
+#
+# Un archivo de perfil tiene una fila por periodo (8760 por año en modo
+# horario, 12 en mensual; años de 365 días) a partir del primer año operativo
+# (ANIO_OP) y columnas por serie de Flujo_Base (claves de INGRESOS / OPEX):
+#   ing_fv                  monto del periodo (MXN)
+#   ing_fv:cantidad, ing_fv:precio   monto = cantidad × precio del periodo
+# Las demás columnas (fecha, hora, ...) se ignoran. Formatos: CSV o .npy con
+# arreglo estructurado (se lee con mmap, sin copiar).
+#
+# El archivo se recorre por bloques de filas y cada bloque se suma en un
+# acumulador (años, 12) por serie, así que la memoria es O(bloque + años·12)
+# aunque el perfil sea horario a 40 años (350 400 filas). De ahí salen:
+#   - los montos anuales que reemplazan nivel·(1+g)^t en Flujo_Base
+#     (motor_flujo.flujo_base(perfiles=...) y la hoja Perfiles), y
+#   - los montos mensuales para la hoja Liquidez_Mensual, que repite la
+#     recurrencia de Optimizacion_Flujo mes a mes (interés TASA_CRED/12).
+# En Liquidez_Mensual las series sin perfil (y los años fuera del perfil) se
+# reparten en 12 partes iguales; CAPEX va en el primer mes del año y el valor
+# residual en el último.
+
+import csv
+
+import numpy as np
+from openpyxl.chart import LineChart, Reference
+from openpyxl.styles import Font, Alignment, Border, Side
+from openpyxl.utils import get_column_letter
+
+import motor_flujo as mf
+
+bold = Font(bold=True)
+thin = Side(style="thin", color="999999")
+border_bottom = Border(bottom=thin)
+currency_fmt = '"$"#,##0;[RED]"$"#,##0'
+
+RESOLUCIONES = {"horaria": 8760, "mensual": 12}
+BLOQUE_FILAS = 8760 * 4
+DIAS_MES = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])
+_MES_DE_HORA = np.repeat(np.arange(12), DIAS_MES * 24)
+MESES = ["Ene", "Feb", "Mar", "Abr", "May", "Jun", "Jul", "Ago", "Sep", "Oct", "Nov", "Dic"]
+SERIES = [clave for clave, _, _ in mf.INGRESOS + mf.OPEX]
+COLUMNAS_MENSUAL = ["ingresos", "opex_total", "capex", "residual", "flujo", "delta_reserva",
+                    "liquidez_ini", "prestamo", "interes", "liquidez_fin", "deuda"]
+
+
+def _columnas_serie(nombres):
+    """{serie: (índice monto,) o (índice cantidad, índice precio)} desde los encabezados"""
+    idx = {n.strip(): i for i, n in enumerate(nombres)}
+    plan = {}
+    for n in idx:
+        serie, _, parte = n.partition(":")
+        if serie not in SERIES:
+            if parte:
+                raise ValueError(f"Columna de perfil desconocida: {n}")
+            continue
+        if not parte:
+            plan[serie] = (idx[n],)
+        elif parte in ("cantidad", "precio"):
+            otra = f"{serie}:{'precio' if parte == 'cantidad' else 'cantidad'}"
+            if otra not in idx:
+                raise ValueError(f"La columna {n} requiere también {otra}")
+            plan[serie] = (idx[f"{serie}:cantidad"], idx[f"{serie}:precio"])
+        else:
+            raise ValueError(f"Columna de perfil desconocida: {n}")
+    if not plan:
+        raise ValueError(f"El perfil no tiene columnas de series ({', '.join(SERIES)})")
+    return plan
+
+
+def leer_bloques(ruta, filas=BLOQUE_FILAS):
+    """(encabezados, iterador de bloques (filas, columnas) float) de un CSV o .npy"""
+    if ruta.lower().endswith(".npy"):
+        arr = np.load(ruta, mmap_mode="r")
+        if arr.dtype.names is None:
+            raise ValueError("El .npy de perfiles debe ser un arreglo estructurado con nombres de columna")
+        nombres = list(arr.dtype.names)
+        usadas = sorted({i for cols in _columnas_serie(nombres).values() for i in cols})
+
+        def bloques():
+            for i in range(0, arr.shape[0], filas):
+                trozo = arr[i:i + filas]
+                bloque = np.full((trozo.shape[0], len(nombres)), np.nan)
+                for j in usadas:
+                    bloque[:, j] = trozo[nombres[j]]
+                yield bloque
+        return nombres, bloques()
+
+    # el encabezado se valida antes de dejar el archivo abierto; el generador lo reabre
+    with open(ruta, newline="", encoding="utf-8-sig") as fh:
+        nombres = next(csv.reader(fh), None)
+    if not nombres:
+        raise ValueError(f"{ruta}: CSV de perfiles vacío")
+    usadas = sorted({i for cols in _columnas_serie(nombres).values() for i in cols})
+
+    def bloques():
+        with open(ruta, newline="", encoding="utf-8-sig") as fh:
+            lector = csv.reader(fh)
+            next(lector)
+            lote = []
+            for fila in lector:
+                if not fila:
+                    continue
+                lote.append([fila[i] for i in usadas])
+                if len(lote) == filas:
+                    yield _bloque_csv(lote, usadas, len(nombres))
+                    lote = []
+            if lote:
+                yield _bloque_csv(lote, usadas, len(nombres))
+    return nombres, bloques()
+
+
+def _bloque_csv(lote, usadas, n_columnas):
+    """Bloque denso con NaN en las columnas no numéricas que no se usan"""
+    bloque = np.full((len(lote), n_columnas), np.nan)
+    bloque[:, usadas] = np.asarray(lote, dtype=float)
+    return bloque
+
+
+def agregar(ruta, resolucion="horaria", filas=BLOQUE_FILAS):
+    """Montos mensuales por serie: {"mensual": {serie: (años, 12)}, "anios": N, ...}"""
+    if resolucion not in RESOLUCIONES:
+        raise ValueError(f"Resolución desconocida: {resolucion} ({', '.join(RESOLUCIONES)})")
+    por_anio = RESOLUCIONES[resolucion]
+    mes_de_periodo = _MES_DE_HORA if resolucion == "horaria" else np.arange(12)
+    nombres, bloques = leer_bloques(ruta, filas)
+    plan = _columnas_serie(nombres)
+    acumulado = {s: np.zeros(12 * 8) for s in plan}     # crece por duplicación
+    total = 0
+    for bloque in bloques:
+        periodo = total + np.arange(bloque.shape[0])
+        indice = (periodo // por_anio) * 12 + mes_de_periodo[periodo % por_anio]
+        tam = int(indice[-1]) + 1
+        for s, cols in plan.items():
+            if acumulado[s].size < tam:
+                acumulado[s] = np.concatenate([acumulado[s], np.zeros(max(tam, 2 * acumulado[s].size)
+                                                                      - acumulado[s].size)])
+            monto = bloque[:, cols[0]] if len(cols) == 1 else bloque[:, cols[0]] * bloque[:, cols[1]]
+            if not np.all(np.isfinite(monto)):
+                raise ValueError(f"Valores no numéricos en la serie {s} del perfil")
+            acumulado[s][:tam] += np.bincount(indice, weights=monto, minlength=tam)
+        total += bloque.shape[0]
+    if total == 0 or total % por_anio:
+        raise ValueError(f"El perfil {resolucion} debe cubrir años completos "
+                         f"({por_anio} filas por año); tiene {total} filas")
+    anios = total // por_anio
+    return {"mensual": {s: a[:anios * 12].reshape(anios, 12) for s, a in acumulado.items()},
+            "anios": anios, "resolucion": resolucion, "periodos": total}
+
+
+def anuales(perfil):
+    """{serie: montos anuales de los años operativos 1..N} para motor_flujo.flujo_base"""
+    return {s: m.sum(axis=1) for s, m in perfil["mensual"].items()}
+
+
+def flujo_mensual(res, p, perfil=None):
+    """Series mensuales (años·12,) de una corrida de motor_flujo (primer caso del lote)"""
+    m = res["flujo"].shape[1]
+    anio_op = int(np.asarray(p["ANIO_OP"]).ravel()[0])
+    mensual = {}
+    for s in SERIES:
+        serie = np.repeat(res[s][0] / 12.0, 12).reshape(m, 12)
+        if perfil and s in perfil["mensual"]:
+            f = float(np.asarray(p[mf.FACTOR_SERIE[s]]).ravel()[0])
+            for k in range(perfil["anios"]):
+                j = anio_op + k
+                if 0 < j < m:
+                    serie[j] = f * perfil["mensual"][s][k]
+        mensual[s] = serie
+    ingresos = sum(mensual[s] for s, _, _ in mf.INGRESOS)
+    opex = sum(mensual[s] for s, _, _ in mf.OPEX)
+    capex = np.zeros((m, 12))
+    capex[:, 0] = res["capex"][0]
+    residual = np.zeros((m, 12))
+    residual[:, 11] = res["residual"][0]
+    return {"ingresos": ingresos.ravel(), "opex_total": opex.ravel(), "capex": capex.ravel(),
+            "residual": residual.ravel(), "flujo": (ingresos - opex - capex + residual).ravel()}
+
+
+def liquidez_mensual(res, p, perfil=None):
+    """Recurrencia de Optimizacion_Flujo mes a mes; dict de series (años·12,)"""
+    out = flujo_mensual(res, p, perfil)
+    m = res["flujo"].shape[1]
+    reserva_pct = float(np.asarray(p["RESERVA_PCT"]).ravel()[0])
+    tasa = float(np.asarray(p["TASA_CRED"]).ravel()[0]) / 12.0
+    # la reserva se fija con el OPEX anual y su cambio se aporta en el primer mes del año
+    delta = np.zeros((m, 12))
+    delta[:, 0] = np.diff(res["opex_total"][0] * reserva_pct, prepend=0.0)
+    out["delta_reserva"] = delta.ravel()
+    n = 12 * m
+    for k in ("liquidez_ini", "prestamo", "interes", "liquidez_fin", "deuda"):
+        out[k] = np.zeros(n)
+    liq = deuda = 0.0
+    for i in range(n):
+        interes = deuda * tasa
+        disponible = liq + out["flujo"][i] - out["delta_reserva"][i]
+        prestamo = max(0.0, -disponible)
+        out["liquidez_ini"][i] = liq
+        liq = disponible + prestamo - interes
+        deuda = deuda + prestamo + interes
+        out["prestamo"][i], out["interes"][i] = prestamo, interes
+        out["liquidez_fin"][i], out["deuda"][i] = liq, deuda
+    return out
+
+
+def hoja_perfiles(wb, perfil, titulo="Perfiles"):
+    """Montos anuales agregados por serie (fila k+1 = año operativo k).
+
+    Devuelve (hoja, {serie: letra de columna}, celda con el número de años del
+    perfil) para las fórmulas de Flujo_Base y el nombre PERFIL_ANIOS.
+    """
+    ws = wb.create_sheet(titulo)
+    series = [s for s in SERIES if s in perfil["mensual"]]
+    totales = anuales(perfil)
+    ws.append(["Año operativo"] + [f"{s} (MXN)" for s in series])
+    for c in ws[1]:
+        c.font = bold
+        c.alignment = Alignment(horizontal="center")
+    ws.bloque(2, perfil["anios"], lambda r: [r - 1] + [float(totales[s][r - 2]) for s in series],
+              {c: {"number_format": currency_fmt} for c in range(2, len(series) + 2)})
+    columnas = {s: get_column_letter(c) for c, s in enumerate(series, start=2)}
+    cr = len(series) + 3
+    ws.cell(1, cr, "Perfil").font = bold
+    ws.cell(2, cr, "Resolución"); ws.cell(2, cr + 1, perfil["resolucion"])
+    ws.cell(3, cr, "Periodos"); ws.cell(3, cr + 1, perfil["periodos"])
+    ws.cell(4, cr, "Años de perfil"); ws.cell(4, cr + 1, perfil["anios"])
+    ws.column_dimensions["A"].width = 14
+    for col in columnas.values():
+        ws.column_dimensions[col].width = 18
+    ws.column_dimensions[get_column_letter(cr)].width = 16
+    ws.freeze_panes = "A2"
+    return ws, columnas, f"{titulo}!${get_column_letter(cr + 1)}$4"
+
+
+def formula_serie(r, clave, columna, titulo="Perfiles"):
+    """Fórmula de Flujo_Base para una serie con perfil (la fórmula anual fuera del perfil)"""
+    _, nivel, g = next(x for x in mf.INGRESOS + mf.OPEX if x[0] == clave)
+    f = mf.FACTOR_SERIE[clave]
+    return (f"=IF(A{r}<ANIO_OP,0,IF(A{r}-ANIO_OP<PERFIL_ANIOS,"
+            f"INDEX({titulo}!{columna}:{columna},A{r}-ANIO_OP+2)*{f},"
+            f"{nivel}*(1+{g})^(A{r}-ANIO_OP)))")
+
+
+def hoja_liquidez_mensual(wb, mensual, deuda_anual, titulo="Liquidez_Mensual"):
+    """Tabla mes a mes, resumen contra el cálculo anual y gráfico de liquidez"""
+    ws = wb.create_sheet(titulo)
+    encabezados = ["Año", "Mes", "Ingresos", "OPEX Total", "CAPEX/Reemplazos", "Valor residual",
+                   "Flujo neto", "Δ Reserva", "Liquidez inicial", "Préstamo", "Interés deuda",
+                   "Liquidez final", "Deuda acumulada"]
+    ws.append(encabezados)
+    for c in ws[1]:
+        c.font = bold
+        c.alignment = Alignment(horizontal="center")
+    n = mensual["flujo"].size
+    ws.bloque(2, n, lambda r: [(r - 2) // 12, MESES[(r - 2) % 12]]
+              + [float(mensual[k][r - 2]) for k in COLUMNAS_MENSUAL],
+              {c: {"number_format": currency_fmt} for c in range(3, len(encabezados) + 1)})
+    ws.column_dimensions["A"].width = 6
+    ws.column_dimensions["B"].width = 6
+    for c in range(3, len(encabezados) + 1):
+        ws.column_dimensions[get_column_letter(c)].width = 17
+
+    # resumen: lo que el cálculo anual no ve
+    cr = len(encabezados) + 2
+    liq = mensual["liquidez_fin"]
+    i_min = int(np.argmin(liq))
+    ws.cell(1, cr, "Resumen mensual").font = bold
+    filas = [
+        ("Liquidez final mínima", float(liq[i_min]), currency_fmt),
+        ("Mes de la liquidez mínima", f"Año {i_min // 12} {MESES[i_min % 12]}", None),
+        ("Deuda máxima (mensual)", float(mensual["deuda"].max()), currency_fmt),
+        ("Deuda máxima (anual, Optimizacion_Flujo)", float(np.max(deuda_anual)), currency_fmt),
+        ("Meses con préstamo", int(np.sum(mensual["prestamo"] > 0)), None),
+    ]
+    for i, (texto, valor, fmt) in enumerate(filas, start=2):
+        ws.cell(i, cr, texto)
+        celda = ws.cell(i, cr + 1, valor)
+        if fmt:
+            celda.number_format = fmt
+    ws.column_dimensions[get_column_letter(cr)].width = 40
+    ws.column_dimensions[get_column_letter(cr + 1)].width = 18
+
+    ch = LineChart(); ch.title = "Liquidez final mensual"; ch.y_axis.title = "MXN"; ch.x_axis.title = "Mes"
+    ch.add_data(Reference(ws, min_col=12, min_row=1, max_row=1 + n), titles_from_data=True)
+    ch.height, ch.width = 9, 22
+    ws.add_chart(ch, f"{get_column_letter(cr)}9")
+    ws.freeze_panes = "C2"
+    return ws
@@ -0,0 +1,316 @@
+# -*- coding: utf-8 -*-
+# Consolidación de un portafolio de sitios ElectroHub.
+#
+# Cada sitio es un juego de insumos de Parametros / Escenarios_v4 (CAPEX,
+# VALOR_TERRENO, ANIO_OP, HORIZONTE, ...) más:
+#   escenario  fila de ESCENARIOS cuyos multiplicadores se aplican (Base)
+#   inicio     año del portafolio en que arranca el año 0 del sitio
+#   fv_mw      capacidad FV; escala ING_FV_BASE respecto de FV_MW_REFERENCIA
+#
+# Los sitios se evalúan por lotes en motor_flujo (una fila por sitio, con
+# años más allá del HORIZONTE de cada sitio en cero) y, opcionalmente, los
+# lotes se reparten en un pool de procesos. De cada lote sólo se conservan la
+# fila de resumen por sitio y las series consolidadas en el calendario del
+# portafolio, así que la memoria no crece con el número de sitios × años.
+#
+# KPIs del portafolio:
+#   VAN    suma de los VAN de los sitios, cada uno descontado con su WACC
+#          hasta el año 0 del portafolio
+#   TIR    del flujo consolidado
+#   deuda  máxima de la suma de las deudas de cada sitio (cada sitio se
+#          financia solo) y máxima con caja consolidada (la recurrencia de
+#          Optimizacion_Flujo sobre el flujo y la reserva sumados, a TASA_CRED).
+#          En ambas, un sitio sale al cierre de su HORIZONTE con su caja y su
+#          deuda de ese año (los socios retiran la una y liquidan la otra)
+#
+# Entrada CSV: columnas nombre, escenario, inicio, fv_mw, horizonte (opcionales)
+# y una columna por nombre definido; JSON: lista de
+#   {"nombre": ..., "params": {...}, "escenario": "Base", "inicio": 0, "fv_mw": 1.2}
+#
+# Uso: python portafolio_sitios.py sitios.csv [--salida Portafolio.xlsx] [--procesos N]
+
+import argparse
+import csv
+import json
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from openpyxl.chart import LineChart, Reference
+from openpyxl.styles import Font, Alignment, Border, Side
+from openpyxl.utils import get_column_letter
+
+import motor_flujo as mf
+from solver_tir import tir_lote, payback_interpolado, ESTADOS
+
+bold = Font(bold=True)
+border_bottom = Border(bottom=Side(style="thin", color="999999"))
+currency_fmt = '"$"#,##0;[RED]"$"#,##0'
+pct_fmt = '0.00%'
+
+FV_MW_REFERENCIA = 1.2   # ING_FV_BASE corresponde a un arreglo FV de 1.2 MW
+SITIOS_POR_LOTE = 256
+_CONTROL = {"nombre", "escenario", "inicio", "fv_mw", "horizonte"}
+_VALIDOS = {n for n, _, _, _ in mf.PARAMETROS} | {n for n, _, _ in mf.BASES}
+
+SERIES = ("flujo", "reserva", "deuda", "deuda_cierre", "caja_cierre", "operando")
+RESUMEN = ["nombre", "escenario", "inicio", "ANIO_OP", "HORIZONTE", "CAPEX", "VALOR_TERRENO",
+           "van", "tir", "estado_tir", "payback", "deuda_max"]
+
+
+def leer_sitios(ruta):
+    """Lista de sitios {"nombre", "params", "escenario", "inicio", "fv_mw"} desde CSV o JSON"""
+    if ruta.lower().endswith(".json"):
+        with open(ruta, encoding="utf-8") as fh:
+            sitios = json.load(fh)
+    else:
+        sitios = []
+        with open(ruta, newline="", encoding="utf-8-sig") as fh:
+            for fila in csv.DictReader(fh):
+                s = {"params": {k: float(x) for k, x in fila.items()
+                                if k not in _CONTROL and x not in ("", None)}}
+                for k in _CONTROL:
+                    if fila.get(k) not in ("", None):
+                        s[k] = fila[k]
+                sitios.append(s)
+    for i, s in enumerate(sitios, start=1):
+        s.setdefault("nombre", f"sitio_{i:04d}")
+        if int(float(s.get("inicio") or 0)) < 0:
+            raise ValueError(f"Sitio {s['nombre']}: el año de inicio no puede ser negativo")
+    return sitios
+
+
+def _cambios(sitio):
+    """Insumos del sitio para motor_flujo: multiplicadores del escenario + params + fv_mw"""
+    params = dict(sitio.get("params") or {})
+    desconocidos = set(params) - _VALIDOS
+    if desconocidos:
+        raise ValueError(f"Sitio {sitio['nombre']}: parámetros desconocidos {sorted(desconocidos)}")
+    if sitio.get("horizonte") not in (None, ""):
+        params["HORIZONTE"] = sitio["horizonte"]
+    params["HORIZONTE"] = int(float(params.get("HORIZONTE", mf.parametros_base()["HORIZONTE"])))
+    if sitio.get("fv_mw") not in (None, ""):
+        base = params.get("ING_FV_BASE", mf.parametros_base()["ING_FV_BASE"])
+        params["ING_FV_BASE"] = base * float(sitio["fv_mw"]) / FV_MW_REFERENCIA
+    escenario = sitio.get("escenario") or "Base"
+    if escenario not in {fila[0] for fila in mf.ESCENARIOS}:
+        raise ValueError(f"Sitio {sitio['nombre']}: escenario desconocido {escenario}")
+    return {**mf.multiplicadores(escenario), **params}
+
+
+def _calendario(sitios):
+    """Años del calendario del portafolio (hasta el último año de horizonte de cualquier sitio)"""
+    return max(int(float(s.get("inicio") or 0)) + _cambios(s)["HORIZONTE"] for s in sitios) + 1
+
+
+def _elemento(x, i):
+    """Elemento i de un parámetro que puede ser escalar o arreglo (n,)"""
+    x = np.asarray(x, dtype=float)
+    return float(x if x.ndim == 0 else x[i])
+
+
+def evaluar_lote(sitios, n_calendario):
+    """Resumen por sitio y series consolidadas (calendario) de un lote de sitios"""
+    # cada sitio se resuelve por separado (ING_*_1 / OPEX_*_1 vinculados a sus propios
+    # multiplicadores) y luego se apilan: un sitio no depende de sus vecinos de lote
+    resueltos = [mf.resolver_parametros(_cambios(s)) for s in sitios]
+    p = {k: np.array([float(r[k]) for r in resueltos]) for k in resueltos[0]}
+    horizonte = p["HORIZONTE"].astype(int)
+    res = mf.flujo_base(p, n_anios=n_calendario)
+
+    # años posteriores al horizonte de cada sitio: el sitio ya no existe (sin
+    # operación, reserva ni reposición). Al cierre del horizonte sale con su caja
+    # y su deuda (los socios retiran la una y liquidan la otra), así que no entra
+    # en las sumas de esos años; la caja consolidada aplica la misma regla
+    anios = np.arange(n_calendario)[None, :]
+    vigente = anios <= horizonte[:, None]
+    cierre = anios == horizonte[:, None]
+    for k in ("flujo", "opex_total", "flujo_desc", "ingresos"):
+        res[k] = np.where(vigente, res[k], 0.0)
+    res.update(mf.optimizacion_flujo(res["flujo"], res["opex_total"], p["RESERVA_PCT"], p["TASA_CRED"]))
+    res["deuda_cierre"] = np.where(cierre, res["deuda"], 0.0)
+    res["caja_cierre"] = np.where(cierre, res["liquidez_fin"], 0.0)
+    res["deuda"] = np.where(vigente, res["deuda"], 0.0)
+    van_acum = np.cumsum(res["flujo_desc"], axis=1)
+    van = van_acum[:, -1]
+    tir, estado = tir_lote(res["flujo"])
+    payback = payback_interpolado(van_acum)
+
+    inicio = np.array([int(float(s.get("inicio") or 0)) for s in sitios])
+    wacc = np.broadcast_to(np.asarray(p["WACC"], dtype=float), inicio.shape)
+    cons = {k: np.zeros(n_calendario) for k in SERIES}
+    for i in range(len(sitios)):
+        m = n_calendario - inicio[i]
+        cons["flujo"][inicio[i]:] += res["flujo"][i, :m]
+        cons["reserva"][inicio[i]:] += res["reserva"][i, :m]
+        cons["deuda"][inicio[i]:] += res["deuda"][i, :m]
+        cons["deuda_cierre"][inicio[i]:] += res["deuda_cierre"][i, :m]
+        cons["caja_cierre"][inicio[i]:] += res["caja_cierre"][i, :m]
+        cons["operando"][inicio[i]:] += res["ingresos"][i, :m] != 0
+
+    filas = []
+    for i, s in enumerate(sitios):
+        filas.append({"nombre": s["nombre"], "escenario": s.get("escenario") or "Base",
+                      "inicio": int(inicio[i]), "ANIO_OP": _elemento(p["ANIO_OP"], i),
+                      "HORIZONTE": int(horizonte[i]), "CAPEX": _elemento(p["CAPEX"], i),
+                      "VALOR_TERRENO": _elemento(p["VALOR_TERRENO"], i), "van": float(van[i]),
+                      "tir": float(tir[i]), "estado_tir": ESTADOS[int(estado[i])],
+                      "payback": float(payback[i]), "deuda_max": float(res["deuda"][i, vigente[i]].max())})
+    return {"filas": filas, "consolidado": cons,
+            "van": float(np.sum(van / (1 + wacc) ** inicio))}
+
+
+def caja_consolidada(flujo, reserva, deuda_cierre, caja_cierre, tasa_cred):
+    """Deuda y liquidez de la caja común (recurrencia de Optimizacion_Flujo).
+
+    Al inicio del año siguiente al cierre de cada sitio, la caja común pierde
+    la caja y la deuda que ese sitio tenía al cierre (la deuda común no baja de
+    cero), igual que en la suma de sitios.
+    """
+    delta = np.diff(reserva, prepend=0.0)
+    m = flujo.size
+    deuda, liquidez = np.zeros(m), np.zeros(m)
+    d, liq = 0.0, 0.0
+    for j in range(m):
+        if j > 0:
+            d = max(0.0, d - deuda_cierre[j - 1])
+            liq -= caja_cierre[j - 1]
+        interes = d * tasa_cred
+        disponible = liq + flujo[j] - delta[j]
+        prestamo = max(0.0, -disponible)
+        liq = disponible + prestamo - interes
+        d = d + prestamo + interes
+        deuda[j], liquidez[j] = d, liq
+    return deuda, liquidez
+
+
+def consolidar(sitios, procesos=None, por_lote=SITIOS_POR_LOTE, tasa_cred=None):
+    """Evalúa todos los sitios y consolida; devuelve {"filas", "calendario", "kpis"}.
+
+    Con `procesos` > 1 los lotes se evalúan en un pool de procesos.
+    `tasa_cred` es la tasa de la caja consolidada (por defecto TASA_CRED base).
+    """
+    if not sitios:
+        raise ValueError("El portafolio no tiene sitios")
+    nombres = [s["nombre"] for s in sitios]
+    if len(set(nombres)) != len(nombres):
+        raise ValueError("Los nombres de los sitios deben ser únicos")
+    tasa = mf.parametros_base()["TASA_CRED"] if tasa_cred is None else tasa_cred
+    n = _calendario(sitios)
+    lotes = [sitios[i:i + por_lote] for i in range(0, len(sitios), por_lote)]
+    if procesos and procesos > 1 and len(lotes) > 1:
+        with ProcessPoolExecutor(max_workers=procesos) as pool:
+            parciales = list(pool.map(evaluar_lote, lotes, [n] * len(lotes)))
+    else:
+        parciales = [evaluar_lote(lote, n) for lote in lotes]
+
+    filas = [f for parcial in parciales for f in parcial["filas"]]
+    cal = {k: sum(parcial["consolidado"][k] for parcial in parciales) for k in SERIES}
+    cal["deuda_consolidada"], cal["liquidez_consolidada"] = caja_consolidada(
+        cal["flujo"], cal["reserva"], cal["deuda_cierre"], cal["caja_cierre"], tasa)
+    tir, estado = tir_lote(cal["flujo"])
+    kpis = {
+        "sitios": len(filas),
+        "van": sum(parcial["van"] for parcial in parciales),
+        "tir": float(tir[0]), "estado_tir": ESTADOS[int(estado[0])],
+        "deuda_max_suma": float(cal["deuda"].max()),
+        "anio_deuda_max_suma": int(np.argmax(cal["deuda"])),
+        "deuda_max_consolidada": float(cal["deuda_consolidada"].max()),
+        "capex_total": float(sum(f["CAPEX"] for f in filas)),
+    }
+    return {"filas": filas, "calendario": cal, "kpis": kpis}
+
+
+def hoja_portafolio(wb, resultado, ws=None):
+    """KPIs consolidados, una fila por sitio y las series anuales del portafolio"""
+    if ws is None:
+        ws = wb.create_sheet("Portafolio")
+    k = resultado["kpis"]
+    ws["A1"] = f"Portafolio – {k['sitios']:,} sitios"; ws["A1"].font = bold
+    resumen = [
+        ("VAN del portafolio (año 0 del portafolio)", k["van"], currency_fmt),
+        ("TIR del flujo consolidado", None if np.isnan(k["tir"]) else k["tir"], pct_fmt),
+        ("Estado TIR", k["estado_tir"], None),
+        ("Deuda máxima (suma de sitios)", k["deuda_max_suma"], currency_fmt),
+        ("Año de la deuda máxima (suma)", k["anio_deuda_max_suma"], None),
+        ("Deuda máxima (caja consolidada)", k["deuda_max_consolidada"], currency_fmt),
+        ("CAPEX total", k["capex_total"], currency_fmt),
+    ]
+    for i, (texto, valor, fmt) in enumerate(resumen, start=3):
+        ws.cell(i, 1, texto)
+        celda = ws.cell(i, 2, valor)
+        if fmt:
+            celda.number_format = fmt
+
+    # una fila por sitio
+    r0 = 4 + len(resumen)
+    encabezados = ["Sitio", "Escenario", "Inicio (año portafolio)", "ANIO_OP", "Horizonte", "CAPEX",
+                   "Valor terreno", "VAN", "TIR", "Estado TIR", "Payback descontado", "Deuda máxima"]
+    for c, t in enumerate(encabezados, start=1):
+        celda = ws.cell(r0, c, t)
+        celda.font = bold
+        celda.border = border_bottom
+        celda.alignment = Alignment(horizontal="center")
+    filas = resultado["filas"]
+
+    def fila_sitio(r):
+        f = filas[r - r0 - 1]
+        return [None if isinstance(f[c], float) and np.isnan(f[c]) else f[c] for c in RESUMEN]
+    formatos = {6: currency_fmt, 7: currency_fmt, 8: currency_fmt, 9: pct_fmt, 11: '0.0', 12: currency_fmt}
+    ws.bloque(r0 + 1, len(filas), fila_sitio, {c: {"number_format": f} for c, f in formatos.items()})
+
+    # series del portafolio (a la derecha)
+    cal = resultado["calendario"]
+    c0 = len(encabezados) + 2
+    columnas = [("Año portafolio", None), ("Flujo consolidado", "flujo"), ("Sitios operando", "operando"),
+                ("Deuda (suma de sitios)", "deuda"), ("Deuda (caja consolidada)", "deuda_consolidada"),
+                ("Liquidez (caja consolidada)", "liquidez_consolidada")]
+    for j, (t, _) in enumerate(columnas):
+        celda = ws.cell(r0, c0 + j, t)
+        celda.font = bold
+        celda.border = border_bottom
+        celda.alignment = Alignment(horizontal="center")
+    n = cal["flujo"].size
+    ws.bloque(r0 + 1, n, lambda r: [None] * (c0 - 1) + [r - r0 - 1] + [
+        int(cal[cl][r - r0 - 1]) if cl == "operando" else float(cal[cl][r - r0 - 1])
+        for _, cl in columnas[1:]],
+        {c0 + j: {"number_format": currency_fmt} for j in (1, 3, 4, 5)})
+
+    ws.column_dimensions["A"].width = 40
+    for c in range(2, len(encabezados) + 1):
+        ws.column_dimensions[get_column_letter(c)].width = 18
+    for j in range(len(columnas)):
+        ws.column_dimensions[get_column_letter(c0 + j)].width = 20
+
+    ch = LineChart(); ch.title = "Portafolio: flujo y deuda"; ch.y_axis.title = "MXN"; ch.x_axis.title = "Año"
+    for j in (1, 3, 4):
+        ch.add_data(Reference(ws, min_col=c0 + j, min_row=r0, max_row=r0 + n), titles_from_data=True)
+    ch.set_categories(Reference(ws, min_col=c0, min_row=r0 + 1, max_row=r0 + n))
+    ch.height, ch.width = 9, 20
+    ws.add_chart(ch, f"{get_column_letter(c0 + len(columnas) + 1)}3")
+    ws.freeze_panes = f"B{r0 + 1}"
+    return ws
+
+
+def main(argv=None):
+    from libro_diferido import LibroDiferido
+
+    ap = argparse.ArgumentParser(description="Consolida un portafolio de sitios en un libro")
+    ap.add_argument("sitios", help="CSV o JSON con los sitios")
+    ap.add_argument("--salida", default="Portafolio_ElectroHub.xlsx")
+    ap.add_argument("--procesos", type=int, default=None, help="procesos para evaluar los lotes")
+    args = ap.parse_args(argv)
+
+    resultado = consolidar(leer_sitios(args.sitios), procesos=args.procesos)
+    wb = LibroDiferido()
+    wb.active.title = "Portafolio"
+    hoja_portafolio(wb, resultado, wb.active)
+    wb.guardar(args.salida, streaming=True)
+    k = resultado["kpis"]
+    print(f"OK -> {args.salida}: {k['sitios']} sitios, VAN {k['van']:,.0f}, "
+          f"deuda máx. {k['deuda_max_suma']:,.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
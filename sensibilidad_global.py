@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+# Sensibilidad global basada en varianza (índices de Sobol) sobre los insumos
+# de Parametros y los multiplicadores de Escenarios_v4.
+#
+# Esquema de Saltelli: dos matrices A, B (N × k) de muestras uniformes en
+# [0, 1) —Sobol aleatorizado o hipercubo latino— y k matrices AB_i (A con la
+# columna i de B); cada uniforme se lleva a la distribución del factor por su
+# cuantil. Son N·(k+2) evaluaciones de motor_flujo en lotes de filas (cada
+# lote en una sola llamada vectorizada, opcionalmente en un pool de procesos).
+#
+#   primer orden  S_i  = mean(f_B · (f_ABi − f_A)) / V        (Saltelli 2010)
+#   orden total   ST_i = mean((f_A − f_ABi)²) / 2 / V         (Jansen)
+#
+# Diagnósticos de convergencia: intervalos bootstrap al 95% y los índices
+# recalculados con N/16 .. N filas (máxima variación de ST respecto del final).
+#
+# Uso: python sensibilidad_global.py [--n 4096] [--muestreo sobol|lhs] [--procesos N]
+
+import argparse
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from openpyxl.chart import BarChart, Reference
+from openpyxl.styles import Font, Alignment, Border, Side
+from openpyxl.utils import get_column_letter
+
+import motor_flujo as mf
+from simulacion_montecarlo import DISTRIBUCIONES, centrar, sin_efecto
+
+bold = Font(bold=True)
+border_bottom = Border(bottom=Side(style="thin", color="999999"))
+currency_fmt = '"$"#,##0;[RED]"$"#,##0'
+pct_fmt = '0.00%'
+
+# multiplicadores, crecimientos, WACC y CAPEX de Simulacion_MC + financiamiento y valores finales
+FACTORES = {
+    **DISTRIBUCIONES,
+    "TASA_CRED":     ("uniforme", 0.04, 0.09),
+    "RESERVA_PCT":   ("uniforme", 0.10, 0.30),
+    "VALOR_TERRENO": ("triangular", 56_700_000, 81_000_000, 89_100_000),
+    "COSTO_REP":     ("triangular", 3_200_000, 4_000_000, 5_600_000),
+    "ANIO_REP":      ("entero", 8, 12),
+}
+MUESTREOS = ("sobol", "lhs")
+KPIS = {
+    "van":       ("VAN (MXN)", currency_fmt),
+    "tir":       ("TIR", pct_fmt),
+    "deuda_max": ("Deuda máxima (MXN)", currency_fmt),
+}
+FILAS_POR_LOTE = 1024   # filas de A/B por lote: (k+2)·FILAS_POR_LOTE evaluaciones
+REMUESTREOS = 200       # bootstrap de los intervalos de confianza
+FRACCIONES = [1 / 16, 1 / 8, 1 / 4, 1 / 2, 1]
+
+# cuantil normal estándar (Acklam; error relativo < 1.2e-9)
+_A = [-3.969683028665376e+01, 2.209460984245205e+02, -2.759285104469687e+02,
+      1.383577518672690e+02, -3.066479806614716e+01, 2.506628277459239e+00]
+_B = [-5.447609879822406e+01, 1.615858368580409e+02, -1.556989798598866e+02,
+      6.680131188771972e+01, -1.328068155288572e+01, 1.0]
+_C = [-7.784894002430293e-03, -3.223964580411365e-01, -2.400758277161838e+00,
+      -2.549732539343734e+00, 4.374664141464968e+00, 2.938163982698783e+00]
+_D = [7.784695709041462e-03, 3.224671290700398e-01, 2.445134137142996e+00,
+      3.754408661907416e+00, 1.0]
+
+
+def _ppf_normal(u):
+    z = np.empty_like(u)
+    bajo, alto = u < 0.02425, u > 1 - 0.02425
+    medio = ~(bajo | alto)
+    q = u[medio] - 0.5
+    z[medio] = np.polyval(_A, q * q) * q / np.polyval(_B, q * q)
+    q = np.sqrt(-2 * np.log(u[bajo]))
+    z[bajo] = np.polyval(_C, q) / np.polyval(_D, q)
+    q = np.sqrt(-2 * np.log(1 - u[alto]))
+    z[alto] = -np.polyval(_C, q) / np.polyval(_D, q)
+    return z
+
+
+def cuantil(especificacion, u):
+    """Valores del factor para uniformes `u` (mismas especificaciones que Simulacion_MC + "entero")"""
+    tipo, *a = especificacion
+    u = np.clip(u, 1e-12, 1 - 1e-12)
+    if tipo == "normal":
+        return a[0] + a[1] * _ppf_normal(u)
+    if tipo == "uniforme":
+        return a[0] + u * (a[1] - a[0])
+    if tipo == "triangular":
+        lo, moda, hi = a
+        corte = (moda - lo) / (hi - lo)
+        return np.where(u < corte, lo + np.sqrt(u * (hi - lo) * (moda - lo)),
+                        hi - np.sqrt((1 - u) * (hi - lo) * (hi - moda)))
+    if tipo == "lognormal":
+        return a[0] * np.exp(a[1] * _ppf_normal(u))
+    if tipo == "entero":
+        return np.minimum(np.floor(a[0] + u * (a[1] - a[0] + 1)), a[1])
+    if tipo == "fijo":
+        return np.full(u.shape, float(a[0]))
+    raise ValueError(f"Distribución desconocida: {tipo}")
+
+
+def muestra_base(n, k, muestreo="sobol", semilla=0):
+    """Matrices uniformes A y B (n × k) del esquema de Saltelli"""
+    if muestreo not in MUESTREOS:
+        raise ValueError(f"Muestreo desconocido: {muestreo}")
+    if muestreo == "sobol":
+        try:
+            from scipy.stats import qmc
+        except ImportError:
+            raise ImportError("El muestreo Sobol requiere scipy; usa muestreo='lhs'") from None
+        u = qmc.Sobol(d=2 * k, scramble=True, seed=semilla).random(n)
+    else:
+        rng = np.random.default_rng(semilla)
+        estratos = np.argsort(rng.random((2 * k, n)), axis=1).T   # una permutación por columna
+        u = (estratos + rng.random((n, 2 * k))) / n
+    return u[:, :k], u[:, k:]
+
+
+def _evaluar_bloque(a, b, factores, cambios, kpis, perfiles=None):
+    """KPIs (k+2, filas) de f_A, f_B y f_AB1..f_ABk para un lote de filas de A / B"""
+    n, k = a.shape
+    bloques = [a, b]
+    for i in range(k):
+        ab = a.copy()
+        ab[:, i] = b[:, i]
+        bloques.append(ab)
+    u = np.concatenate(bloques)
+    lote = {nombre: cuantil(esp, u[:, j]) for j, (nombre, esp) in enumerate(factores.items())}
+    p = mf.resolver_parametros({**cambios, **lote})
+    res = mf.flujo_base(p, perfiles=perfiles)
+    salida = {}
+    if "van" in kpis:
+        salida["van"] = res["van_acum"][:, -1]
+    if "tir" in kpis:
+        salida["tir"] = mf.tir(res["flujo"])
+    if "deuda_max" in kpis:
+        salida["deuda_max"] = mf.optimizacion_flujo(res["flujo"], res["opex_total"], p["RESERVA_PCT"],
+                                                    p["TASA_CRED"])["deuda"].max(axis=1)
+    return {kpi: v.reshape(k + 2, n) for kpi, v in salida.items()}
+
+
+def _indices(fA, fB, fAB):
+    """S1 y ST (k,) de evaluaciones (..., n); filas con NaN se descartan por factor"""
+    k = fAB.shape[-2]
+    s1 = np.empty(fA.shape[:-1] + (k,))
+    st = np.empty_like(s1)
+    for i in range(k):
+        ok = np.isfinite(fA) & np.isfinite(fB) & np.isfinite(fAB[..., i, :])
+        cuenta = ok.sum(axis=-1)
+        a, b, ab = (np.where(ok, x, 0.0) for x in (fA, fB, fAB[..., i, :]))
+        media = (a + b).sum(axis=-1) / (2 * cuenta)
+        var = (((a - media[..., None]) ** 2 + (b - media[..., None]) ** 2) * ok).sum(axis=-1) / (2 * cuenta)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            s1[..., i] = (b * (ab - a)).sum(axis=-1) / cuenta / var
+            st[..., i] = 0.5 * ((a - ab) ** 2).sum(axis=-1) / cuenta / var
+    return s1, st
+
+
+def indices(fA, fB, fAB, semilla=0, remuestreos=REMUESTREOS):
+    """Índices de primer orden y totales con semiamplitud del IC bootstrap al 95%"""
+    s1, st = _indices(fA, fB, fAB)
+    rng = np.random.default_rng(semilla)
+    n, k = fA.size, fAB.shape[0]
+    paso = max(1, 4_000_000 // (n * (k + 2)))   # remuestreos por tanda: memoria acotada
+    b1, bt = [], []
+    for ini in range(0, remuestreos, paso):
+        idx = rng.integers(0, n, (min(paso, remuestreos - ini), n))
+        x1, xt = _indices(fA[idx], fB[idx], np.moveaxis(fAB[:, idx], 0, 1))
+        b1.append(x1)
+        bt.append(xt)
+    b1, bt = np.concatenate(b1), np.concatenate(bt)
+    ic = lambda x: (np.nanpercentile(x, 97.5, axis=0) - np.nanpercentile(x, 2.5, axis=0)) / 2
+    validos = np.mean(np.isfinite(fA) & np.isfinite(fB) & np.all(np.isfinite(fAB), axis=0))
+    return {"S1": s1, "S1_ic": ic(b1), "ST": st, "ST_ic": ic(bt), "validos": float(validos),
+            "varianza": float(np.nanvar(np.concatenate([fA, fB])))}
+
+
+def sobol(n=4096, muestreo="sobol", semilla=0, factores=None, cambios=None, kpis=("van", "tir"),
+          procesos=None, perfiles=None):
+    """Índices de Sobol de `kpis` para `factores` {nombre: distribución}; N·(k+2) evaluaciones.
+
+    Los factores por defecto se centran en `cambios` (simulacion_montecarlo.centrar)
+    y se omiten los f_* sin efecto (simulacion_montecarlo.sin_efecto); `perfiles`
+    son los montos anuales de perfiles_subanuales.
+    Con Sobol, n se redondea a la potencia de 2 siguiente. Devuelve
+    {"nombres", "factores", "n", "evaluaciones", "indices": {kpi: ...}, "convergencia": {kpi: [...]}}.
+    """
+    factores = centrar(FACTORES, cambios) if factores is None else dict(factores)
+    factores = sin_efecto(factores, cambios, perfiles)
+    desconocidos = set(factores) - set(mf.parametros_base())
+    if desconocidos:
+        raise ValueError(f"Factores desconocidos: {sorted(desconocidos)}")
+    if set(kpis) - set(KPIS):
+        raise ValueError(f"KPI desconocido: {sorted(set(kpis) - set(KPIS))}")
+    if muestreo == "sobol":
+        n = 1 << max(int(np.ceil(np.log2(n))), 0)
+    nombres = list(factores)
+    k = len(nombres)
+    a, b = muestra_base(n, k, muestreo, semilla)
+    cortes = range(0, n, FILAS_POR_LOTE)
+    argumentos = ([a[i:i + FILAS_POR_LOTE] for i in cortes], [b[i:i + FILAS_POR_LOTE] for i in cortes],
+                  [factores] * len(cortes), [dict(cambios or {})] * len(cortes), [tuple(kpis)] * len(cortes),
+                  [perfiles] * len(cortes))
+    if procesos and procesos > 1 and len(cortes) > 1:
+        with ProcessPoolExecutor(max_workers=procesos) as pool:
+            bloques = list(pool.map(_evaluar_bloque, *argumentos))
+    else:
+        bloques = [_evaluar_bloque(*args) for args in zip(*argumentos)]
+
+    resultado = {"nombres": nombres, "factores": factores, "n": n, "muestreo": muestreo,
+                 "evaluaciones": n * (k + 2), "indices": {}, "convergencia": {}}
+    for kpi in kpis:
+        f = np.concatenate([blq[kpi] for blq in bloques], axis=1)     # (k+2, n)
+        fA, fB, fAB = f[0], f[1], f[2:]
+        resultado["indices"][kpi] = ind = indices(fA, fB, fAB, semilla)
+        filas = []
+        for fr in FRACCIONES:
+            m = max(int(n * fr), 2)
+            s1, st = _indices(fA[:m], fB[:m], fAB[:, :m])
+            filas.append({"n": m, "suma_S1": float(np.nansum(s1)), "suma_ST": float(np.nansum(st)),
+                          "max_dST": float(np.nanmax(np.abs(st - ind["ST"])))})
+        resultado["convergencia"][kpi] = filas
+    return resultado
+
+
+def _describir(nombre, especificacion):
+    desc = {n: d for n, d, _, _ in mf.PARAMETROS}
+    texto = desc.get(nombre) or (f"Multiplicador {nombre[2:]}" if nombre.startswith("f_") else nombre)
+    tipo, *a = especificacion
+    return texto, f"{tipo}({', '.join(f'{x:g}' for x in a)})"
+
+
+def hoja_sensibilidad_global(wb, resultado, titulo="Sensibilidad_Global"):
+    """Índices S1 / ST por KPI (ordenados por ST del primer KPI), convergencia y gráfico"""
+    ws = wb.create_sheet(titulo)
+    kpis = list(resultado["indices"])
+    k = len(resultado["nombres"])
+    ws["A1"] = (f"Sensibilidad global (Sobol) – muestreo {resultado['muestreo']}, N = {resultado['n']:,}, "
+                f"{k} factores, {resultado['evaluaciones']:,} evaluaciones")
+    ws["A1"].font = bold
+
+    encabezados = ["Parámetro", "Descripción", "Distribución"]
+    for kpi in kpis:
+        etiqueta = KPIS[kpi][0]
+        encabezados += [f"S1 {etiqueta}", "± IC95", f"ST {etiqueta}", "± IC95"]
+    r0 = 3
+    for c, t in enumerate(encabezados, start=1):
+        celda = ws.cell(r0, c, t)
+        celda.font = bold
+        celda.border = border_bottom
+        celda.alignment = Alignment(horizontal="center", wrap_text=True)
+    primero = resultado["indices"][kpis[0]]
+    orden = np.argsort(-np.nan_to_num(primero["ST"], nan=-1.0))
+    num = lambda x: None if not np.isfinite(x) else float(x)
+    for r, i in enumerate(orden, start=r0 + 1):
+        nombre = resultado["nombres"][i]
+        fila = [nombre, *_describir(nombre, resultado["factores"][nombre])]
+        for kpi in kpis:
+            ind = resultado["indices"][kpi]
+            fila += [num(ind[c][i]) for c in ("S1", "S1_ic", "ST", "ST_ic")]
+        for c, v in enumerate(fila, start=1):
+            celda = ws.cell(r, c, v)
+            if c > 3:
+                celda.number_format = '0.000'
+    r = r0 + k + 1
+    ws.cell(r, 1, "Suma").font = bold
+    for j, kpi in enumerate(kpis):
+        ind = resultado["indices"][kpi]
+        ws.cell(r, 4 + 4 * j, float(np.nansum(ind["S1"]))).number_format = '0.000'
+        ws.cell(r, 6 + 4 * j, float(np.nansum(ind["ST"]))).number_format = '0.000'
+    ws.cell(r + 1, 1, "Muestras válidas")
+    for j, kpi in enumerate(kpis):
+        ws.cell(r + 1, 4 + 4 * j, resultado["indices"][kpi]["validos"]).number_format = pct_fmt
+
+    # convergencia: índices con las primeras N/16 .. N filas de A y B
+    rc = r + 3
+    ws.cell(rc, 1, "Convergencia").font = bold
+    cab = ["KPI", "N", "Σ S1", "Σ ST", "máx |ST − ST(N)|"]
+    for c, t in enumerate(cab, start=1):
+        celda = ws.cell(rc + 1, c, t)
+        celda.font = bold
+        celda.border = border_bottom
+    fila = rc + 2
+    for kpi in kpis:
+        for conv in resultado["convergencia"][kpi]:
+            valores = [KPIS[kpi][0], conv["n"], conv["suma_S1"], conv["suma_ST"], conv["max_dST"]]
+            for c, v in enumerate(valores, start=1):
+                ws.cell(fila, c, num(v) if c > 2 else v).number_format = '0.000' if c > 2 else 'General'
+            fila += 1
+
+    ws.column_dimensions["A"].width = 16
+    ws.column_dimensions["B"].width = 40
+    ws.column_dimensions["C"].width = 30
+    for c in range(4, len(encabezados) + 1):
+        ws.column_dimensions[get_column_letter(c)].width = 12
+
+    ch = BarChart()
+    ch.type = "bar"
+    ch.grouping = "clustered"
+    ch.title = f"Índices de Sobol – {KPIS[kpis[0]][0]}"
+    ch.x_axis.scaling.orientation = "maxMin"
+    for c in (4, 6):
+        ch.add_data(Reference(ws, min_col=c, min_row=r0, max_row=r0 + k), titles_from_data=True)
+    ch.set_categories(Reference(ws, min_col=1, min_row=r0 + 1, max_row=r0 + k))
+    ch.height = max(7.5, 0.45 * k)
+    ch.width = 16
+    ws.add_chart(ch, f"{get_column_letter(len(encabezados) + 2)}3")
+    return ws
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Índices de Sobol de VAN / TIR")
+    ap.add_argument("--n", type=int, default=4096, help="filas de A y B (N)")
+    ap.add_argument("--muestreo", choices=MUESTREOS, default="sobol")
+    ap.add_argument("--semilla", type=int, default=0)
+    ap.add_argument("--procesos", type=int, default=None)
+    ap.add_argument("--kpis", default="van,tir", help="lista separada por comas: van, tir, deuda_max")
+    args = ap.parse_args(argv)
+
+    r = sobol(args.n, args.muestreo, args.semilla, kpis=args.kpis.split(","), procesos=args.procesos)
+    print(f"N = {r['n']:,}, {r['evaluaciones']:,} evaluaciones")
+    for kpi, ind in r["indices"].items():
+        print(f"\n{KPIS[kpi][0]} (muestras válidas {ind['validos']:.1%})")
+        print(f"{'Parámetro':<16}{'S1':>9}{'±':>7}{'ST':>9}{'±':>7}")
+        for i in np.argsort(-np.nan_to_num(ind["ST"], nan=-1.0)):
+            print(f"{r['nombres'][i]:<16}{ind['S1'][i]:9.3f}{ind['S1_ic'][i]:7.3f}"
+                  f"{ind['ST'][i]:9.3f}{ind['ST_ic'][i]:7.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+# Sensibilidad uno-a-la-vez (tornado) sobre los insumos de Parametros.
+#
+# Cada nombre definido se perturba ±delta (relativo; los parámetros en años
+# se mueven ±DELTA_ANIOS) dejando el resto en su valor del escenario activo.
+# Un insumo en cero se mueve ±delta de su valor de fábrica (o ±PASO_CERO si
+# también es cero; salvo los crecimientos G_*, sin bajar de cero); el reparto
+# CAPEX0 / CAPEX1 se mueve en conjunto (la suma no cambia), por lo que CAPEX1
+# no tiene fila propia.
+# Las 2·k perturbaciones + el caso base se evalúan en un solo lote de
+# motor_flujo.calcular, y la hoja Sensibilidad lista el impacto ordenado de
+# mayor a menor rango junto con un gráfico de tornado.
+
+import numpy as np
+from openpyxl.chart import BarChart, Reference
+from openpyxl.styles import Font, Border, Side
+
+import motor_flujo as mf
+
+bold = Font(bold=True)
+border_bottom = Border(bottom=Side(style="thin", color="999999"))
+currency_fmt = '"$"#,##0;[RED]"$"#,##0'
+pct_fmt = '0.00%'
+
+ANIOS = {"ANIO_REP", "ANIO_OP"}   # se perturban en años enteros
+DELTA_ANIOS = 1
+# HORIZONTE cambia el número de años de la serie: no cabe en el mismo lote
+EXCLUIDOS = {"HORIZONTE"}
+COMPLEMENTARIOS = {"CAPEX0": "CAPEX1", "CAPEX1": "CAPEX0"}   # reparto del CAPEX
+PASO_CERO = 0.01    # paso absoluto si el valor y el de fábrica son cero
+
+KPIS = {
+    "van":       ("VAN (MXN)", currency_fmt),
+    "tir":       ("TIR", pct_fmt),
+    "pi":        ("PI", '0.00'),
+    "deuda_max": ("Deuda máxima (MXN)", currency_fmt),
+}
+
+
+def _kpi(res, kpi):
+    if kpi == "tir":
+        return mf.tir(res["flujo"])
+    if kpi == "deuda_max":
+        return res["deuda"].max(axis=1)
+    return res[kpi]
+
+
+def tornado(delta=0.10, cambios=None, kpi="van", nombres=None, perfiles=None):
+    """Impacto de ±delta en cada parámetro sobre `kpi`, ordenado por rango.
+
+    `cambios` fija el punto base (p. ej. multiplicadores del escenario activo);
+    `perfiles` son los montos anuales de perfiles_subanuales.
+    Devuelve {"base": valor, "filas": [dict por parámetro]}.
+    """
+    if kpi not in KPIS:
+        raise ValueError(f"KPI desconocido: {kpi}")
+    centro = mf.resolver_parametros(cambios)
+    fabrica = mf.parametros_base()
+    nombres = nombres or [n for n, _, _, _ in mf.PARAMETROS if n not in EXCLUIDOS and n != "CAPEX1"]
+    k = len(nombres)
+
+    # fila 0 = base; filas 1..k = bajo; k+1..2k = alto
+    movidos = set(nombres) | {COMPLEMENTARIOS[n] for n in nombres if n in COMPLEMENTARIOS}
+    lote = {n: np.full(2 * k + 1, float(centro[n])) for n in movidos}
+    bajo, alto = {}, {}
+    for i, n in enumerate(nombres):
+        if n in ANIOS:
+            paso = DELTA_ANIOS
+        elif centro[n] != 0:
+            paso = abs(centro[n]) * delta
+        else:
+            paso = abs(fabrica[n]) * delta or PASO_CERO
+        bajo[n], alto[n] = centro[n] - paso, centro[n] + paso
+        if centro[n] == 0 and fabrica[n] > 0 and not n.startswith("G_"):
+            bajo[n] = 0.0       # montos y tasas no negativos: sólo se mueve hacia arriba
+        if n in COMPLEMENTARIOS:
+            total = centro[n] + centro[COMPLEMENTARIOS[n]]
+            bajo[n], alto[n] = max(bajo[n], 0.0), min(alto[n], total)
+            lote[COMPLEMENTARIOS[n]][[1 + i, 1 + k + i]] = total - bajo[n], total - alto[n]
+        lote[n][1 + i] = bajo[n]
+        lote[n][1 + k + i] = alto[n]
+    # las bases f_* y *_BASE quedan en su valor; ING_*_1 / OPEX_*_1 van explícitos
+    res = mf.calcular({**(cambios or {}), **lote}, n_anios=int(centro["HORIZONTE"]) + 1, perfiles=perfiles)
+    valores = _kpi(res, kpi)
+
+    base = float(valores[0])
+    filas = []
+    for i, n in enumerate(nombres):
+        v_bajo, v_alto = float(valores[1 + i]), float(valores[1 + k + i])
+        filas.append({
+            "nombre": n, "base": float(centro[n]), "bajo": float(bajo[n]), "alto": float(alto[n]),
+            "kpi_bajo": v_bajo, "kpi_alto": v_alto,
+            "delta_bajo": v_bajo - base, "delta_alto": v_alto - base,
+            "rango": abs(v_alto - v_bajo),
+        })
+    filas.sort(key=lambda f: -np.nan_to_num(f["rango"], nan=-1.0))
+    return {"base": base, "kpi": kpi, "delta": delta, "filas": filas}
+
+
+def hoja_sensibilidad(wb, resultado, titulo="Sensibilidad"):
+    """Escribe la tabla de tornado (ordenada) y su gráfico; devuelve la hoja"""
+    ws = wb.create_sheet(titulo)
+    etiqueta, fmt = KPIS[resultado["kpi"]]
+    filas = resultado["filas"]
+    ws["A1"] = (f"Sensibilidad uno-a-la-vez – {etiqueta}, ±{resultado['delta']:.0%} "
+                f"(años ±{DELTA_ANIOS})")
+    ws["A1"].font = bold
+    ws["A2"] = "Valor base"; ws["B2"] = _num(resultado["base"]); ws["B2"].number_format = fmt
+
+    ws.append([])
+    ws.append(["Parámetro", "Descripción", "Valor base", "Valor bajo", "Valor alto",
+               f"{etiqueta} bajo", f"{etiqueta} alto", "Δ bajo", "Δ alto", "Rango"])
+    for c in ws[4]:
+        c.font = bold
+        c.border = border_bottom
+    desc = {n: d for n, d, _, _ in mf.PARAMETROS}
+    desc.update({n: f"{desc[n]} ({c} = complemento)" for n, c in COMPLEMENTARIOS.items()})
+    for f in filas:
+        ws.append([f["nombre"], desc.get(f["nombre"], ""), f["base"], f["bajo"], f["alto"]]
+                  + [_num(f[c]) for c in ("kpi_bajo", "kpi_alto", "delta_bajo", "delta_alto", "rango")])
+    for r in range(5, 5 + len(filas)):
+        for c in range(6, 11):
+            ws.cell(r, c).number_format = fmt
+    ws.column_dimensions["A"].width = 16
+    ws.column_dimensions["B"].width = 40
+    for col in "CDEFGHIJ":
+        ws.column_dimensions[col].width = 16
+
+    ws.add_chart(grafico_tornado(ws, len(filas), etiqueta), "L4")
+    return ws
+
+
+def grafico_tornado(ws, n, etiqueta="VAN (MXN)"):
+    """Barras horizontales Δ bajo / Δ alto de la hoja Sensibilidad (mayor rango arriba)"""
+    ch = BarChart()
+    ch.type = "bar"
+    ch.grouping = "clustered"
+    ch.overlap = 100
+    ch.gapWidth = 30
+    ch.title = f"Tornado – {etiqueta}"
+    ch.x_axis.title = "Parámetro"
+    ch.y_axis.title = f"Δ {etiqueta}"
+    ch.x_axis.scaling.orientation = "maxMin"   # primera fila (mayor rango) arriba
+    ch.add_data(Reference(ws, min_col=8, max_col=9, min_row=4, max_row=4 + n), titles_from_data=True)
+    ch.set_categories(Reference(ws, min_col=1, min_row=5, max_row=4 + n))
+    ch.height = max(7.5, 0.45 * n)
+    ch.width = 20
+    return ch
+
+
+def _num(x):
+    return None if np.isnan(x) else float(x)
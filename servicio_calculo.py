@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+# Servicio local HTTP/JSON para consultas "qué pasa si" del dashboard.
+#
+# Envuelve motor_flujo (Flujo_Base + Optimizacion_Flujo + KPIs) sin generar
+# el xlsx. Sólo biblioteca estándar (asyncio) + numpy:
+#
+#   GET  /salud                         estado y estadísticas de la caché
+#   GET  /parametros                    nombres definidos, valores base y escenarios
+#   GET  /calcular?WACC=0.09&f_LOGH2=1.1[&escenario=Base&horizonte=15&series=flujo,deuda]
+#   POST /calcular   {"params": {...}, "escenario": "...", "horizonte": 15, "series": [...] | false}
+#   POST /lote       {"consultas": [{...}, ...]}   (mismo formato que POST /calcular)
+#
+# Respuesta: {"anios": [...], "kpis": {...}, "series": {...}} con las mismas
+# series y KPIs que el cubo de escenarios (NaN -> null).
+#
+# Las consultas se normalizan (escenario -> f_*, valores a float, se descartan
+# los que coinciden con el valor base) y la clave normalizada indexa una caché
+# LRU. Los fallos de caché que llegan en la misma vuelta del bucle de eventos
+# se agrupan y se evalúan en un solo lote vectorizado; /lote evalúa todos sus
+# fallos juntos, por bloques de PUNTOS_POR_LOTE. Los lotes se calculan en un
+# pool de hilos (la caché sólo se toca desde el bucle), así que un /lote grande
+# no detiene a los demás clientes.
+#
+# Uso: python servicio_calculo.py [--host 127.0.0.1] [--puerto 8765] [--cache 20000]
+
+import argparse
+import asyncio
+import json
+import math
+import sys
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qsl
+
+import numpy as np
+
+import motor_flujo as mf
+from cubo_escenarios import SERIES, KPIS, PUNTOS_POR_LOTE
+from solver_tir import tir_lote, payback_interpolado, ESTADOS
+
+HOST = "127.0.0.1"
+PUERTO = 8765
+TAM_CACHE = 20_000          # resultados en la caché LRU
+MAX_CONSULTAS_LOTE = 10_000
+MAX_CUERPO = 16 * 1024 * 1024
+MAX_HORIZONTE = 60
+HILOS_CALCULO = 2           # hilos que evalúan los lotes fuera del bucle de eventos
+
+_VINCULADOS = {n for n, _, _ in mf.VINCULOS}
+_MOTIVOS = {200: "OK", 204: "No Content", 400: "Bad Request", 404: "Not Found",
+            405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class ErrorConsulta(ValueError):
+    """Consulta inválida (se responde con 400)"""
+
+
+def normalizar(consulta):
+    """Clave de caché (horizonte, ((nombre, valor), ...)) de una consulta.
+
+    `consulta`: {"params": {...}, "escenario": nombre, "horizonte": n}; los
+    multiplicadores del escenario se aplican antes que `params`.
+    """
+    if not isinstance(consulta, dict):
+        raise ErrorConsulta("Cada consulta debe ser un objeto JSON")
+    base = mf.parametros_base()
+    cambios = {}
+    if consulta.get("escenario"):
+        try:
+            cambios.update(mf.multiplicadores(consulta["escenario"]))
+        except KeyError as e:
+            raise ErrorConsulta(str(e.args[0])) from None
+    params = consulta.get("params") or {}
+    if not isinstance(params, dict):
+        raise ErrorConsulta('"params" debe ser un objeto {nombre: valor}')
+    cambios.update(params)
+    if consulta.get("horizonte") is not None:
+        cambios["HORIZONTE"] = consulta["horizonte"]
+    desconocidos = set(cambios) - set(base)
+    if desconocidos:
+        raise ErrorConsulta(f"Parámetros desconocidos: {sorted(desconocidos)}")
+    pares = []
+    for nombre, valor in cambios.items():
+        try:
+            valor = float(valor)
+        except (TypeError, ValueError):
+            raise ErrorConsulta(f"{nombre}: valor no numérico {valor!r}") from None
+        if not math.isfinite(valor):
+            raise ErrorConsulta(f"{nombre}: valor no finito")
+        # ING_*_1 / OPEX_*_1 explícitos quedan fijos aunque coincidan con la base
+        if valor != base[nombre] or nombre in _VINCULADOS:
+            pares.append((nombre, valor))
+    H = dict(pares).pop("HORIZONTE", base["HORIZONTE"])
+    if H != int(H) or not 1 <= H <= MAX_HORIZONTE:
+        raise ErrorConsulta(f"HORIZONTE debe ser un entero entre 1 y {MAX_HORIZONTE}")
+    return int(H), tuple(sorted(p for p in pares if p[0] != "HORIZONTE"))
+
+
+def evaluar_claves(claves):
+    """Resultados (listas JSON) de claves normalizadas con el mismo horizonte, en un lote"""
+    H = claves[0][0]
+    filas = [mf.resolver_parametros(dict(pares)) for _, pares in claves]
+    nombres = [k for k in filas[0] if k != "HORIZONTE"]
+    cambios = {k: np.array([float(f[k]) for f in filas]) for k in nombres}
+    res = mf.calcular({**cambios, "HORIZONTE": H}, n_anios=H + 1)
+    tir, estado = tir_lote(res["flujo"])
+    kpis = {"van": res["van"], "tir": tir, "payback": payback_interpolado(res["van_acum"]),
+            "pi": res["pi"], "deuda_max": res["deuda"].max(axis=1)}
+    salida = []
+    for i in range(len(claves)):
+        salida.append({
+            "kpis": {**{k: _json(kpis[k][i]) for k in KPIS}, "estado_tir": ESTADOS[int(estado[i])]},
+            "series": {s: [_json(x) for x in res[s][i]] for s in SERIES},
+        })
+    return salida
+
+
+def _json(x):
+    x = float(x)
+    return x if math.isfinite(x) else None
+
+
+class Servicio:
+    """Caché LRU + agrupación de fallos en lotes vectorizados"""
+
+    def __init__(self, tam_cache=TAM_CACHE, hilos=HILOS_CALCULO):
+        self.tam_cache = tam_cache
+        self.ejecutor = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="calculo")
+        self.cache = OrderedDict()
+        self._pendientes = {}       # clave -> future de la vuelta actual del bucle
+        self._en_curso = {}         # clave -> future de un lote que se está calculando
+        self._tareas = set()        # referencias a las tareas de _procesar
+        self.aciertos = self.fallos = self.lotes = 0
+
+    def _de_cache(self, clave):
+        res = self.cache.get(clave)
+        if res is not None:
+            self.cache.move_to_end(clave)
+            self.aciertos += 1
+        return res
+
+    def _guardar(self, clave, res):
+        self.cache[clave] = res
+        self.cache.move_to_end(clave)
+        while len(self.cache) > self.tam_cache:
+            self.cache.popitem(last=False)
+
+    async def resolver(self, claves):
+        """Resultados de claves normalizadas: caché primero, fallos en lotes por horizonte"""
+        resultados = {c: r for c in claves if (r := self._de_cache(c)) is not None}
+        fallos = list(dict.fromkeys(c for c in claves if c not in resultados))
+        self.fallos += len(fallos)
+        por_horizonte = {}
+        for c in fallos:
+            por_horizonte.setdefault(c[0], []).append(c)
+        for grupo in por_horizonte.values():
+            for ini in range(0, len(grupo), PUNTOS_POR_LOTE):
+                bloque = grupo[ini:ini + PUNTOS_POR_LOTE]
+                self.lotes += 1
+                calculados = await asyncio.get_running_loop().run_in_executor(
+                    self.ejecutor, evaluar_claves, bloque)
+                for c, r in zip(bloque, calculados):
+                    resultados[c] = r
+                    self._guardar(c, r)
+        return [resultados[c] for c in claves]
+
+    async def consultar(self, clave):
+        """Una consulta; los fallos de la misma vuelta del bucle se evalúan juntos"""
+        res = self._de_cache(clave)
+        if res is not None:
+            return res
+        futuro = self._pendientes.get(clave) or self._en_curso.get(clave)
+        if futuro is None:
+            bucle = asyncio.get_running_loop()
+            if not self._pendientes:
+                tarea = bucle.create_task(self._procesar())     # corre tras las demás llegadas de esta vuelta
+                self._tareas.add(tarea)
+                tarea.add_done_callback(self._tareas.discard)
+            futuro = self._pendientes[clave] = bucle.create_future()
+        # shield: si un cliente se desconecta, las demás consultas con la misma clave siguen
+        return await asyncio.shield(futuro)
+
+    async def _procesar(self):
+        pendientes, self._pendientes = self._pendientes, {}
+        self._en_curso.update(pendientes)
+        try:
+            resultados = await self.resolver(list(pendientes))
+        except Exception as e:      # el error llega a cada consulta del lote
+            for futuro in pendientes.values():
+                if not futuro.done():
+                    futuro.set_exception(e)
+            return
+        finally:
+            for clave in pendientes:
+                self._en_curso.pop(clave, None)
+        for futuro, res in zip(pendientes.values(), resultados):
+            if not futuro.done():
+                futuro.set_result(res)
+
+    def estadisticas(self):
+        total = self.aciertos + self.fallos
+        return {"cache": len(self.cache), "tam_cache": self.tam_cache, "aciertos": self.aciertos,
+                "fallos": self.fallos, "lotes": self.lotes,
+                "tasa_aciertos": self.aciertos / total if total else None}
+
+    # ---------- HTTP ----------
+    async def despachar(self, metodo, ruta, cuerpo):
+        """(estado, objeto JSON) de una petición"""
+        url = urlsplit(ruta)
+        if url.path == "/salud" and metodo == "GET":
+            return 200, {"estado": "ok", **self.estadisticas()}
+        if url.path == "/parametros" and metodo == "GET":
+            return 200, _parametros()
+        if url.path == "/calcular" and metodo in ("GET", "POST"):
+            consulta = _consulta_url(url.query) if metodo == "GET" else _leer_json(cuerpo)
+            clave = normalizar(consulta)
+            return 200, _respuesta(clave, await self.consultar(clave), consulta.get("series", True))
+        if url.path == "/lote" and metodo == "POST":
+            datos = _leer_json(cuerpo)
+            consultas = datos.get("consultas") if isinstance(datos, dict) else None
+            if not isinstance(consultas, list) or len(consultas) > MAX_CONSULTAS_LOTE:
+                raise ErrorConsulta(f'"consultas" debe ser una lista de hasta {MAX_CONSULTAS_LOTE} objetos')
+            claves = []
+            for i, consulta in enumerate(consultas):
+                try:
+                    claves.append(normalizar(consulta))
+                except ErrorConsulta as e:
+                    raise ErrorConsulta(f"consulta {i}: {e}") from None
+            resultados = await self.resolver(claves)
+            return 200, {"resultados": [_respuesta(c, r, q.get("series", True))
+                                        for c, r, q in zip(claves, resultados, consultas)]}
+        if url.path in ("/salud", "/parametros", "/calcular", "/lote"):
+            return 405, {"error": f"Método {metodo} no admitido en {url.path}"}
+        return 404, {"error": f"Ruta desconocida: {url.path}"}
+
+    async def atender(self, lector, escritor):
+        """Conexión HTTP/1.1 con keep-alive"""
+        try:
+            while True:
+                linea = await lector.readline()
+                if not linea.strip():
+                    break
+                metodo, ruta, version = linea.decode("latin-1").split(maxsplit=2)
+                encabezados = {}
+                while (h := await lector.readline()) not in (b"\r\n", b"\n", b""):
+                    nombre, _, valor = h.decode("latin-1").partition(":")
+                    encabezados[nombre.strip().lower()] = valor.strip()
+                largo = int(encabezados.get("content-length", 0))
+                if largo > MAX_CUERPO:
+                    escritor.write(_http(413, {"error": "Cuerpo demasiado grande"}, cerrar=True))
+                    break
+                cuerpo = await lector.readexactly(largo) if largo else b""
+                conexion = encabezados.get("connection", "").lower()
+                cerrar = conexion == "close" or (version.strip() == "HTTP/1.0" and conexion != "keep-alive")
+                if metodo == "OPTIONS":
+                    escritor.write(_http(204, None, cerrar))
+                else:
+                    try:
+                        estado, datos = await self.despachar(metodo, ruta, cuerpo)
+                    except ErrorConsulta as e:
+                        estado, datos = 400, {"error": str(e)}
+                    except Exception as e:
+                        estado, datos = 500, {"error": f"{type(e).__name__}: {e}"}
+                    escritor.write(_http(estado, datos, cerrar))
+                await escritor.drain()
+                if cerrar:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            escritor.close()
+
+
+def _leer_json(cuerpo):
+    try:
+        return json.loads(cuerpo or b"{}")
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        raise ErrorConsulta(f"JSON inválido: {e}") from None
+
+
+def _consulta_url(query):
+    """?WACC=0.09&escenario=Base&horizonte=15&series=flujo,deuda -> consulta"""
+    consulta, params = {}, {}
+    for k, v in parse_qsl(query, keep_blank_values=True):
+        if k in ("escenario", "horizonte"):
+            consulta[k] = v
+        elif k == "series":
+            consulta[k] = [s for s in v.split(",") if s] if v not in ("0", "false") else False
+        else:
+            params[k] = v
+    return {**consulta, "params": params}
+
+
+def _respuesta(clave, res, series=True):
+    if series is True:
+        series = SERIES
+    elif series is False or series is None:
+        series = []
+    elif not isinstance(series, list) or set(series) - set(SERIES):
+        raise ErrorConsulta(f'"series" debe ser true, false o una lista de {SERIES}')
+    salida = {"anios": list(range(clave[0] + 1)), "kpis": res["kpis"]}
+    if series:
+        salida["series"] = {s: res["series"][s] for s in series}
+    return salida
+
+
+def _parametros():
+    base = mf.parametros_base()
+    return {"parametros": [{"nombre": n, "descripcion": d, "valor": v, "nota": nota}
+                           for n, d, v, nota in mf.PARAMETROS],
+            "bases": [{"nombre": n, "valor": v, "descripcion": d} for n, v, d in mf.BASES],
+            "factores": {f: base[f] for f in mf.FACTORES},
+            "escenarios": {fila[0]: dict(zip(mf.FACTORES, fila[1:])) for fila in mf.ESCENARIOS},
+            "series": SERIES, "kpis": KPIS + ["estado_tir"]}
+
+
+def _http(estado, datos, cerrar=False):
+    cuerpo = b"" if datos is None else json.dumps(datos, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    cabecera = (f"HTTP/1.1 {estado} {_MOTIVOS.get(estado, '')}\r\n"
+                "Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(cuerpo)}\r\n"
+                "Access-Control-Allow-Origin: *\r\n"
+                "Access-Control-Allow-Methods: GET, POST, OPTIONS\r\n"
+                "Access-Control-Allow-Headers: Content-Type\r\n"
+                f"Connection: {'close' if cerrar else 'keep-alive'}\r\n\r\n")
+    return cabecera.encode("latin-1") + cuerpo
+
+
+async def servir(host=HOST, puerto=PUERTO, tam_cache=TAM_CACHE):
+    servicio = Servicio(tam_cache)
+    servidor = await asyncio.start_server(servicio.atender, host, puerto)
+    print(f"Servicio de cálculo en http://{host}:{puerto} (caché {tam_cache:,})", flush=True)
+    try:
+        async with servidor:
+            await servidor.serve_forever()
+    finally:
+        servicio.ejecutor.shutdown(wait=False)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Servicio local HTTP/JSON de consultas qué-pasa-si")
+    ap.add_argument("--host", default=HOST)
+    ap.add_argument("--puerto", type=int, default=PUERTO)
+    ap.add_argument("--cache", type=int, default=TAM_CACHE, help="resultados en la caché LRU")
+    args = ap.parse_args(argv)
+    try:
+        asyncio.run(servir(args.host, args.puerto, args.cache))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
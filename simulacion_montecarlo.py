@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+# Simulación Monte Carlo sobre los multiplicadores f_* de Escenarios_v4, las
+# tasas de crecimiento G_*, el WACC y el CAPEX. Evalúa VAN / TIR / Payback / PI
+# con motor_flujo en lotes vectorizados (memoria acotada por el tamaño de lote)
+# y escribe tablas de percentiles e histograma en la hoja Simulacion_MC.
+#
+# Uso: python simulacion_montecarlo.py [n] [semilla]
+
+import sys
+import time
+import warnings
+
+import numpy as np
+from openpyxl.chart import BarChart, Reference
+from openpyxl.styles import Font, Border, Side
+
+import motor_flujo as mf
+
+bold = Font(bold=True)
+border_bottom = Border(bottom=Side(style="thin", color="999999"))
+currency_fmt = '"$"#,##0;[RED]"$"#,##0'
+pct_fmt = '0.00%'
+
+# rango de los multiplicadores = Conservador .. Optimista (moda = Base)
+_opt = mf.multiplicadores("Optimista")
+_con = mf.multiplicadores("Conservador")
+DISTRIBUCIONES = {
+    f: ("triangular", min(_opt[f], _con[f]), 1.0, max(_opt[f], _con[f]))
+    for f in mf.FACTORES
+}
+DISTRIBUCIONES.update({
+    "G_H2":          ("normal", 0.02, 0.01),
+    "G_O2":          ("normal", 0.02, 0.01),
+    "G_FV":          ("normal", -0.007, 0.003),
+    "G_EV":          ("normal", 0.02, 0.01),
+    "G_OPEX_BASE":   ("normal", 0.03, 0.01),
+    "G_OPEX_LOGH2":  ("normal", 0.03, 0.01),
+    "G_OPEX_TRATO2": ("normal", 0.03, 0.01),
+    "WACC":          ("uniforme", 0.07, 0.10),
+    "CAPEX":         ("lognormal", 84_300_000, 0.08),
+})
+
+KPIS = ["van", "tir", "payback", "pi"]
+PERCENTILES = [1, 5, 10, 25, 50, 75, 90, 95, 99]
+
+
+def centrar(distribuciones, cambios=None):
+    """Traslada las distribuciones (definidas alrededor de los valores base) a los insumos resueltos.
+
+    Si `cambios` fija un valor distinto del base (p. ej. CAPEX = 60 M), la
+    distribución se mueve con él: normal / uniforme / entero se desplazan en la
+    diferencia; triangular / lognormal se escalan por el cociente (conservan
+    la dispersión relativa). "fijo" no cambia.
+    """
+    base = mf.parametros_base()
+    p = mf.resolver_parametros(cambios)
+    salida = {}
+    for nombre, (tipo, *a) in distribuciones.items():
+        if nombre not in base or tipo == "fijo" or p[nombre] == base[nombre]:
+            salida[nombre] = (tipo, *a)
+            continue
+        valor, ref = float(p[nombre]), float(base[nombre])
+        if tipo in ("triangular", "lognormal") and ref != 0 and valor / ref > 0:
+            a = [x * valor / ref for x in a] if tipo == "triangular" else [a[0] * valor / ref, a[1]]
+        elif tipo == "normal":
+            a = [a[0] + valor - ref, a[1]]
+        elif tipo == "entero":
+            a = [x + int(round(valor - ref)) for x in a]
+        else:
+            a = [x + valor - ref for x in a]
+        salida[nombre] = (tipo, *a)
+    return salida
+
+
+def sin_efecto(distribuciones, cambios=None, perfiles=None):
+    """Quita los multiplicadores f_* que no mueven el modelo (avisa con warnings).
+
+    Un f_* sólo actúa a través de su nivel ING_*_1 / OPEX_*_1 (y del perfil de
+    su serie): si `cambios` fija ese nivel y no hay perfil, sus sorteos no
+    tienen efecto y sólo diluirían la muestra.
+    """
+    con_perfil = {mf.FACTOR_SERIE[clave] for clave in (perfiles or {})}
+    muertos = sorted(f for nivel, _, f in mf.VINCULOS
+                     if f in distribuciones and nivel in (cambios or {}) and f not in con_perfil)
+    if muertos:
+        warnings.warn(f"Sin efecto (su nivel está fijado en Parametros), se omiten: {', '.join(muertos)}",
+                      stacklevel=3)
+    return {k: v for k, v in distribuciones.items() if k not in muertos}
+
+
+def muestrear(distribuciones, n, rng):
+    """Extrae n valores por parámetro según su especificación.
+
+    Especificaciones: ("normal", media, desv), ("uniforme", min, max),
+    ("triangular", min, moda, max), ("lognormal", mediana, sigma_log),
+    ("fijo", valor).
+    """
+    m = {}
+    for nombre, (tipo, *a) in distribuciones.items():
+        if tipo == "normal":
+            m[nombre] = rng.normal(a[0], a[1], n)
+        elif tipo == "uniforme":
+            m[nombre] = rng.uniform(a[0], a[1], n)
+        elif tipo == "triangular":
+            m[nombre] = rng.triangular(a[0], a[1], a[2], n)
+        elif tipo == "lognormal":
+            m[nombre] = a[0] * np.exp(rng.normal(0.0, a[1], n))
+        elif tipo == "fijo":
+            m[nombre] = np.full(n, float(a[0]))
+        else:
+            raise ValueError(f"Distribución desconocida para {nombre}: {tipo}")
+    return m
+
+
+def evaluar(cambios, perfiles=None):
+    """VAN / TIR / Payback / PI de un lote de parámetros"""
+    p = mf.resolver_parametros(cambios)
+    res = mf.flujo_base(p, perfiles=perfiles)
+    return {
+        "van": res["van_acum"][:, -1],
+        "tir": mf.tir(res["flujo"]),
+        "payback": mf.payback(res["van_acum"]),
+        "pi": mf.indice_rentabilidad(res["flujo"], p["WACC"]),
+    }
+
+
+def simular(n=100_000, semilla=0, distribuciones=None, cambios=None, lote=32_768, perfiles=None):
+    """Evalúa n trayectorias en lotes de `lote`; devuelve {kpi: arreglo (n,)}.
+
+    Cada lote usa un generador derivado de la semilla (SeedSequence.spawn), por
+    lo que el resultado es reproducible para la misma semilla y tamaño de lote.
+    Las distribuciones por defecto se centran en `cambios` (ver `centrar`) y se
+    omiten los f_* sin efecto (ver `sin_efecto`); `perfiles` son los montos
+    anuales de perfiles_subanuales.
+    """
+    distribuciones = centrar(DISTRIBUCIONES, cambios) if distribuciones is None else distribuciones
+    distribuciones = sin_efecto(distribuciones, cambios, perfiles)
+    n_lotes = -(-n // lote)
+    hijos = np.random.SeedSequence(semilla).spawn(n_lotes)
+    salida = {k: np.empty(n) for k in KPIS}
+    for i, ss in enumerate(hijos):
+        ini = i * lote
+        m = min(lote, n - ini)
+        muestra = muestrear(distribuciones, m, np.random.default_rng(ss))
+        kpi = evaluar({**(cambios or {}), **muestra}, perfiles)
+        for k in KPIS:
+            salida[k][ini:ini + m] = kpi[k]
+    return salida
+
+
+def resumen(resultado):
+    """Percentiles, media, desviación y cobertura (fracción no-NaN) por KPI"""
+    tabla = {}
+    for k in KPIS:
+        x = resultado[k]
+        validos = x[np.isfinite(x)]
+        fila = dict(zip([f"P{q}" for q in PERCENTILES],
+                        np.percentile(validos, PERCENTILES) if validos.size else [np.nan] * len(PERCENTILES)))
+        fila["Media"] = validos.mean() if validos.size else np.nan
+        fila["Desv"] = validos.std() if validos.size else np.nan
+        fila["Válidos"] = validos.size / x.size
+        tabla[k] = fila
+    return tabla
+
+
+def hoja_montecarlo(wb, resultado, n_bins=40, titulo="Simulacion_MC"):
+    """Escribe percentiles por KPI, P(VAN<0) e histograma del VAN con gráfico"""
+    ws = wb.create_sheet(titulo)
+    n = resultado["van"].size
+    ws["A1"] = f"Simulación Monte Carlo – {n:,} trayectorias"; ws["A1"].font = bold
+
+    tabla = resumen(resultado)
+    columnas = list(next(iter(tabla.values())).keys())
+    ws.append([])
+    ws.append(["KPI"] + columnas)
+    for c in ws[3]:
+        c.font = bold
+        c.border = border_bottom
+    nombres = {"van": "VAN (MXN)", "tir": "TIR", "payback": "Payback (años)", "pi": "PI"}
+    formatos = {"van": currency_fmt, "tir": pct_fmt, "payback": '0.0', "pi": '0.00'}
+    for i, k in enumerate(KPIS):
+        r = 4 + i
+        ws.cell(r, 1, nombres[k])
+        for j, col in enumerate(columnas, start=2):
+            val = tabla[k][col]
+            ws.cell(r, j, None if np.isnan(val) else float(val))
+            ws.cell(r, j).number_format = pct_fmt if col == "Válidos" else formatos[k]
+    ws["A9"] = "P(VAN < 0)"; ws["A9"].font = bold
+    ws["B9"] = float(np.mean(resultado["van"] < 0)); ws["B9"].number_format = pct_fmt
+
+    # histograma del VAN
+    frec, bordes = np.histogram(resultado["van"][np.isfinite(resultado["van"])], bins=n_bins)
+    ws["A11"] = "Histograma VAN"; ws["A11"].font = bold
+    ws.append(["Desde (MXN)", "Hasta (MXN)", "Frecuencia"])
+    for c in ws[12]:
+        c.font = bold
+        c.border = border_bottom
+    for i in range(n_bins):
+        ws.append([float(bordes[i]), float(bordes[i + 1]), int(frec[i])])
+        ws.cell(13 + i, 1).number_format = currency_fmt
+        ws.cell(13 + i, 2).number_format = currency_fmt
+    ws.column_dimensions["A"].width = 18
+    for col in "BCDEFGHIJKLMN":
+        ws.column_dimensions[col].width = 16
+
+    ch = BarChart(); ch.title = "Distribución del VAN"; ch.y_axis.title = "Frecuencia"; ch.x_axis.title = "VAN (MXN)"
+    ch.gapWidth = 0
+    ch.add_data(Reference(ws, min_col=3, min_row=12, max_row=12 + n_bins), titles_from_data=True)
+    ch.set_categories(Reference(ws, min_col=1, min_row=13, max_row=12 + n_bins))
+    ch.width = 24
+    ws.add_chart(ch, "E11")
+    return ws
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    semilla = int(sys.argv[2]) if len(sys.argv) > 2 else 0
+    t0 = time.perf_counter()
+    res = simular(n, semilla)
+    dt = time.perf_counter() - t0
+    for k, fila in resumen(res).items():
+        print(k, {c: round(float(v), 4) for c, v in fila.items()})
+    print(f"{n:,} trayectorias en {dt:.2f} s")
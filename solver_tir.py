@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+# Solver por lotes de TIR y payback descontado.
+#
+# Resuelve sum_t c_t·x^t = 0 con x = 1/(1+r) para muchas series a la vez:
+# Newton vectorizado protegido por un intervalo [x_lo, x_hi] que se reduce en
+# cada paso (si Newton sale del intervalo se usa bisección). Si f no cambia de
+# signo en los extremos (número par de raíces) se busca en una rejilla de x el
+# sub-intervalo con cambio de signo más cercano a la semilla, como IRR de
+# Excel. Reporta en un arreglo de estados por qué una serie no tiene TIR o
+# puede tener varias:
+#
+#   OK          raíz única garantizada (un cambio de signo, regla de Descartes)
+#   POSITIVA    ≥2 cambios de signo pero el acumulado cambia una vez (Norstrom):
+#               sólo está garantizada la unicidad de la raíz con r > 0; puede
+#               haber otras en -1 < r <= 0
+#   SIN_RAIZ    la serie no cambia de signo
+#   MULTIPLE    varias raíces posibles (≥2 cambios de signo); se reporta la
+#               hallada
+#   FUERA       sin cambio de signo de f en [R_MIN, R_MAX] o sin convergencia
+#
+# `tir_prefijos` resuelve a la vez todos los prefijos (años 0..k) de todas las
+# series, reemplazando una fórmula IRR por fila sobre un rango creciente.
+
+import numpy as np
+
+OK, SIN_RAIZ, MULTIPLE, FUERA, POSITIVA = 0, 1, 2, 3, 4
+ESTADOS = {OK: "ok", SIN_RAIZ: "sin raíz", MULTIPLE: "raíces múltiples posibles",
+           FUERA: "sin convergencia", POSITIVA: "raíz positiva única (Norstrom)"}
+
+R_MIN, R_MAX = -0.99, 10.0
+_MAX_ELEMENTOS = 4_000_000  # tamaño de bloque para la expansión de prefijos
+# rejilla en x = 1/(1+r) para acotar raíces cuando f no cambia de signo en [R_MIN, R_MAX]
+_REJILLA = np.geomspace(1.0 / (1.0 + R_MAX), 1.0 / (1.0 + R_MIN), 401)
+
+
+def cambios_de_signo(flujo):
+    """Número de cambios de signo por fila, ignorando ceros"""
+    s = np.sign(flujo)
+    # arrastra el último signo no nulo para saltar ceros
+    idx = np.where(s != 0, np.arange(s.shape[1]), 0)
+    np.maximum.accumulate(idx, axis=1, out=idx)
+    s = np.take_along_axis(s, idx, axis=1)
+    return np.sum((s[:, 1:] * s[:, :-1]) < 0, axis=1)
+
+
+def _horner(c, x):
+    """f(x) y f'(x) de los polinomios en las filas de c (coeficiente t = columna t)"""
+    f = c[:, -1].copy()
+    df = np.zeros_like(x)
+    for k in range(c.shape[1] - 2, -1, -1):
+        df = df * x + f
+        f = f * x + c[:, k]
+    return f, df
+
+
+def _subintervalo(c, x0):
+    """Índice j de la rejilla con cambio de signo de f en [x_j, x_j+1] más cercano a x0"""
+    f = np.empty((c.shape[0], _REJILLA.size))
+    for j, xj in enumerate(_REJILLA):
+        f[:, j] = _horner(c, np.full(c.shape[0], xj))[0]
+    cambio = np.sign(f[:, :-1]) * np.sign(f[:, 1:]) <= 0
+    distancia = np.abs(np.log(np.sqrt(_REJILLA[:-1] * _REJILLA[1:]) / x0))
+    j = np.argmin(np.where(cambio, distancia, np.inf), axis=1)
+    return j, cambio.any(axis=1)
+
+
+def tir_lote(flujo, semilla=0.1, tol=1e-12, iteraciones=100):
+    """TIR y estado de cada fila de `flujo` (n, años)"""
+    c = np.atleast_2d(np.asarray(flujo, dtype=float))
+    n = c.shape[0]
+    tir = np.full(n, np.nan)
+    estado = np.full(n, OK, dtype=np.int8)
+
+    cambios = cambios_de_signo(c)
+    estado[cambios == 0] = SIN_RAIZ
+    # Norstrom: si el acumulado no descontado cambia de signo una vez, la raíz r > 0 es única
+    acumulado = np.cumsum(c, axis=1)
+    unica = (cambios == 1) | ((cambios_de_signo(acumulado) == 1) & (acumulado[:, -1] != 0))
+    estado[(cambios >= 2) & ~unica] = MULTIPLE
+    estado[(cambios >= 2) & unica] = POSITIVA
+
+    activo = np.flatnonzero(cambios > 0)
+    if activo.size == 0:
+        return tir, estado
+    ca = c[activo]
+    lo = np.full(activo.size, 1.0 / (1.0 + R_MAX))
+    hi = np.full(activo.size, 1.0 / (1.0 + R_MIN))
+    f_lo, _ = _horner(ca, lo)
+    f_hi, _ = _horner(ca, hi)
+    acotada = np.sign(f_lo) * np.sign(f_hi) <= 0
+    x0 = 1.0 / (1.0 + semilla)
+    # sin cambio de signo en los extremos (número par de raíces): sub-intervalo de la rejilla
+    sin_acotar = np.flatnonzero(~acotada)
+    if sin_acotar.size:
+        j, encontrada = _subintervalo(ca[sin_acotar], x0)
+        filas = sin_acotar[encontrada]
+        lo[filas], hi[filas] = _REJILLA[j[encontrada]], _REJILLA[j[encontrada] + 1]
+        f_lo[filas], _ = _horner(ca[filas], lo[filas])
+        acotada[filas] = True
+    x = np.clip(np.full(activo.size, x0), lo, hi)
+
+    pendiente = np.flatnonzero(acotada)
+    for _ in range(iteraciones):
+        if pendiente.size == 0:
+            break
+        cp, xp = ca[pendiente], x[pendiente]
+        f, df = _horner(cp, xp)
+        # reducir el intervalo con el signo de f
+        mismo = np.sign(f) == np.sign(f_lo[pendiente])
+        lo[pendiente] = np.where(mismo, xp, lo[pendiente])
+        f_lo[pendiente] = np.where(mismo, f, f_lo[pendiente])
+        hi[pendiente] = np.where(mismo, hi[pendiente], xp)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            newton = xp - f / df
+        dentro = np.isfinite(newton) & (newton >= lo[pendiente]) & (newton <= hi[pendiente])
+        nuevo = np.where(dentro, newton, 0.5 * (lo[pendiente] + hi[pendiente]))
+        nuevo = np.where(f == 0, xp, nuevo)     # raíz exacta: no mover
+        x[pendiente] = nuevo
+        sigue = (np.abs(nuevo - xp) > tol * np.maximum(np.abs(xp), 1e-3)) & (f != 0)
+        pendiente = pendiente[sigue]
+
+    resuelta = acotada.copy()
+    resuelta[pendiente] = False
+    tir[activo[resuelta]] = 1.0 / x[resuelta] - 1.0
+    sin_resolver = activo[~resuelta]
+    estado[sin_resolver] = np.where(estado[sin_resolver] == MULTIPLE, MULTIPLE, FUERA)
+    return tir, estado
+
+
+def tir_prefijos(flujo):
+    """TIR y estado de todos los prefijos: resultado (n, años), columna k = años 0..k"""
+    c = np.atleast_2d(np.asarray(flujo, dtype=float))
+    n, m = c.shape
+    tir = np.empty((n, m))
+    estado = np.empty((n, m), dtype=np.int8)
+    triangulo = np.tril(np.ones((m, m), dtype=bool))    # fila k: años 0..k
+    paso = max(1, _MAX_ELEMENTOS // (m * m))
+    for ini in range(0, n, paso):
+        bloque = c[ini:ini + paso]
+        prefijos = np.where(triangulo, bloque[:, None, :], 0.0).reshape(-1, m)
+        t, e = tir_lote(prefijos)
+        tir[ini:ini + paso] = t.reshape(-1, m)
+        estado[ini:ini + paso] = e.reshape(-1, m)
+    return tir, estado
+
+
+def payback_interpolado(van_acum):
+    """Año (fraccionario) en que el VAN acumulado cruza a >= 0; NaN si nunca.
+
+    Interpola linealmente entre el último año negativo y el primero no negativo.
+    """
+    v = np.atleast_2d(van_acum)
+    recuperado = v >= 0
+    k = np.argmax(recuperado, axis=1)
+    nunca = ~recuperado.any(axis=1)
+    previo = v[np.arange(v.shape[0]), np.maximum(k - 1, 0)]
+    actual = v[np.arange(v.shape[0]), k]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        frac = np.where(k > 0, -previo / (actual - previo), 0.0)
+    pb = np.where(k > 0, k - 1 + frac, 0.0)
+    pb[nunca] = np.nan
+    return pb
+
+
+def indicadores(flujo, van_acum):
+    """Una pasada: TIR de la serie completa, TIR por prefijo, estados y paybacks"""
+    tir_p, est_p = tir_prefijos(flujo)
+    return {
+        "tir": tir_p[:, -1],
+        "estado_tir": est_p[:, -1],
+        "tir_prefijos": tir_p,
+        "estado_prefijos": est_p,
+        "payback": payback_interpolado(van_acum),
+    }
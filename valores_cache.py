@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+# Incrusta valores calculados como resultados en caché (<v>) de las celdas con
+# fórmula de un .xlsx ya guardado por openpyxl. Así los lectores (pandas,
+# openpyxl data_only=True, etc.) obtienen números sin recalcular el libro;
+# Excel / LibreOffice siguen recalculando al abrir (fullCalcOnLoad).
+
+import math
+import os
+import re
+import tempfile
+import zipfile
+from xml.sax.saxutils import escape
+
+_RE_HOJA = re.compile(r'<sheet [^>]*?name="([^"]+)"[^>]*?r:id="([^"]+)"')
+_RE_REL = re.compile(r'<Relationship [^>]*?Id="([^"]+)"[^>]*?Target="([^"]+)"|'
+                     r'<Relationship [^>]*?Target="([^"]+)"[^>]*?Id="([^"]+)"')
+_RE_CELDA = re.compile(r'<c r="([A-Z]+[0-9]+)"([^>]*)><f>(.*?)</f>(?:<v\s*/>|<v></v>)?</c>')
+_ERRORES = {"#N/A", "#NUM!", "#DIV/0!", "#VALUE!", "#REF!", "#NAME?", "#NULL!"}
+
+
+def _rutas_hojas(zf):
+    """Nombre de hoja -> ruta del XML dentro del paquete"""
+    libro = zf.read("xl/workbook.xml").decode("utf-8")
+    rels = zf.read("xl/_rels/workbook.xml.rels").decode("utf-8")
+    destino = {}
+    for m in _RE_REL.finditer(rels):
+        rid, target = (m.group(1), m.group(2)) if m.group(1) else (m.group(4), m.group(3))
+        destino[rid] = target.lstrip("/")
+    rutas = {}
+    for nombre, rid in _RE_HOJA.findall(libro):
+        target = destino[rid]
+        rutas[nombre] = target if target.startswith("xl/") else "xl/" + target
+    return rutas
+
+
+def _celda_con_valor(coord, attrs, formula, valor):
+    attrs = re.sub(r'\s+t="[^"]*"', "", attrs)
+    if isinstance(valor, bool):
+        return f'<c r="{coord}"{attrs} t="b"><f>{formula}</f><v>{int(valor)}</v></c>'
+    if isinstance(valor, str):
+        tipo = "e" if valor in _ERRORES else "str"
+        return f'<c r="{coord}"{attrs} t="{tipo}"><f>{formula}</f><v>{escape(valor)}</v></c>'
+    return f'<c r="{coord}"{attrs}><f>{formula}</f><v>{float(valor)!r}</v></c>'
+
+
+def incrustar_valores(ruta, valores):
+    """Escribe los valores en caché de las celdas con fórmula.
+
+    `valores` es {hoja: {"B3": valor, ...}}; se aceptan números, bool, texto y
+    códigos de error ("#N/A", "#NUM!"). Los NaN se omiten (sin caché).
+    Devuelve el número de celdas actualizadas.
+    """
+    total = 0
+    with zipfile.ZipFile(ruta) as zf:
+        rutas = _rutas_hojas(zf)
+        objetivos = {rutas[h]: v for h, v in valores.items() if h in rutas and v}
+        fd, tmp = tempfile.mkstemp(suffix=".xlsx", dir=os.path.dirname(os.path.abspath(ruta)))
+        os.close(fd)
+        with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as zout:
+            for info in zf.infolist():
+                datos = zf.read(info.filename)
+                celdas = objetivos.get(info.filename)
+                if celdas:
+                    def sustituir(m):
+                        nonlocal total
+                        valor = celdas.get(m.group(1))
+                        if valor is None or (isinstance(valor, float) and math.isnan(valor)):
+                            return m.group(0)
+                        total += 1
+                        return _celda_con_valor(m.group(1), m.group(2), m.group(3), valor)
+                    datos = _RE_CELDA.sub(sustituir, datos.decode("utf-8")).encode("utf-8")
+                zout.writestr(info, datos)
+    os.replace(tmp, ruta)
+    return total